@@ -1,13 +1,260 @@
-import base64
+import hashlib
 import json
+import time
+from urllib.parse import urlparse
 
-import requests
 from auth import AuthClient
-from config import BASE_URL
+from config import BASE_URL, CONDITIONAL_GET, RETRY_ATTEMPTS, RETRY_MAX_DELAY, STREAM_JSON, FETCH_TIMEOUT
+from http_client import get_shared_client
+from json_stream import StreamedObject
+from metrics import REQUEST_DURATION, REQUESTS, RESPONSE_BYTES, CASE_PAGES
+from profiling import record
+from resilience import CircuitOpenError, get_rate_limiter, get_breaker, retry_after_seconds, backoff_delay
+
+UNCHANGED = object()  # returned instead of the data when the response is the same as the last one
+
+def fingerprint(body):
+    return hashlib.blake2b(body, digest_size=16).digest()
+
+def _validators(response):
+    etag = response.headers.get("ETag")
+    last_modified = response.headers.get("Last-Modified")
+    return (etag, last_modified) if etag or last_modified else None
+
+def _conditional_headers(validators):
+    etag, last_modified = validators
+    headers = {}
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
+    return headers
+
+def _newest_update(cases):
+    # lastUpdateDate is an ISO timestamp, so comparing the strings orders them by time
+    dates = [case["lastUpdateDate"] for case in cases if case.get("lastUpdateDate")]
+    return max(dates) if dates else None
+
+def _endpoint_name(url):
+    return urlparse(url).path.rsplit("/", 1)[-1]
+
+class Fetched(dict):
+    # decoded data of a response that changed. its fingerprint and validators, which skip it next time, are only
+    # kept once the monitor processed it (commit()), so a check that fails sees the same response again
+
+    def __init__(self, data, commit):
+        super().__init__(data)
+        self.commit = commit
+
+class StreamedList:
+    # result of a streamed fetch. looks like the decoded dict to the monitor, but [key] iterates the items
+    # while they are still downloading (once only). the other fields (partial, failed, ...) are known
+    # after it was iterated to the end. reading stops (and the list counts as failed) once it runs longer
+    # than FETCH_TIMEOUT after the fetch returned, like a fetch that didn't answer in time.
+    # commit() keeps the fingerprints of a list that was read to the end, like Fetched.commit
+
+    def __init__(self, key, items, fields, commit, timeout=FETCH_TIMEOUT):
+        self.key = key
+        self._items = items
+        self.fields = fields
+        self.commit = commit
+        self.deadline = time.monotonic() + timeout
+
+    def __contains__(self, name):
+        return name == self.key or name in self.fields
+
+    def __getitem__(self, name):
+        if name == self.key:
+            return self._read()
+        return self.fields[name]
+
+    def _read(self):
+        for item in self._items:
+            if time.monotonic() > self.deadline:
+                self._items.close()  # closes the response
+                print(f"⚠️ Timed out reading {self.key}")
+                self.fields["failed"] = True
+                return
+            yield item
+
+    def get(self, name, default=None):
+        return self.fields.get(name, default)
 
 class MitgiaisimAPI:
-    def __init__(self):
-        self.auth = AuthClient()
+    def __init__(self, http=None, auth=None):
+        self.http = http or get_shared_client()
+        self.auth = auth or AuthClient(http=self.http)
+        # fingerprints of the last processed response of every endpoint (this instance = one account)
+        self.fingerprints = {}
+        self.page_fingerprints = {}  # (case_type, page) -> (fingerprint, hasMoreData, newest lastUpdateDate)
+        self.page_counts = {}  # case_type -> pages in the last full walk
+        # ETag / Last-Modified of the last processed response, sent back so the server can answer 304
+        self.validators = {}
+
+    def export_cache(self):
+        # fingerprints and validators as json, saved with the tracked state so a restart
+        # (or the next one-shot run) still gets 304s and skips unchanged responses
+        return {
+            "fingerprints": [[endpoint, value.hex()] for endpoint, value in self.fingerprints.items()],
+            "page_fingerprints": [[case_type, page, value.hex(), has_more, newest]
+                                  for (case_type, page), (value, has_more, newest) in self.page_fingerprints.items()],
+            "page_counts": [[case_type, count] for case_type, count in self.page_counts.items()],
+            "validators": [[list(key) if isinstance(key, tuple) else key, value] for key, value in self.validators.items()],
+        }
+
+    def import_cache(self, cache):
+        self.fingerprints = {endpoint: bytes.fromhex(value) for endpoint, value in cache.get("fingerprints", [])}
+        self.page_fingerprints = {
+            (case_type, page): (bytes.fromhex(value), has_more, newest)
+            for case_type, page, value, has_more, newest in cache.get("page_fingerprints", [])
+        }
+        self.page_counts = dict(cache.get("page_counts", []))
+        self.validators = {
+            tuple(key) if isinstance(key, list) else key: tuple(value) if value else None
+            for key, value in cache.get("validators", [])
+        }
+
+    def forget(self, endpoint):
+        # the next response of the endpoint is processed even if it didn't change
+        self.fingerprints.pop(endpoint, None)
+        self.validators.pop(endpoint, None)
+
+    def _get_json(self, endpoint, url, headers, skip_unchanged=True):
+        validators = self.validators.get(endpoint)
+        if CONDITIONAL_GET and skip_unchanged and validators and endpoint in self.fingerprints:
+            headers = {**headers, **_conditional_headers(validators)}
+
+        response = self._request(url, headers)
+        if response.status_code == 304:
+            return UNCHANGED  # no body at all
+        if response.status_code != 200:
+            return None
+
+        body = response.content
+        body_fingerprint = fingerprint(body)
+        if skip_unchanged and self.fingerprints.get(endpoint) == body_fingerprint:
+            self.validators[endpoint] = _validators(response)
+            return UNCHANGED  # no need to decode or diff
+
+        start = time.perf_counter()
+        data = json.loads(body)
+        record("decode", time.perf_counter() - start)
+
+        validators = _validators(response)
+
+        def commit():
+            self.fingerprints[endpoint] = body_fingerprint
+            self.validators[endpoint] = validators
+
+        if not isinstance(data, dict):
+            commit()  # nothing the monitor checks
+            return data
+        return Fetched(data, commit)
+
+    def _stream_json(self, endpoint, url, headers, key):
+        # like _get_json, but the items of the `key` list are decoded while the body downloads. an unchanged
+        # 200 body can't be skipped before it was read, so only the conditional request saves the decoding
+        validators = self.validators.get(endpoint)
+        if CONDITIONAL_GET and validators and endpoint in self.fingerprints:
+            headers = {**headers, **_conditional_headers(validators)}
+
+        response = self._request(url, headers, stream=True)
+        if response.status_code != 200:
+            response.close()
+            return UNCHANGED if response.status_code == 304 else None
+
+        fields = {}
+        read = {}  # the fingerprint and validators, once the body was read to the end
+
+        def items():
+            body = self.http.iter_body(response)
+            document = StreamedObject(body, key)
+            try:
+                yield from document.items()
+            except Exception as e:
+                print(f"Error: {e}")
+                fields["failed"] = True
+                return
+            finally:
+                body.close()
+                response.close()
+                RESPONSE_BYTES.inc(self.auth.malshab_id, _endpoint_name(url), amount=document.size)
+            fields.update(document.fields)
+            read["fingerprint"] = document.fingerprint
+            read["validators"] = _validators(response)
+
+        def commit():
+            if read:
+                self.fingerprints[endpoint] = read["fingerprint"]
+                self.validators[endpoint] = read["validators"]
+
+        return StreamedList(key, items(), fields, commit)
+
+    def _request(self, url, headers, stream=False):
+        # every request goes through the shared rate limit and the circuit breaker of its upstream endpoint.
+        # 429 / 5xx / network errors are retried with jittered backoff (or after Retry-After).
+        # the bytes of a streamed response are counted by whoever reads it
+        endpoint = _endpoint_name(url)
+        account = self.auth.malshab_id
+        breaker = get_breaker(endpoint)
+        if not breaker.allow():
+            REQUESTS.inc(account, endpoint, "circuit_open")
+            raise CircuitOpenError(f"🚧 {endpoint} is paused after repeated failures")
+
+        start = time.perf_counter()
+        status = "error"
+        try:
+            response = self._request_with_retries(url, headers, endpoint, breaker, stream)
+            status = str(response.status_code)
+            if not stream:
+                RESPONSE_BYTES.inc(account, endpoint, amount=len(response.content))
+            return response
+        finally:
+            elapsed = time.perf_counter() - start
+            REQUEST_DURATION.observe(account, endpoint, value=elapsed)
+            REQUESTS.inc(account, endpoint, status)
+            record("network", elapsed)  # retries and rate limit waits included
+
+    def _request_with_retries(self, url, headers, endpoint, breaker, stream=False):
+        for attempt in range(RETRY_ATTEMPTS + 1):
+            get_rate_limiter().acquire()
+            retry_after = None
+            try:
+                response = self.http.get(url, headers=headers, stream=stream)
+            except Exception as e:
+                response, error = None, e
+            else:
+                if response.status_code != 429 and response.status_code < 500:
+                    breaker.record_success()
+                    return response
+                error = None
+                retry_after = retry_after_seconds(response)
+                if attempt < RETRY_ATTEMPTS:
+                    response.close()  # back to the pool, a streamed body was never read
+
+            if retry_after is not None and retry_after > RETRY_MAX_DELAY:
+                breaker.record_failure(retry_after)  # asked to wait longer than we'd sleep, pause the endpoint
+                break
+            if attempt < RETRY_ATTEMPTS:
+                time.sleep(retry_after if retry_after is not None else backoff_delay(attempt))
+        else:
+            breaker.record_failure()
+
+        if error is not None:
+            raise error
+        return response  # the last 429 / 5xx, callers treat it as a failed request
+
+    def _get_case_page(self, case_type, page, validators=None, stream=False):
+        url = f"{BASE_URL}/api/Inbox/GetCaseList?caseType={case_type}&page={page}"
+        headers = {"cookie": f"MobileAuth={self.auth.get_token()}"}
+        if validators:
+            headers.update(_conditional_headers(validators))
+
+        response = self._request(url, headers, stream=stream)
+        if response.status_code not in (200, 304):
+            response.close()
+            raise Exception(f"Failed to get cases: {response.status_code}")
+        return response
 
     def _get_headers(self):
         token = self.auth.get_token()
@@ -18,89 +265,225 @@ class MitgiaisimAPI:
     # 2 - פניות שטופלו
     # 3 - כל הפניות
 
-    def get_cases(self, case_type=3):
+    def get_cases(self, case_type=3, skip_unchanged=True, since=None, stream=STREAM_JSON):
+        # with `since` (a lastUpdateDate watermark) paging stops at the first page whose cases are all older,
+        # the result is then marked "partial" and doesn't say anything about cases that were removed
+        if stream:
+            return self._stream_cases(case_type, skip_unchanged, since)
+        requested = 0 # pages requested, for the metrics
         try:
-            all_cases = []
+            pages = [] # (body, decoded data or None if the page is unchanged), body is None for 304 pages
+            new_fingerprints = {} # only kept once every page was fetched and checked, so a failed walk is retried in full
+            new_validators = {}
+            changed = False
+            partial = False
             page = 1 # starting from page 1
 
             while True:
-                url = f"{BASE_URL}/api/Inbox/GetCaseList?caseType={case_type}&page={page}"
-                headers = {"cookie": f"MobileAuth={self.auth.get_token()}"}
-                response = requests.get(url, headers=headers)
-                if response.status_code != 200:
-                    raise Exception(f"Failed to get cases: {response.status_code}")
+                cached = self.page_fingerprints.get((case_type, page))
+                validators = self.validators.get(("cases", case_type, page))
+                conditional = CONDITIONAL_GET and skip_unchanged and cached and validators
+                response = self._get_case_page(case_type, page, validators if conditional else None)
+                requested += 1
+
+                if response.status_code == 304:
+                    pages.append((None, None))
+                    _, has_more, newest = cached
+                else:
+                    body = response.content
+                    body_fingerprint = fingerprint(body)
+                    if cached and cached[0] == body_fingerprint:
+                        data = None
+                        _, has_more, newest = cached
+                    else:
+                        decode_start = time.perf_counter()
+                        data = json.loads(body)
+                        record("decode", time.perf_counter() - decode_start)
+                        has_more = data.get("hasMoreData", False)
+                        newest = _newest_update(data.get("caseList", []))
+                        new_fingerprints[(case_type, page)] = (body_fingerprint, has_more, newest)
+                        changed = True
+                    new_validators[("cases", case_type, page)] = _validators(response)
+                    pages.append((body, data))
+
+                if not has_more:
+                    break
+
+                if since and newest is not None and newest < since:
+                    partial = True # everything from here on is older than the watermark
                     break
 
-                data = response.json()
+                page += 1 # next page
+
+            if not partial and self.page_counts.get(case_type) != page:
+                changed = True
+
+            def commit():
+                self.page_fingerprints.update(new_fingerprints)
+                self.validators.update(new_validators)
+                if not partial:
+                    self.page_counts[case_type] = page
+
+            if skip_unchanged and not changed:
+                commit()
+                return UNCHANGED
+
+            all_cases = []
+            for page_number, (body, data) in enumerate(pages, start=1):
+                if body is None:
+                    # the page didn't change but another one did, so its content is needed after all
+                    body = self._get_case_page(case_type, page_number).content
+                    requested += 1
+                if data is None:
+                    data = json.loads(body)
                 if "caseList" in data:
                     all_cases.extend(data["caseList"])
 
-                if not data.get("hasMoreData", False):
-                    break
+            return Fetched({"caseList": all_cases, "partial": partial}, commit)
+        except Exception as e:
+            print(f"Error: {e}")
+            return None
+        finally:
+            CASE_PAGES.observe(self.auth.malshab_id, value=requested)
 
-                page += 1 # next page
+    def _stream_cases(self, case_type, skip_unchanged, since):
+        # get_cases with STREAM_JSON: the pages are requested while the monitor iterates the cases, and the cases
+        # of every page are handed out as they are decoded. pages that answered 304 are only read again when
+        # another page changed, otherwise the result stays "partial" (nothing was missed, nothing to remove).
+        # page 1 is requested right away, so the walk starts on the fetch thread together with the other endpoints
+        fields = {"partial": True}
+        walked = []  # commit of the walk, once every page was read
+
+        def request(page):
+            cached = self.page_fingerprints.get((case_type, page))
+            validators = self.validators.get(("cases", case_type, page))
+            conditional = CONDITIONAL_GET and skip_unchanged and cached and validators
+            return cached, self._get_case_page(case_type, page, validators if conditional else None, stream=True)
 
-            return {"caseList": all_cases}
+        try:
+            first = request(1)
         except Exception as e:
             print(f"Error: {e}")
+            CASE_PAGES.observe(self.auth.malshab_id, value=1)
             return None
 
+        def cases():
+            requested = 1
+            new_fingerprints = {}
+            new_validators = {}
+            unchanged_pages = []
+            changed = False
+            partial = False
+            page = 1
+            cached, response = first
+            try:
+                while True:
+                    if page > 1:
+                        cached, response = request(page)
+                        requested += 1
+
+                    if response.status_code == 304:
+                        response.close()
+                        unchanged_pages.append(page)
+                        _, has_more, newest = cached
+                    else:
+                        body_fingerprint, has_more, newest = yield from self._read_case_page(response)
+                        if not cached or cached[0] != body_fingerprint:
+                            new_fingerprints[(case_type, page)] = (body_fingerprint, has_more, newest)
+                            changed = True
+                        new_validators[("cases", case_type, page)] = _validators(response)
+
+                    if not has_more:
+                        break
+
+                    if since and newest is not None and newest < since:
+                        partial = True
+                        break
+
+                    page += 1
+
+                if not partial and self.page_counts.get(case_type) != page:
+                    changed = True
+
+                if changed or not skip_unchanged:
+                    for page_number in unchanged_pages:
+                        requested += 1
+                        yield from self._read_case_page(self._get_case_page(case_type, page_number, stream=True))
+                    fields["partial"] = partial
+
+                # only kept once every page was read, so a failed walk is retried in full
+                def commit():
+                    self.page_fingerprints.update(new_fingerprints)
+                    self.validators.update(new_validators)
+                    if not partial:
+                        self.page_counts[case_type] = page
+
+                walked.append(commit)
+            except Exception as e:
+                print(f"Error: {e}")
+                fields["failed"] = True
+            finally:
+                CASE_PAGES.observe(self.auth.malshab_id, value=requested)
+
+        def commit():
+            for walk in walked:
+                walk()
+
+        return StreamedList("caseList", cases(), fields, commit)
+
+    def _read_case_page(self, response):
+        # yields the cases of a streamed page, returns (fingerprint, hasMoreData, newest lastUpdateDate)
+        body = self.http.iter_body(response)
+        document = StreamedObject(body, "caseList")
+        newest = None
+        try:
+            for case in document.items():
+                updated = case.get("lastUpdateDate")
+                if updated and (newest is None or updated > newest):
+                    newest = updated
+                yield case
+        finally:
+            body.close()
+            response.close()
+            RESPONSE_BYTES.inc(self.auth.malshab_id, "GetCaseList", amount=document.size)
+        return document.fingerprint, document.fields.get("hasMoreData", False), newest
+
+    def get_cases_head(self, case_type=3):
+        # only the first page, a cheap probe for "did any case change" (kept apart from the get_cases fingerprints)
+        url = f"{BASE_URL}/api/Inbox/GetCaseList?caseType={case_type}&page=1"
+        return self._get_json(f"cases_head_{case_type}", url, {"cookie": f"MobileAuth={self.auth.get_token()}"})
+
     def get_user_main_data(self):
         malshab_id = self._extract_malshab_id()
         url = f"{BASE_URL}/api/malshab/getUserMainData?malshabId={malshab_id}"
-        response = requests.get(url, headers=self._get_headers())
-        if response.status_code == 200:
-            return response.json()
-        return None
+        return self._get_json("user_main_data", url, self._get_headers())
 
     def get_user_quality_data(self):
         malshabId = self._extract_malshab_id()
         url = f"{BASE_URL}/api/malshabQualityData/getUserQualityData?malshabId={malshabId}"
-        response = requests.get(url, headers=self._get_headers())
-        if response.status_code == 200:
-            return response.json()
-        return None
+        return self._get_json("user_quality_data", url, self._get_headers())
 
     def get_has_crm_update(self):
         malshabId = self._extract_malshab_id()
         url = f"{BASE_URL}/api/Inbox/HasCRMUpdate?malshabId={malshabId}"
-        response = requests.get(url, headers=self._get_headers())
-        if response.status_code == 200:
-            return response.json()
-        return None
+        return self._get_json("has_crm_update", url, self._get_headers())
 
     def get_questionaire_data(self):
         malshabId = self._extract_malshab_id()
         url = f"{BASE_URL}/api/malshab/getQuestionnaireList?malshabId={malshabId}"
-        response = requests.get(url, headers=self._get_headers())
-        if response.status_code == 200:
-            return response.json()
-        return None
+        return self._get_json("questionaire_data", url, self._get_headers())
 
-    def get_all_summons(self):
+    def get_all_summons(self, stream=STREAM_JSON):
         malshabId = self._extract_malshab_id()
         url = f"{BASE_URL}/api/summon/getAllSummons?malshabId={malshabId}"
-        response = requests.get(url, headers=self._get_headers())
-        if response.status_code == 200:
-            return response.json()
-        return None
+        if stream:
+            return self._stream_json("all_summons", url, self._get_headers(), "allSummons")
+        return self._get_json("all_summons", url, self._get_headers())
 
     def _extract_malshab_id(self):
-        try:
-            token = self.auth.get_token()
-            if not token:
-                raise ValueError("No token available")
-
-            parts = token.split(".")
-            if len(parts) != 3:
-                raise ValueError("Invalid JWT token format")
-
-            payload = parts[1]
-            padding = "=" * (4 - len(payload) % 4)  # padding
-            decoded_bytes = base64.urlsafe_b64decode(payload + padding)
-            decoded_json = json.loads(decoded_bytes.decode("utf-8"))
-
-            return decoded_json.get("http://schemas.xmlsoap.org/ws/2005/05/identity/claims/name", "") # malshab id from token
-        except Exception as e:
-            print(f"⚠️ Failed to extract Malshab ID: {e}")
-            return None
\ No newline at end of file
+        # the claims are decoded once per token by AuthClient
+        malshab_id = self.auth.get_claims().get("http://schemas.xmlsoap.org/ws/2005/05/identity/claims/name", "") # malshab id from token
+        if not malshab_id:
+            print("⚠️ Failed to extract Malshab ID")
+            return None
+        return malshab_id
@@ -1,26 +1,50 @@
 import base64
 import json
-import requests
 import time
-import os
-from dotenv import load_dotenv
+import threading
+from dotenv import load_dotenv, find_dotenv, set_key
 load_dotenv()
 import uuid
 import secrets
-from config import BASE_URL
+from config import BASE_URL, TOKEN_EXPIRY_BUFFER, TOKEN_REFRESH_AHEAD
+from credential_store import get_credential_store, env_credentials, NEEDS_REGISTRATION
+from http_client import get_shared_client
+from metrics import TOKEN_REFRESHES
+
+REFRESH_RETRY = 30  # seconds before a failed background refresh is tried again
 
 
 class AuthClient:
-    def __init__(self):
+    def __init__(self, http=None, credentials=None):
+        self.http = http or get_shared_client()
         self.token = None
         self.expiration = 0
-        self.biometric_data = os.getenv("BIOMETRIC_DATA")
-        self.malshab_id = os.getenv("MALSHAB_ID")
-        self.uuid = os.getenv("UUID")
-
-        if not self.biometric_data or not self.uuid:
+        self.refresh_at = 0  # when the token is renewed in the background, before it expires
+        self.claims = {}  # decoded once per token
+        self._lock = threading.Lock()  # endpoints are fetched concurrently, only one of them should log in
+        self._refreshing = False
+        self._refreshing_lock = threading.Lock()  # not self._lock, which is held for a whole login
+        self._refresh_exit = None  # exit() of a background refresh, raised again on the next get_token
+
+        # credentials are passed in by the multi account engine, otherwise they come from the store / .env
+        self.store = get_credential_store()
+        self.from_env = credentials is None
+        if self.from_env:
+            credentials = env_credentials()
+
+        self.biometric_data = credentials.get("biometric_data")
+        self.malshab_id = credentials.get("malshab_id")
+        self.uuid = credentials.get("uuid")
+
+        if not self.biometric_data or not self.uuid or self._needs_registration():
+            if not self.from_env:
+                if self.biometric_data and self.uuid:
+                    raise ValueError(f"❌ {self.malshab_id} was rejected by the last login and has to be registered again")
+                raise ValueError(f"❌ Missing biometric data or UUID for {self.malshab_id}")
             self.register_biometric()
 
+        self._load_token()  # a warm restart reuses the last token instead of logging in again
+
     def register_biometric(self):
         print("🔐 Initial Setup: Registering Biometric Data and UUID")
         print("⚠️ Mitgaisim App would not work while this script is running!")
@@ -40,7 +64,7 @@ class AuthClient:
             "uuid": generated_uuid
         }
 
-        login_response = requests.post(login_url, json=login_payload)
+        login_response = self.http.post(login_url, json=login_payload)
 
         if login_response.status_code != 200:
             print(f"❌ Login failed: {login_response.status_code}")
@@ -60,7 +84,7 @@ class AuthClient:
         headers = {"cookie": f"OtpAuthCookie={otp_auth_cookie}"}
         otp_payload = {"sendOtpMethod": 0}
 
-        otp_response = requests.post(otp_url, headers=headers, json=otp_payload)
+        otp_response = self.http.post(otp_url, headers=headers, json=otp_payload)
         otp_data = otp_response.json()
 
         if otp_data.get("statusCode") != 1:
@@ -75,7 +99,7 @@ class AuthClient:
         verify_otp_url = f"{BASE_URL}/api/otp/verifyOtp"
         verify_otp_payload = {"otp": otp_code}
 
-        verify_otp_response = requests.post(verify_otp_url, headers=headers, json=verify_otp_payload)
+        verify_otp_response = self.http.post(verify_otp_url, headers=headers, json=verify_otp_payload)
         verify_otp_data = verify_otp_response.json()
 
         if verify_otp_data.get("statusCode") != 1:
@@ -87,9 +111,14 @@ class AuthClient:
         self.biometric_data = login_payload["biometricData"]
         self.uuid = login_payload["uuid"]
 
-        self._save_to_env("BIOMETRIC_DATA", self.biometric_data)
-        self._save_to_env("UUID", self.uuid)
-        self._save_to_env("MALSHAB_ID", malshab_id)
+        if self.store:
+            self.store.register(malshab_id, self.biometric_data, self.uuid)
+            # the store keeps every registration, .env names the one this script checks
+            set_key(find_dotenv() or ".env", "MALSHAB_ID", malshab_id)
+            print("ℹ️ MALSHAB_ID saved to .env")
+        else:
+            print(f"ℹ️ CREDENTIALS_DB is disabled, add these to .env:\n"
+                  f"MALSHAB_ID={malshab_id}\nBIOMETRIC_DATA={self.biometric_data}\nUUID={self.uuid}")
 
         print("✅ Biometric data and UUID registered successfully!")
         print("ℹ️ Please restart the script to continue.")
@@ -103,31 +132,89 @@ class AuthClient:
             "uuid": self.uuid
         }
 
-        response = requests.post(url, json=payload)
+        response = self.http.post(url, json=payload)
         if response.status_code == 200:
             data = response.json()
             if data.get("statusCode") == 1:
-                self.token = data.get("accessToken")
-                self.expiration = self._extract_expiration(self.token)
+                self._set_token(data.get("accessToken"))
+                self._save_token()
+                TOKEN_REFRESHES.inc(self.malshab_id, "success")
                 print("✅ Authentication successful!")
                 return self.token
             else:
+                TOKEN_REFRESHES.inc(self.malshab_id, "failure")
                 raise Exception("❌ Authentication failed!")
+
+        TOKEN_REFRESHES.inc(self.malshab_id, "failure")
+        if self.store and 400 <= response.status_code < 500 and response.status_code != 429:
+            # the credentials were rejected (not a server error), they won't work again until re-registered
+            self.store.set_status(self.malshab_id, NEEDS_REGISTRATION)
+        if not self.from_env:
+            raise Exception(f"❌ Failed to authenticate {self.malshab_id}: {response.status_code}")
         else:
             print("❌ Failed to authenticate!\nℹ️ It is possible that you may have logged through the app.\n🔁 You can re-run the script to verify the credentials.")
-            # reset .env
-            self._save_to_env("BIOMETRIC_DATA", "")
-            self._save_to_env("UUID", "")
-            self._save_to_env("MALSHAB_ID", "")
             exit()
 
     def get_token(self):
-        if not self.token or time.time() > float(self.expiration):
+        if self._refresh_exit is not None:
+            raise self._refresh_exit
+        token, expiration = self.token, self.expiration
+        now = time.time()
+        if token and now < expiration:
+            if now > self.refresh_at:
+                self._refresh_in_background()  # still valid, but get a new one before it runs out
+            return token
+
+        with self._lock:
+            # another thread may have logged in while we waited for the lock
+            if self.token and time.time() < self.expiration:
+                return self.token
             print("🔄 Refreshing token...")
             return self.authenticate()
-        return self.token
 
-    def _extract_expiration(self, token):
+    def get_claims(self):
+        self.get_token()
+        return self.claims
+
+    def _refresh_in_background(self):
+        with self._refreshing_lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+        threading.Thread(target=self._background_refresh, name="token-refresh", daemon=True).start()
+
+    def _background_refresh(self):
+        try:
+            with self._lock:
+                if time.time() < self.refresh_at:
+                    return  # already refreshed
+                print("🔄 Refreshing token in the background...")
+                self.authenticate()
+        except SystemExit as e:
+            # the .env credentials were rejected. exit() here would only end this thread,
+            # the thread that asks for the next token exits instead
+            print("⚠️ Background token refresh failed, stopping")
+            self._refresh_exit = e
+        except Exception as e:
+            print(f"⚠️ Background token refresh failed: {e}")
+            self.refresh_at = time.time() + REFRESH_RETRY  # not again on every request
+        finally:
+            self._refreshing = False
+
+    def _set_token(self, token):
+        claims = self._decode_claims(token)
+        self.claims = claims
+        self.token = token
+        now = time.time()
+        expires = claims.get("exp", now)
+        # short lived tokens get a buffer and a refresh ahead of a share of their lifetime, a token that is
+        # due for renewal as soon as it arrives would start a login on every request
+        issued = claims.get("iat", now)
+        lifetime = max(expires - issued, 0)
+        self.expiration = expires - min(TOKEN_EXPIRY_BUFFER, lifetime / 4)
+        self.refresh_at = self.expiration - min(TOKEN_REFRESH_AHEAD, (self.expiration - issued) / 2)
+
+    def _decode_claims(self, token):
         try:
             parts = token.split(".")
             if len(parts) != 3:
@@ -136,25 +223,28 @@ class AuthClient:
             payload = parts[1]
             padding = "=" * (4 - len(payload) % 4)  # Fix padding issue
             decoded_bytes = base64.urlsafe_b64decode(payload + padding)
-            decoded_json = json.loads(decoded_bytes.decode("utf-8"))
-
-            return decoded_json.get("exp", time.time()) - 60
+            return json.loads(decoded_bytes.decode("utf-8"))
         except Exception as e:
             print(f"⚠️ Failed to decode token: {e}")
-            return time.time()
-
-    def _save_to_env(self, key, value):
-        env_file = ".env"
-        env_vars = {}
-        if os.path.exists(env_file):
-            with open(env_file, "r") as file:
-                for line in file:
-                    key_value = line.strip().split("=", 1)
-                    if len(key_value) == 2:
-                        env_vars[key_value[0]] = key_value[1]
-
-        env_vars[key] = value
-
-        with open(env_file, "w") as file:
-            for k, v in env_vars.items():
-                file.write(f"{k}={v}\n")
+            return {}
+
+    def _needs_registration(self):
+        # rejected credentials stay rejected, unless they were replaced (a new registration in the accounts file)
+        record = self.store.get(self.malshab_id) if self.store and self.malshab_id else None
+        if record is None or record["biometric_data"] != self.biometric_data or record["uuid"] != self.uuid:
+            if self.store and self.malshab_id and self.biometric_data and self.uuid:
+                self.store.register(self.malshab_id, self.biometric_data, self.uuid)
+            return False
+        return record["status"] == NEEDS_REGISTRATION
+
+    def _load_token(self):
+        record = self.store.get(self.malshab_id) if self.store and self.malshab_id else None
+        token = record and record["token"]
+        if token:
+            self._set_token(token)
+            if time.time() >= self.expiration:
+                self.token, self.expiration, self.claims = None, 0, {}
+
+    def _save_token(self):
+        if self.store:
+            self.store.save_token(self.malshab_id, self.token, self.claims.get("exp"))
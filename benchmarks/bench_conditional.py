@@ -0,0 +1,64 @@
+# measures the bandwidth saved by conditional GETs, against the local mock api
+# usage: python benchmarks/bench_conditional.py [--cycles 10] [--cases 200]
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mock_server import MockState, serve
+
+
+def run(state, validators, cycles):
+    from api_client import MitgiaisimAPI, StreamedList
+    from auth import AuthClient
+
+    state.validators = validators
+    credentials = {"malshab_id": "1000001", "biometric_data": "mock", "uuid": "mock"}
+    api = MitgiaisimAPI(auth=AuthClient(credentials=credentials))
+    getters = [api.get_cases, api.get_all_summons, api.get_user_quality_data,
+               api.get_user_main_data, api.get_questionaire_data, api.get_has_crm_update]
+
+    def fetch(getter):
+        data = getter()
+        if isinstance(data, StreamedList):
+            for _ in data[data.key]:  # STREAM_JSON: the list downloads while it is read
+                pass
+        if hasattr(data, "commit"):
+            data.commit()  # what the monitor does once it processed the data
+
+    for getter in getters:  # first cycle always downloads everything
+        fetch(getter)
+    before = dict(state.stats)
+    for _ in range(cycles):
+        for getter in getters:
+            fetch(getter)
+
+    return {key: state.stats[key] - before.get(key, 0) for key in state.stats}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--cycles", type=int, default=10)
+    parser.add_argument("--cases", type=int, default=200)
+    args = parser.parse_args()
+
+    state = MockState(cases=args.cases)
+    server = serve(state)
+    os.environ["MITGAISIM_BASE_URL"] = f"http://127.0.0.1:{server.server_port}"  # before the client modules are imported
+
+    plain = run(state, False, args.cycles)
+    conditional = run(state, True, args.cycles)
+    server.shutdown()
+
+    print(f"{args.cycles} unchanged cycles, {args.cases} cases per profile")
+    print(f"{'':<14}{'requests':>10}{'304s':>8}{'bytes':>12}")
+    for name, stats in (("plain", plain), ("conditional", conditional)):
+        print(f"{name:<14}{stats.get('requests', 0):>10}{stats.get('status_304', 0):>8}{stats.get('bytes_sent', 0):>12}")
+    if plain.get("bytes_sent"):
+        saved = 1 - conditional.get("bytes_sent", 0) / plain["bytes_sent"]
+        print(f"saved {saved:.0%} of the response bytes")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+# compares the schema driven diff engine with the hand written routines it replaced
+# usage: python benchmarks/bench_diff.py [--cases 5000] [--changed 0.01] [--repeat 20]
+import argparse
+import copy
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from diff_engine import CASES, SUMMONS, SCORES, QUESTIONNAIRES, USER_DATA
+
+CASE_FIELDS = ["creationDate", "channel", "subject", "mainSubject", "statusDescription", "lastUpdateDate", "answer", "status", "slaDate"]
+SUMMON_FIELDS = ["startDate", "endDate", "summonSubject", "locationAddress", "locationName", "approved", "read"]
+
+
+def make_profile(cases, summons, scores, questionnaires, user_keys):
+    rng = random.Random(42)
+    return {
+        "caseList": [{
+            "caseNumber": 100000 + i,
+            "creationDate": f"2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}T10:00:00",
+            "channel": rng.choice(["אפליקציה", "טלפון", "אתר"]),
+            "subject": f"פנייה מספר {i} " * 5,
+            "mainSubject": rng.choice(["מיונים", "זימונים", "פרופיל רפואי"]),
+            "statusDescription": rng.choice(["בטיפול", "טופל"]),
+            "lastUpdateDate": f"2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}T12:00:00",
+            "answer": "תשובה ארוכה " * 40,
+            "status": rng.choice([0, 1]),
+            "slaDate": "2025-01-01T00:00:00",
+        } for i in range(cases)],
+        "allSummons": [{
+            "summonId": i,
+            "startDate": "2025-03-01T08:00:00",
+            "endDate": "2025-03-01T16:00:00",
+            "summonSubject": f"זימון {i}",
+            "locationAddress": "תל השומר",
+            "locationName": "לשכת גיוס",
+            "approved": bool(i % 2),
+            "read": True,
+        } for i in range(summons)],
+        "scoreList": [{
+            "name": f"score{i}",
+            "title": f"Score {i}",
+            "score": rng.randint(10, 90),
+            "internalScoreList": [{"indicatorName": f"ind{j}", "indicatorValue": rng.randint(1, 9)} for j in range(10)],
+        } for i in range(scores)],
+        "questionnaire": [{"name": f"q{i}", "endDate": "2025-01-01", "isFinished": False, "isStarted": True} for i in range(questionnaires)],
+        "userData": {f"key{i}": f"value{i}" for i in range(user_keys)},
+    }
+
+
+def mutate(profile, fraction):
+    profile = copy.deepcopy(profile)
+    rng = random.Random(7)
+    for case in rng.sample(profile["caseList"], int(len(profile["caseList"]) * fraction)):
+        case["statusDescription"] = "טופל"
+        case["lastUpdateDate"] = "2025-02-01T00:00:00"
+    for summon in rng.sample(profile["allSummons"], int(len(profile["allSummons"]) * fraction)):
+        summon["read"] = not summon["read"]
+    for score in rng.sample(profile["scoreList"], max(1, int(len(profile["scoreList"]) * fraction))):
+        score["internalScoreList"][0]["indicatorValue"] += 1
+    return profile
+
+
+# the routines from before the diff engine, minus the notifier calls.
+# both sides get the old state already indexed, the same way the monitor keeps it
+
+def legacy_diff(old, new):
+    updates = []
+
+    for case in new["caseList"]:
+        old_case = old["cases"].get(case["caseNumber"])
+        if old_case is None:
+            continue
+        case_updates = []
+        for field in CASE_FIELDS:
+            if old_case.get(field) != case.get(field):
+                case_updates.append(f"🔄 {field} changed: {old_case.get(field, 'N/A')} → {case.get(field, 'N/A')}")
+        if case.get("status") == 1:
+            if old_case.get("answer", "No answer") != case.get("answer", "No answer"):
+                case_updates.append(f"📝 Answer updated: {case.get('answer')}")
+        if case_updates:
+            updates.append("\n".join(case_updates))
+
+    old_summons = old["summons"]
+    new_summons = {s["summonId"]: s for s in new["allSummons"]}
+    for summon_id, new_details in new_summons.items():
+        if summon_id in old_summons:
+            old_details = old_summons[summon_id]
+            summon_updates = []
+            for field in SUMMON_FIELDS:
+                if old_details.get(field) != new_details.get(field):
+                    summon_updates.append(f"{field} changed: {old_details.get(field)} → {new_details.get(field)}")
+            if summon_updates:
+                updates.append("\n".join(summon_updates))
+
+    for new_score in new["scoreList"]:
+        old_score = old["scores"][new_score["name"]]
+        if old_score["score"] != new_score["score"]:
+            updates.append(f"{old_score['title']} score changed: {old_score['score']} → {new_score['score']}")
+        old_internal = {item["indicatorName"]: item["indicatorValue"] for item in old_score.get("internalScoreList", [])}
+        new_internal = {item["indicatorName"]: item["indicatorValue"] for item in new_score.get("internalScoreList", [])}
+        for name, value in new_internal.items():
+            if name not in old_internal:
+                updates.append(f"New internal score added: {name} ({value})")
+            elif old_internal[name] != value:
+                updates.append(f"Internal score changed: {name}: {old_internal[name]} → {value}")
+
+    old_questionnaires = old["questionnaires"]
+    new_questionnaires = {q["name"]: q for q in new["questionnaire"]}
+    for name, new_details in new_questionnaires.items():
+        if name in old_questionnaires:
+            for field in ["endDate", "isFinished", "isStarted"]:
+                if old_questionnaires[name].get(field) != new_details.get(field):
+                    updates.append(f"🔄 {name} {field} changed")
+
+    for key in new["userData"]:
+        if key in old["userData"] and old["userData"][key] != new["userData"][key]:
+            updates.append(f"{key} changed: {old['userData'][key]} → {new['userData'][key]}")
+
+    return updates
+
+
+def engine_diff(old, new):
+    changes = []
+    changes += CASES.diff_collection(old["cases"], CASES.index(new["caseList"]))
+    changes += SUMMONS.diff_collection(old["summons"], SUMMONS.index(new["allSummons"]))
+    changes += SCORES.diff_collection(old["scores"], SCORES.index(new["scoreList"]))
+    changes += QUESTIONNAIRES.diff_collection(old["questionnaires"], QUESTIONNAIRES.index(new["questionnaire"]))
+    changes += USER_DATA.diff_record(old["userData"], new["userData"])
+    return changes
+
+
+def tracked(profile):
+    return {
+        "cases": CASES.index(profile["caseList"]),
+        "summons": SUMMONS.index(profile["allSummons"]),
+        "scores": SCORES.index(profile["scoreList"]),
+        "questionnaires": QUESTIONNAIRES.index(profile["questionnaire"]),
+        "userData": profile["userData"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--cases", type=int, default=5000)
+    parser.add_argument("--summons", type=int, default=200)
+    parser.add_argument("--scores", type=int, default=20)
+    parser.add_argument("--questionnaires", type=int, default=30)
+    parser.add_argument("--user-keys", type=int, default=60)
+    parser.add_argument("--changed", type=float, default=0.01, help="fraction of items changed in the 'changed' scenario")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    profile = make_profile(args.cases, args.summons, args.scores, args.questionnaires, args.user_keys)
+    old_tracked = tracked(profile)
+
+    print(f"profile: {args.cases} cases, {args.summons} summons, {args.scores} scores, {args.questionnaires} questionnaires")
+    print(f"{'scenario':<12}{'legacy ms':>12}{'engine ms':>12}{'speedup':>10}")
+    for scenario, new in (("unchanged", copy.deepcopy(profile)), ("changed", mutate(profile, args.changed))):
+        legacy = min(timeit.repeat(lambda: legacy_diff(old_tracked, new), number=1, repeat=args.repeat)) * 1000
+        engine = min(timeit.repeat(lambda: engine_diff(old_tracked, new), number=1, repeat=args.repeat)) * 1000
+        print(f"{scenario:<12}{legacy:>12.2f}{engine:>12.2f}{legacy / engine:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
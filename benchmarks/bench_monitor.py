@@ -0,0 +1,187 @@
+# end to end benchmark: runs the real monitors against the local mock api and reports, per scenario,
+# cycle latency, requests / bytes per cycle, cpu time and memory of the notifier process
+# usage: python benchmarks/bench_monitor.py [--scenario all] [--cycles 10] [--accounts 1000]
+#
+# every scenario runs in its own process (clean memory numbers, fresh module state),
+# and the mock runs in another one, so its cpu isn't counted
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from concurrent.futures import wait
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+# name -> accounts, mock options, burst_every (a burst of changes every n cycles, 0 = never), env (config overrides)
+SCENARIOS = {
+    "single": dict(accounts=1, cases=60, change_rate=0.2),
+    "accounts": dict(accounts=None, cases=60, change_rate=0.05),  # --accounts, 1 to 10k
+    "history": dict(accounts=10, cases=2000, answer_size=2000, change_rate=0.2),
+    "history_stream": dict(accounts=10, cases=2000, answer_size=2000, change_rate=0.2, env={"STREAM_JSON": "1"}),
+    "bursty": dict(accounts=50, cases=200, change_rate=0.02, burst_every=3),
+    "latency": dict(accounts=20, cases=60, latency=100, change_rate=0.1),
+}
+
+
+def start_mock(options):
+    command = [sys.executable, os.path.join(BENCH_DIR, "mock_server.py"), "--port", "0",
+               "--cases", str(options.get("cases", 60)),
+               "--latency", str(options.get("latency", 0)),
+               "--answer-size", str(options.get("answer_size", 280)),
+               "--change-rate", str(options.get("change_rate", 0))]
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, text=True)
+    base_url = process.stdout.readline().split(" on ")[-1].strip()  # first line is the address
+    return process, base_url
+
+
+def mock_call(base_url, path, method="GET"):
+    request = urllib.request.Request(base_url + path, data=b"" if method == "POST" else None, method=method)
+    with urllib.request.urlopen(request) as response:
+        return json.load(response)
+
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2 ** 20 if sys.platform == "darwin" else peak / 2 ** 10
+
+
+def rss_mb():
+    # current rss (linux), peak rss elsewhere
+    try:
+        with open("/proc/self/statm") as file:
+            return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except OSError:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 2 ** 20 if sys.platform == "darwin" else peak / 2 ** 10
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def run_scenario(name, accounts, cycles):
+    options = SCENARIOS[name]
+    accounts = options["accounts"] or accounts
+    mock, base_url = start_mock(options)
+
+    # the client modules read their config on import
+    os.environ.update({
+        "MITGAISIM_BASE_URL": base_url,
+        "NTFY_URL": f"{base_url}/ntfy/bench",
+        "STATE_DB": "",
+        "JOURNAL_DIR": tempfile.mkdtemp(prefix="bench-journal-"),
+        "CREDENTIALS_DB": "",
+        "NOTIFY_SPOOL": "",
+        "RATE_LIMIT": "0",
+        **options.get("env", {}),
+    })
+    import logging
+    logging.basicConfig(level=logging.WARNING)  # the monitors log every cycle
+    sys.stdout = open(os.devnull, "w")  # and the notifier prints every delivery
+
+    from engine import MonitoringEngine
+    from notifier import get_shared_dispatcher
+
+    try:
+        engine = MonitoringEngine([
+            {"malshab_id": str(1000000 + index), "biometric_data": "mock", "uuid": "mock"} for index in range(accounts)
+        ])
+        monitors = engine.monitors
+
+        def cycle(initial=False):
+            def check(monitor):
+                if initial:
+                    monitor.fetch_initial_data()
+                monitor.check_for_updates()  # every endpoint, so cycles are comparable
+            wait([engine.cycle_executor.submit(check, monitor) for monitor in monitors])
+
+        def deliver():
+            for monitor in monitors:
+                monitor.notifier.send_pending()  # one digest window per cycle
+            get_shared_dispatcher().flush(60)
+
+        start = time.perf_counter()
+        cycle(initial=True)
+        startup = time.perf_counter() - start
+        deliver()
+
+        latencies = []
+        before = mock_call(base_url, "/mock/stats")
+        cpu = time.process_time()
+        for index in range(1, cycles + 1):
+            burst = options.get("burst_every") and index % options["burst_every"] == 0
+            mock_call(base_url, "/mock/tick?burst=1" if burst else "/mock/tick", "POST")
+            start = time.perf_counter()
+            cycle()
+            latencies.append(time.perf_counter() - start)
+            deliver()
+        cpu = time.process_time() - cpu
+        after = mock_call(base_url, "/mock/stats")
+    finally:
+        mock.terminate()
+        sys.stdout = sys.__stdout__
+
+    delta = {key: after.get(key, 0) - before.get(key, 0) for key in after}
+    return {
+        "scenario": name,
+        "accounts": len(monitors),
+        "cycles": cycles,
+        "startup_s": round(startup, 3),
+        "p50_s": round(percentile(latencies, 0.5), 3),
+        "p95_s": round(percentile(latencies, 0.95), 3),
+        "max_s": round(max(latencies), 3),
+        "requests_per_cycle": round(delta.get("requests", 0) / cycles, 1),
+        "not_modified_pct": round(100 * delta.get("status_304", 0) / max(1, delta.get("requests", 0))),
+        "kb_per_cycle": round(delta.get("bytes_sent", 0) / cycles / 1024, 1),
+        "changes": delta.get("changes", 0),
+        "notifications": delta.get("notifications", 0),
+        "cpu_s_per_cycle": round(cpu / cycles, 3),
+        "rss_mb": round(rss_mb(), 1),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scenario", default="all", choices=["all", *SCENARIOS])
+    parser.add_argument("--cycles", type=int, default=10)
+    parser.add_argument("--accounts", type=int, default=1000, help="accounts in the 'accounts' scenario")
+    parser.add_argument("--json", action="store_true", help="one json line per scenario")
+    args = parser.parse_args()
+
+    if args.scenario != "all" and args.json:
+        print(json.dumps(run_scenario(args.scenario, args.accounts, args.cycles)))
+        return
+
+    names = list(SCENARIOS) if args.scenario == "all" else [args.scenario]
+    columns = ["scenario", "accounts", "startup_s", "p50_s", "p95_s", "max_s", "requests_per_cycle",
+               "not_modified_pct", "kb_per_cycle", "notifications", "cpu_s_per_cycle", "rss_mb", "peak_rss_mb"]
+    if not args.json:
+        print(f"{args.cycles} cycles per scenario")
+        print("  ".join(f"{column:>{max(len(column), 8)}}" for column in columns))
+
+    for name in names:
+        output = subprocess.run(
+            [sys.executable, __file__, "--scenario", name, "--cycles", str(args.cycles),
+             "--accounts", str(args.accounts), "--json"],
+            capture_output=True, text=True,
+        )
+        if output.returncode:
+            print(f"{name} failed:\n{output.stderr}", file=sys.stderr)
+            continue
+        result = json.loads(output.stdout.strip().splitlines()[-1])
+        if args.json:
+            print(json.dumps(result))
+        else:
+            print("  ".join(f"{result[column]:>{max(len(column), 8)}}" for column in columns))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+# cold start of oneshot.py: import time of the modules it loads, and the wall time of whole runs
+# (a first run that logs in and takes the baseline, then warm runs with a stored state / token) against the mock api
+# usage: python benchmarks/bench_startup.py [--runs 10] [--cases 60]
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+from bench_monitor import start_mock, mock_call, percentile
+
+# what a run imports before it knows its config is usable, and what a whole run imports
+IMPORTS = {
+    "oneshot": "import oneshot",
+    "client": "import oneshot, main",
+}
+
+
+def import_time(statement, repeat=5):
+    # best of `repeat` fresh interpreters, minus an empty interpreter start
+    def best(code):
+        times = []
+        for _ in range(repeat):
+            output = subprocess.run(
+                [sys.executable, "-c", f"import time; s = time.perf_counter(); {code}; print(time.perf_counter() - s)"],
+                cwd=ROOT, capture_output=True, text=True, check=True,
+            )
+            times.append(float(output.stdout.strip().splitlines()[-1]))
+        return min(times)
+    return best(statement)
+
+
+def delta(before, after, key):
+    return after.get(key, 0) - before.get(key, 0)  # the mock's stats leave out zero counters
+
+
+def run(environment):
+    start = time.perf_counter()
+    process = subprocess.run([sys.executable, os.path.join(ROOT, "oneshot.py")], cwd=ROOT, env=environment,
+                             capture_output=True, text=True)
+    elapsed = time.perf_counter() - start
+    if process.returncode:
+        print(f"oneshot.py exited with {process.returncode}:\n{process.stderr}", file=sys.stderr)
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--cases", type=int, default=60)
+    args = parser.parse_args()
+
+    for name, statement in IMPORTS.items():
+        print(f"import {name:<8}{import_time(statement) * 1000:>8.1f} ms")
+
+    mock, base_url = start_mock({"cases": args.cases})
+    directory = tempfile.mkdtemp(prefix="bench-startup-")
+    environment = {
+        **os.environ,
+        "MITGAISIM_BASE_URL": base_url,
+        "NTFY_URL": f"{base_url}/ntfy/bench",
+        "MALSHAB_ID": "1000000",
+        "BIOMETRIC_DATA": "mock",
+        "UUID": "mock",
+        "STATE_DB": os.path.join(directory, "state.db"),
+        "JOURNAL_DIR": os.path.join(directory, "journal"),
+        "CREDENTIALS_DB": os.path.join(directory, "credentials.db"),
+        "NOTIFY_SPOOL": os.path.join(directory, "spool.jsonl"),
+    }
+    try:
+        before = mock_call(base_url, "/mock/stats")
+        cold = run(environment)
+        after = mock_call(base_url, "/mock/stats")
+        print(f"cold run  {cold * 1000:>8.1f} ms  {delta(before, after, 'requests')} requests, "
+              f"{delta(before, after, 'logins')} logins")
+
+        times = []
+        before = after
+        for _ in range(args.runs):
+            times.append(run(environment))
+        after = mock_call(base_url, "/mock/stats")
+        print(f"warm run  {percentile(times, 0.5) * 1000:>8.1f} ms p50  {percentile(times, 0.95) * 1000:.1f} ms p95  "
+              f"{delta(before, after, 'requests') / args.runs:.1f} requests, "
+              f"{delta(before, after, 'status_304') / args.runs:.1f} not modified, "
+              f"{delta(before, after, 'logins')} logins")
+    finally:
+        mock.terminate()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+# memory of the tracked state: the raw api dicts vs the compact records of compact_state.py
+# usage: python benchmarks/bench_state_memory.py [--accounts 1000] [--cases 100] [--answer-size 600]
+import argparse
+import gc
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from compact_state import CaseRecord, SummonRecord, ScoreRecord, QuestionnaireRecord
+from mock_server import MockProfile
+
+
+def payloads(accounts, cases, answer_size):
+    # every account gets its own decoded payloads, like json.loads of its own responses
+    for index in range(accounts):
+        profile = MockProfile(str(1000000 + index), cases, answer_size)
+        yield json.dumps({
+            "cases": profile.cases,
+            "summons": profile.summons,
+            "scores": profile.scores,
+            "questionnaires": profile.questionnaires,
+        }, ensure_ascii=False)
+
+
+def raw_state(data):
+    return {
+        "cases": {case["caseNumber"]: case for case in data["cases"]},
+        "summons": {summon["summonId"]: summon for summon in data["summons"]},
+        "scores": {score["name"]: score for score in data["scores"]},
+        "questionnaires": {item["name"]: item for item in data["questionnaires"]},
+    }
+
+
+def compact_state(data):
+    return {
+        "cases": {case["caseNumber"]: CaseRecord(case) for case in data["cases"]},
+        "summons": {summon["summonId"]: SummonRecord(summon) for summon in data["summons"]},
+        "scores": {score["name"]: ScoreRecord(score) for score in data["scores"]},
+        "questionnaires": {item["name"]: QuestionnaireRecord(item) for item in data["questionnaires"]},
+    }
+
+
+def measure(build, documents):
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    states = [build(json.loads(document)) for document in documents]  # the decoded payload itself is dropped
+    elapsed = time.perf_counter() - start
+    gc.collect()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del states
+    return size, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--accounts", type=int, default=1000)
+    parser.add_argument("--cases", type=int, default=100)
+    parser.add_argument("--answer-size", type=int, default=600)
+    args = parser.parse_args()
+
+    documents = list(payloads(args.accounts, args.cases, args.answer_size))
+    total_cases = args.accounts * args.cases
+
+    print(f"{args.accounts} accounts x {args.cases} cases, {args.answer_size} character answers")
+    print(f"{'':<10}{'MB':>10}{'bytes/case':>12}{'build s':>10}")
+    results = {}
+    for name, build in (("raw dicts", raw_state), ("compact", compact_state)):
+        size, elapsed = measure(build, documents)
+        results[name] = size
+        print(f"{name:<10}{size / 2 ** 20:>10.1f}{size / total_cases:>12.0f}{elapsed:>10.2f}")
+    print(f"compact state uses {results['compact'] / results['raw dicts']:.0%} of the memory")
+
+
+if __name__ == "__main__":
+    main()
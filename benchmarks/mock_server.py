@@ -0,0 +1,295 @@
+# local stand-in for the Mitgaisim api, for measuring the notifier offline
+# usage: python benchmarks/mock_server.py [--port 8080] [--cases 60] [--latency 50] [--change-rate 0.1] [--no-validators]
+# then run the notifier with MITGAISIM_BASE_URL=http://127.0.0.1:8080 (and NTFY_URL=http://127.0.0.1:8080/ntfy/test)
+#
+# POST /mock/tick[?burst=1] applies one round of random changes (also done every --tick seconds),
+# GET /mock/stats returns request / byte counters
+import argparse
+import base64
+import hashlib
+import json
+import random
+import threading
+import time
+from collections import Counter
+from email.utils import formatdate, parsedate_to_datetime
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+NAME_CLAIM = "http://schemas.xmlsoap.org/ws/2005/05/identity/claims/name"
+
+
+def make_token(malshab_id, lifetime=3600):
+    def encode(part):
+        return base64.urlsafe_b64encode(json.dumps(part).encode()).decode().rstrip("=")
+
+    claims = {NAME_CLAIM: malshab_id, "exp": int(time.time()) + lifetime}
+    return f"{encode({'alg': 'none', 'typ': 'JWT'})}.{encode(claims)}.mock"
+
+
+def malshab_id_from_token(token):
+    try:
+        payload = token.split(".")[1]
+        return json.loads(base64.urlsafe_b64decode(payload + "=" * (-len(payload) % 4)))[NAME_CLAIM]
+    except Exception:
+        return None
+
+
+def _timestamp(seconds):
+    return time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(seconds))
+
+
+class MockProfile:
+    def __init__(self, malshab_id, cases, answer_size=280):
+        self.malshab_id = malshab_id
+        self.modified = time.time()
+        self.answer_size = answer_size
+        self.next_case = cases
+        # newest first, like the real case list
+        self.cases = [self._new_case(i, self.modified - (cases - i) * 3600) for i in reversed(range(cases))]
+        self.summons = [{
+            "summonId": 1,
+            "startDate": "2025-03-01T08:00:00",
+            "endDate": "2025-03-01T16:00:00",
+            "summonSubject": "יום המא\"ה",
+            "locationAddress": "תל השומר",
+            "locationName": "לשכת גיוס",
+            "approved": True,
+            "read": True,
+        }]
+        self.scores = [{
+            "name": "dapar",
+            "title": "דפ\"ר",
+            "score": 70,
+            "internalScoreList": [{"indicatorName": "verbal", "indicatorValue": 7}],
+        }]
+        self.user_data = {"malshabId": malshab_id, "phone": "050-0000000", "email": "malshab@example.com", "recruitmentDate": "2026-08-01"}
+        self.questionnaires = [{"name": "שאלון העדפות", "endDate": "2025-05-01", "isFinished": False, "isStarted": True}]
+        self.crm = False
+
+    def _new_case(self, i, created):
+        return {
+            "caseNumber": 5000000 + i,
+            "creationDate": _timestamp(created),
+            "channel": "אפליקציה",
+            "subject": f"פנייה {i}",
+            "mainSubject": "מיונים",
+            "statusDescription": "טופל",
+            "lastUpdateDate": _timestamp(created + 60),
+            "answer": ("התשובה לפנייה " * (self.answer_size // 14 + 1))[:self.answer_size],
+            "status": 1,
+            "slaDate": _timestamp(created + 7 * 86400),
+        }
+
+    def touch(self):
+        self.modified = time.time()
+
+    def change(self, rng):
+        # one random change, weighted towards the things that change most in real profiles
+        kind = rng.choices(["case_update", "new_case", "crm", "score", "summon", "questionnaire"], [5, 2, 2, 1, 1, 1])[0]
+        now = time.time()
+        if kind == "case_update" and self.cases:
+            case = self.cases.pop(rng.randrange(min(len(self.cases), 5)))
+            case["status"] = rng.choice([0, 1])
+            case["statusDescription"] = "בטיפול" if case["status"] == 0 else "טופל"
+            case["lastUpdateDate"] = _timestamp(now)
+            self.cases.insert(0, case)
+        elif kind == "new_case":
+            case = self._new_case(self.next_case, now)
+            case["status"], case["statusDescription"] = 0, "בטיפול"
+            self.next_case += 1
+            self.cases.insert(0, case)
+        elif kind == "crm":
+            self.crm = not self.crm
+        elif kind == "score":
+            self.scores[0]["internalScoreList"][0]["indicatorValue"] = rng.randint(1, 9)
+        elif kind == "summon":
+            self.summons.append({**self.summons[0], "summonId": len(self.summons) + 1, "startDate": _timestamp(now + 86400)})
+        else:
+            self.questionnaires[0]["isFinished"] = not self.questionnaires[0]["isFinished"]
+        self.touch()
+
+
+class MockState:
+    def __init__(self, cases=60, page_size=20, validators=True, latency=0, answer_size=280, change_rate=0.0, seed=1):
+        self.case_count = cases
+        self.page_size = page_size
+        self.validators = validators
+        self.latency = latency  # seconds added to every response (+-50%)
+        self.answer_size = answer_size
+        self.change_rate = change_rate  # chance of a change per profile per tick
+        self.rng = random.Random(seed)
+        self.profiles = {}
+        self.stats = Counter()
+        self.lock = threading.Lock()
+
+    def profile(self, malshab_id):
+        with self.lock:
+            if malshab_id not in self.profiles:
+                self.profiles[malshab_id] = MockProfile(malshab_id, self.case_count, self.answer_size)
+            return self.profiles[malshab_id]
+
+    def tick(self, burst=False):
+        # bursts change every profile several times at once, like a backend batch update
+        with self.lock:
+            changes = 0
+            for profile in self.profiles.values():
+                rounds = self.rng.randint(3, 8) if burst else int(self.rng.random() < self.change_rate)
+                for _ in range(rounds):
+                    profile.change(self.rng)
+                    changes += 1
+            self.stats["changes"] += changes
+            return changes
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    state = None  # set by serve()
+    protocol_version = "HTTP/1.1"  # keep-alive, like the real api
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        path = urlparse(self.path).path
+        body = self.rfile.read(length)
+        payload = json.loads(body or b"{}") if path.startswith("/api/") else {}
+
+        if path == "/api/authenticate/biometricLogin":
+            self.state.stats["logins"] += 1
+            self._delay()
+            if payload.get("biometricData") == "rejected":  # like a profile that logged in through the app
+                self.send_error(401)
+                return
+            self._send_json({"statusCode": 1, "accessToken": make_token(payload.get("malshabId"))})
+        elif path == "/mock/tick":
+            burst = parse_qs(urlparse(self.path).query).get("burst") == ["1"]
+            self._send_json({"changes": self.state.tick(burst)}, count=False)
+        elif path.startswith("/ntfy/"):
+            self.state.stats["notifications"] += 1
+            self._send_json({"id": "mock"}, count=False)
+        else:
+            self._send_json({"error": "not found"}, status=404)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+
+        if url.path == "/mock/stats":
+            self._send_json(dict(self.state.stats), count=False)
+            return
+
+        malshab_id = malshab_id_from_token(self._token())
+        if not malshab_id:
+            self._send_json({"error": "unauthorized"}, status=401)
+            return
+        profile = self.state.profile(malshab_id)
+        self._delay()
+
+        if url.path == "/api/Inbox/GetCaseList":
+            page = int(query.get("page", ["1"])[0])
+            start = (page - 1) * self.state.page_size
+            end = start + self.state.page_size
+            data = {"caseList": profile.cases[start:end], "hasMoreData": end < len(profile.cases)}
+        elif url.path == "/api/malshab/getUserMainData":
+            data = profile.user_data
+        elif url.path == "/api/malshabQualityData/getUserQualityData":
+            data = {"scoreList": profile.scores}
+        elif url.path == "/api/Inbox/HasCRMUpdate":
+            data = {"isUpdated": profile.crm}
+        elif url.path == "/api/malshab/getQuestionnaireList":
+            data = {"questionnaire": profile.questionnaires}
+        elif url.path == "/api/summon/getAllSummons":
+            data = {"allSummons": profile.summons}
+        else:
+            self._send_json({"error": "not found"}, status=404)
+            return
+
+        self._send_json(data, modified=profile.modified)
+
+    def _delay(self):
+        if self.state.latency:
+            time.sleep(self.state.latency * random.uniform(0.5, 1.5))
+
+    def _token(self):
+        authorization = self.headers.get("Authorization", "")
+        if authorization.startswith("Bearer "):
+            return authorization[len("Bearer "):]
+        for cookie in self.headers.get("cookie", "").split(";"):
+            name, _, value = cookie.strip().partition("=")
+            if name == "MobileAuth":
+                return value
+        return ""
+
+    def _send_json(self, data, status=200, modified=None, count=True):
+        body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        headers = {"Content-Type": "application/json; charset=utf-8"}
+
+        if modified is not None and self.state.validators:
+            headers["ETag"] = '"' + hashlib.blake2b(body, digest_size=8).hexdigest() + '"'
+            headers["Last-Modified"] = formatdate(int(modified), usegmt=True)
+            if self._not_modified(headers["ETag"], int(modified)):
+                status, body = 304, b""
+
+        if count:
+            self.state.stats["requests"] += 1
+            self.state.stats[f"status_{status}"] += 1
+            self.state.stats["bytes_sent"] += len(body)
+
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _not_modified(self, etag, modified):
+        if_none_match = self.headers.get("If-None-Match")
+        if if_none_match is not None:
+            return if_none_match == etag
+        if_modified_since = self.headers.get("If-Modified-Since")
+        if if_modified_since:
+            try:
+                return modified <= parsedate_to_datetime(if_modified_since).timestamp()
+            except (TypeError, ValueError):
+                return False
+        return False
+
+
+def serve(state, host="127.0.0.1", port=0):
+    # starts the mock in a background thread, returns the server (server.server_port has the real port)
+    handler = type("Handler", (MockHandler,), {"state": state})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--cases", type=int, default=60, help="cases per profile")
+    parser.add_argument("--page-size", type=int, default=20)
+    parser.add_argument("--no-validators", action="store_true", help="don't send ETag / Last-Modified")
+    parser.add_argument("--latency", type=float, default=0, help="milliseconds added to every response")
+    parser.add_argument("--answer-size", type=int, default=280, help="characters in every case answer")
+    parser.add_argument("--change-rate", type=float, default=0.0, help="chance of a change per profile per tick")
+    parser.add_argument("--tick", type=float, default=0, help="seconds between automatic ticks (0 = only POST /mock/tick)")
+    args = parser.parse_args()
+
+    state = MockState(cases=args.cases, page_size=args.page_size, validators=not args.no_validators,
+                      latency=args.latency / 1000, answer_size=args.answer_size, change_rate=args.change_rate)
+    server = serve(state, args.host, args.port)
+    print(f"🧪 Mock Mitgaisim api on http://{args.host}:{server.server_port}", flush=True)
+    try:
+        while True:
+            time.sleep(args.tick or 3600)
+            if args.tick:
+                state.tick()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+import hashlib
+import sys
+from collections.abc import Mapping
+
+from config import COMPACT_TEXT_LIMIT
+
+
+class HashedText:
+    # stands in for a long text (a case answer) that is only ever compared, never shown again.
+    # equal to the text it was made from, so the diff engine compares it like any other value
+
+    __slots__ = ("digest", "length")
+
+    def __init__(self, digest, length):
+        self.digest = digest
+        self.length = length
+
+    @classmethod
+    def of(cls, text):
+        return cls(_digest(text), len(text))
+
+    def __eq__(self, other):
+        if isinstance(other, HashedText):
+            return self.digest == other.digest
+        if isinstance(other, str):
+            return len(other) == self.length and _digest(other) == self.digest
+        return NotImplemented
+
+    def __hash__(self):
+        return hash(self.digest)
+
+    def __str__(self):
+        return f"({self.length} characters)"
+
+    def __repr__(self):
+        return f"HashedText({self.digest.hex()}, {self.length})"
+
+
+class Record:
+    # a tracked item reduced to the fields that are compared or shown in a message.
+    # behaves like the dict it replaces for everything the monitor does with it (get, [], in, items)
+
+    __slots__ = ()
+    fields = ()
+    interned = frozenset()
+    _equals = None  # compiled per record type
+
+    def __init__(self, data):
+        for field in self.fields:
+            setattr(self, field, _compact(data.get(field), field in self.interned))
+
+    def get(self, field, default=None):
+        return getattr(self, field, default) if field in self.__slots__ else default
+
+    def __getitem__(self, field):
+        if field not in self.__slots__:
+            raise KeyError(field)
+        try:
+            return getattr(self, field)
+        except AttributeError:
+            raise KeyError(field) from None
+
+    def __setitem__(self, field, value):
+        setattr(self, field, value)
+
+    def __contains__(self, field):
+        return field in self.__slots__ and hasattr(self, field)
+
+    def items(self):
+        for field in self.__slots__:
+            if hasattr(self, field):
+                yield field, getattr(self, field)
+
+    def __eq__(self, other):
+        if isinstance(other, Mapping):
+            # a freshly fetched item: equal when it has the same value in every field of the record,
+            # so the diff engine's "nothing changed" fast path works on tracked records too
+            return self._equals(other)
+        if type(self) is not type(other):
+            return NotImplemented
+        return dict(self.items()) == dict(other.items())
+
+    def __repr__(self):
+        return f"{type(self).__name__}({dict(self.items())!r})"
+
+
+def record_type(name, fields, interned=()):
+    # a Record class with one slot per field
+    fields = tuple(fields)
+    return type(name, (Record,), {
+        "__slots__": fields,
+        "fields": fields,
+        "interned": frozenset(interned),
+        "_equals": _compile_equals(fields),
+    })
+
+
+def _compile_equals(fields):
+    # record == mapping as one straight-line expression (like the diff engine's comparators).
+    # every field is set by __init__, HashedText compares its length before it hashes the other text
+    lines = ["def equals(record, other):", "    get = other.get", "    return ("]
+    lines.append("\n        and ".join(f"        record.{field} == get({field!r})" for field in fields))
+    lines.append("    )")
+    namespace = {}
+    exec("\n".join(lines), namespace)
+    return namespace["equals"]
+
+
+# key + watched fields (diff_engine schemas) + whatever the notification messages use
+CaseRecord = record_type(
+    "CaseRecord",
+    ["caseNumber", "creationDate", "channel", "subject", "mainSubject", "statusDescription", "lastUpdateDate",
+     "answer", "status", "slaDate"],
+    interned=["channel", "mainSubject", "statusDescription"],
+)
+SummonRecord = record_type(
+    "SummonRecord",
+    ["summonId", "startDate", "endDate", "summonSubject", "locationAddress", "locationName", "approved", "read"],
+    interned=["summonSubject", "locationAddress", "locationName"],
+)
+ScoreRecord = record_type("ScoreRecord", ["name", "title", "score", "internalScoreList"], interned=["name", "title"])
+QuestionnaireRecord = record_type("QuestionnaireRecord", ["name", "endDate", "isFinished", "isStarted"], interned=["name"])
+
+
+def compact_collection(record_type, old_records, new_items, changes):
+    # records for a freshly fetched collection. only added / changed items are converted,
+    # the others keep the record they already have
+    changed = {change.key for change in changes}
+    return {
+        key: old_records[key]
+        if key in old_records and key not in changed
+        else record_type(item)
+        for key, item in new_items.items()
+    }
+
+
+def encode(value):
+    # json.dumps(default=encode), for snapshots and the journal
+    if isinstance(value, Record):
+        return dict(value.items())
+    if isinstance(value, HashedText):
+        return {"$hashed": value.digest.hex(), "length": value.length}
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def _compact(value, intern):
+    if isinstance(value, str):
+        if COMPACT_TEXT_LIMIT and len(value) > COMPACT_TEXT_LIMIT:
+            return HashedText.of(value)
+        return sys.intern(value) if intern else value
+    if isinstance(value, dict) and "$hashed" in value:
+        return HashedText(bytes.fromhex(value["$hashed"]), value["length"])  # restored from a snapshot
+    return value
+
+
+def _digest(text):
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
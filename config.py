@@ -3,9 +3,75 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
-BASE_URL = "https://api.mitgaisim.idf.il"
+BASE_URL = os.getenv("MITGAISIM_BASE_URL", "https://api.mitgaisim.idf.il")  # can point at benchmarks/mock_server.py
 TOKEN_EXPIRY_BUFFER = 60
 BIOMETRIC_DATA = os.getenv("BIOMETRIC_DATA")
 MALSHAB_ID = os.getenv("MALSHAB_ID")
 UUID = os.getenv("UUID")
 NTFY_URL = os.getenv("NTFY_URL", "https://ntfy.sh")
+FETCH_WORKERS = int(os.getenv("FETCH_WORKERS", "6"))  # one per endpoint
+FETCH_TIMEOUT = float(os.getenv("FETCH_TIMEOUT", "60"))  # seconds to wait for a whole fetch phase
+HTTP_POOL_CONNECTIONS = int(os.getenv("HTTP_POOL_CONNECTIONS", "4"))  # number of hosts to keep pools for
+HTTP_POOL_MAXSIZE = int(os.getenv("HTTP_POOL_MAXSIZE", "10"))  # keep-alive connections per host
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "5"))
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", "30"))
+HTTP2 = os.getenv("HTTP2", "").lower() in ("1", "true", "yes")
+MAX_IN_FLIGHT = int(os.getenv("MAX_IN_FLIGHT", "0"))  # global cap on concurrent requests, 0 = no cap
+ACCOUNTS_FILE = os.getenv("ACCOUNTS_FILE")  # json list of accounts for multi account monitoring
+ENGINE_WORKERS = int(os.getenv("ENGINE_WORKERS", "8"))  # accounts checked at the same time
+ENGINE_FETCH_WORKERS = int(os.getenv("ENGINE_FETCH_WORKERS", "32"))  # endpoint fetches shared by all accounts
+STATE_DB = os.getenv("STATE_DB", "state.db")  # sqlite file with the tracked state, empty to disable
+NOTIFY_QUEUE_SIZE = int(os.getenv("NOTIFY_QUEUE_SIZE", "1000"))
+NOTIFY_MAX_RETRIES = int(os.getenv("NOTIFY_MAX_RETRIES", "5"))
+NOTIFY_BACKOFF_BASE = float(os.getenv("NOTIFY_BACKOFF_BASE", "1"))  # seconds, doubled on every retry
+NOTIFY_BACKOFF_MAX = float(os.getenv("NOTIFY_BACKOFF_MAX", "60"))
+NOTIFY_SPOOL = os.getenv("NOTIFY_SPOOL", "notifications.spool.jsonl")  # undelivered notifications
+NOTIFY_URGENT = [category.strip() for category in os.getenv("NOTIFY_URGENT", "summon_added").split(",") if category.strip()]  # sent right away
+NOTIFY_MAX_MESSAGE = int(os.getenv("NOTIFY_MAX_MESSAGE", "4000"))  # bytes per digest, ntfy turns longer messages into attachments
+STREAM_JSON = os.getenv("STREAM_JSON", "").lower() in ("1", "true", "yes")  # decode case / summon lists while they download
+STREAM_CHUNK_SIZE = int(os.getenv("STREAM_CHUNK_SIZE", "65536"))  # bytes read from a streamed response at a time
+CONDITIONAL_GET = os.getenv("CONDITIONAL_GET", "1").lower() in ("1", "true", "yes")  # send ETag / Last-Modified validators
+CASES_INCREMENTAL = os.getenv("CASES_INCREMENTAL", "1").lower() in ("1", "true", "yes")  # stop paging at already seen cases
+CASES_FULL_SWEEP_EVERY = int(os.getenv("CASES_FULL_SWEEP_EVERY", "12"))  # cycles between full case walks (finds removed cases), 0 for never
+TOKEN_REFRESH_AHEAD = float(os.getenv("TOKEN_REFRESH_AHEAD", "300"))  # seconds before expiry to refresh in the background
+CREDENTIALS_DB = os.getenv("CREDENTIALS_DB", "credentials.db")  # sqlite file with the registrations and tokens, empty to disable
+SCHEDULE_MIN_INTERVAL = float(os.getenv("SCHEDULE_MIN_INTERVAL", "60"))  # fastest an endpoint is polled, in seconds
+SCHEDULE_MAX_INTERVAL = float(os.getenv("SCHEDULE_MAX_INTERVAL", "1800"))  # slowest an endpoint is polled
+SCHEDULE_HOT_INTERVAL = float(os.getenv("SCHEDULE_HOT_INTERVAL", "120"))  # cases / crm while a case is open
+SCHEDULE_JITTER = float(os.getenv("SCHEDULE_JITTER", "0.1"))  # +-10% random spread
+# seconds an account's notifications are grouped, 0 = off. by default a little longer than the fastest poll
+# (+ jitter, + the time of two checks), so the next check of an endpoint that keeps changing lands in the
+# same digest and a value that flipped back is merged away
+NOTIFY_DIGEST_WINDOW = float(os.getenv("NOTIFY_DIGEST_WINDOW", str(SCHEDULE_MIN_INTERVAL * (1 + SCHEDULE_JITTER) + 15)))
+PROBE_GATING = os.getenv("PROBE_GATING", "1").lower() in ("1", "true", "yes")  # skip the case walk when the probes saw no change
+PROBE_FULL_REFRESH_EVERY = int(os.getenv("PROBE_FULL_REFRESH_EVERY", "6"))  # probed checks between unconditional fetches, 0 for never
+RATE_LIMIT = float(os.getenv("RATE_LIMIT", "10"))  # requests per second to the api, shared by all accounts (0 = no limit)
+RATE_BURST = int(os.getenv("RATE_BURST", "20"))
+RETRY_ATTEMPTS = int(os.getenv("RETRY_ATTEMPTS", "3"))  # retries of a request that got 429 / 5xx / a network error
+RETRY_BASE_DELAY = float(os.getenv("RETRY_BASE_DELAY", "0.5"))
+RETRY_MAX_DELAY = float(os.getenv("RETRY_MAX_DELAY", "30"))
+BREAKER_FAILURES = int(os.getenv("BREAKER_FAILURES", "5"))  # failures in a row before an endpoint is paused
+BREAKER_RESET = float(os.getenv("BREAKER_RESET", "60"))  # seconds before a paused endpoint is tried again
+JOURNAL_DIR = os.getenv("JOURNAL_DIR", "journal")  # history of every detected change, empty to disable
+JOURNAL_SEGMENT_SIZE = int(os.getenv("JOURNAL_SEGMENT_SIZE", str(8 * 1024 * 1024)))  # bytes per segment file
+JOURNAL_FLUSH_INTERVAL = float(os.getenv("JOURNAL_FLUSH_INTERVAL", "1"))  # seconds changes are collected before a write
+# longer tracked texts are kept as a hash only, 0 to keep them all. the old text a message shows is read back
+# from the journal, so without one nothing is hashed by default
+COMPACT_TEXT_LIMIT = int(os.getenv("COMPACT_TEXT_LIMIT", "200" if JOURNAL_DIR else "0"))
+SHARDS = int(os.getenv("SHARDS", "0"))  # worker processes of supervisor.py, 0 = one per cpu core
+SUPERVISOR_POLL = float(os.getenv("SUPERVISOR_POLL", "5"))  # seconds between worker health / accounts file checks
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")  # captured profiles and slow cycle timings
+PROFILE_CONTROL = os.getenv("PROFILE_CONTROL", "profile.request")  # touch it to profile the next cycles, empty to disable
+PROFILE_CYCLES = int(os.getenv("PROFILE_CYCLES", "5"))  # cycles profiled per request
+PROFILE_MODE = os.getenv("PROFILE_MODE", "cprofile")  # cprofile (the cycle thread) or sample (stacks of every thread)
+PROFILE_MEMORY = os.getenv("PROFILE_MEMORY", "").lower() in ("1", "true", "yes")  # tracemalloc while profiling
+PROFILE_SAMPLE_INTERVAL = float(os.getenv("PROFILE_SAMPLE_INTERVAL", "0.005"))  # seconds between stack samples
+SLOW_CYCLE_SECONDS = float(os.getenv("SLOW_CYCLE_SECONDS", "60"))  # cycles slower than this are captured, 0 = off
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))  # serves prometheus metrics on /metrics, 0 = off
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+QUERY_PORT = int(os.getenv("QUERY_PORT", "0"))  # local http api serving the tracked state (query_api.py), 0 = off
+QUERY_HOST = os.getenv("QUERY_HOST", "127.0.0.1")
+QUERY_TOKEN = os.getenv("QUERY_TOKEN", "")  # if set, requests need "Authorization: Bearer <token>"
+QUERY_REFRESH_MIN_AGE = float(os.getenv("QUERY_REFRESH_MIN_AGE", "30"))  # endpoints checked more recently aren't refetched
+QUERY_REFRESH_WAIT = float(os.getenv("QUERY_REFRESH_WAIT", "30"))  # longest a refresh request waits for its check
+QUERY_EVENT_BACKLOG = int(os.getenv("QUERY_EVENT_BACKLOG", "1000"))  # events kept for clients that reconnect
@@ -0,0 +1,197 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from config import CREDENTIALS_DB
+
+ACTIVE = "active"
+NEEDS_REGISTRATION = "needs_registration"  # the login was rejected, main.py has to register the account again
+
+_FIELDS = ("malshab_id", "biometric_data", "uuid", "token", "expires_at", "status", "registered_at", "updated_at")
+
+
+class CredentialStore:
+    # biometric data, uuid and the last token of every account, one row per malshab id.
+    # every update touches only its own row in one transaction, and WAL mode lets the supervisor's
+    # worker processes read and write it at the same time
+
+    def __init__(self, path=CREDENTIALS_DB):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)  # waits for the other processes' writes
+
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")  # no fsync per token update, still never corrupt in WAL mode
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS credentials ("
+                "malshab_id TEXT PRIMARY KEY, "
+                "biometric_data TEXT, "
+                "uuid TEXT, "
+                "token TEXT, "
+                "expires_at REAL, "
+                "status TEXT NOT NULL DEFAULT 'active', "
+                "registered_at REAL, "
+                "updated_at REAL NOT NULL)"
+            )
+
+    def get(self, malshab_id):
+        return self._fetch_one("SELECT * FROM credentials WHERE malshab_id = ?", (malshab_id,))
+
+    def accounts(self):
+        with self._lock:
+            rows = self._conn.execute("SELECT * FROM credentials ORDER BY malshab_id").fetchall()
+        return [dict(zip(_FIELDS, row)) for row in rows]
+
+    def register(self, malshab_id, biometric_data, uuid, token=None, expires_at=None):
+        # new credentials make the old token and status meaningless
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO credentials (malshab_id, biometric_data, uuid, token, expires_at, status, registered_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (malshab_id) DO UPDATE SET biometric_data = excluded.biometric_data, uuid = excluded.uuid, "
+                "token = excluded.token, expires_at = excluded.expires_at, status = excluded.status, "
+                "registered_at = excluded.registered_at, updated_at = excluded.updated_at",
+                (malshab_id, biometric_data, uuid, token, expires_at, ACTIVE, now, now),
+            )
+
+    def save_token(self, malshab_id, token, expires_at):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO credentials (malshab_id, token, expires_at, updated_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (malshab_id) DO UPDATE SET token = excluded.token, expires_at = excluded.expires_at, "
+                "updated_at = excluded.updated_at",
+                (malshab_id, token, expires_at, time.time()),
+            )
+
+    def set_status(self, malshab_id, status):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE credentials SET status = ?, token = CASE WHEN ? = ? THEN NULL ELSE token END, updated_at = ? "
+                "WHERE malshab_id = ?",
+                (status, status, NEEDS_REGISTRATION, time.time(), malshab_id),
+            )
+
+    def import_accounts(self, accounts, overwrite=False):
+        # bulk insert of {"malshab_id", "biometric_data", "uuid"} dicts in one transaction.
+        # accounts that are already in the store are kept unless overwrite is set
+        now = time.time()
+        rows = [(account["malshab_id"], account["biometric_data"], account["uuid"], ACTIVE, now, now)
+                for account in accounts]
+        conflict = ("DO UPDATE SET biometric_data = excluded.biometric_data, uuid = excluded.uuid, token = NULL, "
+                    "expires_at = NULL, status = excluded.status, registered_at = excluded.registered_at, "
+                    "updated_at = excluded.updated_at") if overwrite else "DO NOTHING"
+        with self._lock, self._conn:
+            before = self._conn.total_changes
+            self._conn.executemany(
+                "INSERT INTO credentials (malshab_id, biometric_data, uuid, status, registered_at, updated_at) "
+                f"VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT (malshab_id) {conflict}",
+                rows,
+            )
+            return self._conn.total_changes - before
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def _fetch_one(self, query, parameters):
+        with self._lock:
+            row = self._conn.execute(query, parameters).fetchone()
+        return dict(zip(_FIELDS, row)) if row else None
+
+
+def read_env_file(path):
+    # the account of a .env file written by older versions of main.py, None if it has no registration
+    from dotenv import dotenv_values
+
+    values = dotenv_values(path)
+    account = {"malshab_id": values.get("MALSHAB_ID"), "biometric_data": values.get("BIOMETRIC_DATA"),
+               "uuid": values.get("UUID")}
+    return account if all(account.values()) else None
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_credential_store():
+    # one connection per process, None when CREDENTIALS_DB is empty (nothing is kept between runs)
+    global _store
+    if not CREDENTIALS_DB:
+        return None
+    with _store_lock:
+        if _store is None:
+            _store = CredentialStore(CREDENTIALS_DB)
+        return _store
+
+
+def env_credentials():
+    # the single account of main.py. registrations are kept in the credential store; .env values
+    # (from before the store, or filled in by hand) are imported the first time they are seen
+    credentials = {
+        "biometric_data": os.getenv("BIOMETRIC_DATA"),
+        "malshab_id": os.getenv("MALSHAB_ID"),
+        "uuid": os.getenv("UUID"),
+    }
+    store = get_credential_store()
+    if store is None:
+        return credentials
+
+    malshab_id = credentials["malshab_id"]
+    if not malshab_id:
+        return credentials  # not registered yet (never some other account of the store)
+    if all(credentials.values()) and store.get(malshab_id) is None:
+        store.import_accounts([credentials])
+    return store.get(malshab_id) or credentials
+
+
+def main():
+    # python credential_store.py import .env ../other-profile/.env
+    # python credential_store.py list
+    import argparse  # cli only, AuthClient imports this module on every start
+
+    parser = argparse.ArgumentParser(description="Manage the stored credentials")
+    commands = parser.add_subparsers(dest="command", required=True)
+    import_command = commands.add_parser("import", help="import the accounts of .env files")
+    import_command.add_argument("paths", nargs="+")
+    import_command.add_argument("--overwrite", action="store_true", help="replace accounts that are already stored")
+    import_command.add_argument("--token-cache", help="also import the tokens of an old .token_cache.json")
+    commands.add_parser("list", help="show the stored accounts")
+    args = parser.parse_args()
+
+    if not CREDENTIALS_DB:
+        print("❌ Set CREDENTIALS_DB to use the credential store")
+        return
+    store = CredentialStore(CREDENTIALS_DB)
+
+    if args.command == "import":
+        accounts = []
+        for path in args.paths:
+            account = read_env_file(path)
+            if account:
+                accounts.append(account)
+            else:
+                print(f"⚠️ {path} has no MALSHAB_ID / BIOMETRIC_DATA / UUID, skipped")
+        imported = store.import_accounts(accounts, overwrite=args.overwrite)
+        print(f"✅ Imported {imported} of {len(accounts)} accounts")
+
+        if args.token_cache:
+            with open(args.token_cache, "r") as file:
+                tokens = json.load(file)
+            imported_ids = {account["malshab_id"] for account in accounts}
+            for malshab_id, token in tokens.items():
+                if malshab_id in imported_ids:
+                    store.save_token(malshab_id, token, None)  # the expiry is read from the token when it is used
+            print(f"🔑 Imported the tokens of {len(imported_ids.intersection(tokens))} accounts")
+    else:
+        for account in store.accounts():
+            expires = time.strftime("%Y-%m-%d %H:%M", time.localtime(account["expires_at"])) if account["expires_at"] else "-"
+            print(f"{account['malshab_id']}  {account['status']:<18}  token until {expires}")
+
+    store.close()
+
+
+if __name__ == "__main__":
+    main()
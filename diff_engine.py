@@ -0,0 +1,166 @@
+from collections import namedtuple
+from itertools import groupby
+from operator import attrgetter
+
+# one detected change
+# op: "added" / "removed" (a whole item) or "changed" (a watched field)
+# for nested collections, field is the collection name and item is the key of the nested entry
+Change = namedtuple("Change", ["op", "key", "field", "old", "new", "item"], defaults=(None,))
+
+_MISSING = object()
+
+
+class Schema:
+    # describes what to compare for one endpoint:
+    # key       - field that identifies an item of a collection (None when the payload is a single record)
+    # fields    - watched fields
+    # nested    - {collection field: (key field, value field)} for keyed lists inside an item
+    # all_keys  - compare every key that exists in both the old and the new record, instead of `fields`
+
+    def __init__(self, key=None, fields=(), nested=None, all_keys=False):
+        self.key = key
+        self.fields = tuple(fields)
+        self.nested = dict(nested or {})
+        self.all_keys = all_keys
+
+
+class Differ:
+    # a schema compiled into comparator functions, built once and reused every cycle
+
+    def __init__(self, schema):
+        self.schema = schema
+        self._diff_fields = _compile_fields(schema.fields)
+        self._nested = [(field, key_field, value_field) for field, (key_field, value_field) in schema.nested.items()]
+
+    def index(self, items):
+        key = self.schema.key
+        return {item[key]: item for item in items}
+
+    def diff_record(self, old, new, key=None, changes=None):
+        if changes is None:
+            changes = []
+        if old == new:  # most records didn't change, one C level comparison settles it
+            return changes
+
+        if self.schema.all_keys:
+            for field, value in new.items():
+                if field in old and old[field] != value:
+                    changes.append(Change("changed", key, field, old[field], value))
+        else:
+            self._diff_fields(old, new, key, changes)
+
+        for field, key_field, value_field in self._nested:
+            old_list = old.get(field) or ()
+            new_list = new.get(field) or ()
+            if old_list != new_list:
+                _diff_nested(old_list, new_list, key, field, key_field, value_field, changes)
+
+        return changes
+
+    def diff_collection(self, old_items, new_items, removals=True):
+        changes = []
+        for key, new in new_items.items():
+            old = old_items.get(key, _MISSING)
+            if old is _MISSING:
+                changes.append(Change("added", key, None, None, new))
+            else:
+                self.diff_record(old, new, key, changes)
+
+        if removals:
+            for key, old in old_items.items():
+                if key not in new_items:
+                    changes.append(Change("removed", key, None, old, None))
+
+        return changes
+
+    def diff_stream(self, old_items, items):
+        # diffs the items one at a time as they arrive (from a streamed response) and yields
+        # (key, item, changes) for every one of them. removals are up to the caller,
+        # who knows whether the stream was complete
+        key_field = self.schema.key
+        for item in items:
+            key = item[key_field]
+            old = old_items.get(key, _MISSING)
+            if old is _MISSING:
+                yield key, item, [Change("added", key, None, None, item)]
+            else:
+                yield key, item, self.diff_record(old, item, key)
+
+
+def _compile_fields(fields):
+    # generates a straight-line function with one comparison per watched field (no loop, no per-field lookups)
+    lines = ["def diff_fields(old, new, key, changes):", "    old_get = old.get", "    new_get = new.get"]
+    for field in fields:
+        lines.append(f"    a = old_get({field!r})")
+        lines.append(f"    b = new_get({field!r})")
+        lines.append(f"    if a != b:")
+        lines.append(f"        changes.append(Change('changed', key, {field!r}, a, b))")
+    lines.append("    return changes")
+
+    namespace = {"Change": Change}
+    exec("\n".join(lines), namespace)
+    return namespace["diff_fields"]
+
+
+def _diff_nested(old_list, new_list, key, field, key_field, value_field, changes):
+    old_values = {item[key_field]: item.get(value_field) for item in old_list}
+    new_values = {item[key_field]: item.get(value_field) for item in new_list}
+
+    for name, value in new_values.items():
+        if name not in old_values:
+            changes.append(Change("added", key, field, None, value, name))
+        elif old_values[name] != value:
+            changes.append(Change("changed", key, field, old_values[name], value, name))
+
+    for name, value in old_values.items():
+        if name not in new_values:
+            changes.append(Change("removed", key, field, value, None, name))
+
+
+CASES = Differ(Schema(
+    key="caseNumber",
+    fields=["creationDate", "channel", "subject", "mainSubject", "statusDescription", "lastUpdateDate", "answer", "status", "slaDate"],
+))
+SUMMONS = Differ(Schema(
+    key="summonId",
+    fields=["startDate", "endDate", "summonSubject", "locationAddress", "locationName", "approved", "read"],
+))
+SCORES = Differ(Schema(
+    key="name",
+    fields=["score"],
+    nested={"internalScoreList": ("indicatorName", "indicatorValue")},
+))
+QUESTIONNAIRES = Differ(Schema(
+    key="name",
+    fields=["endDate", "isFinished", "isStarted"],
+))
+USER_DATA = Differ(Schema(all_keys=True))
+
+
+def group_by_key(changes):
+    # yields (key, op, changes) per item, op is "added" / "removed" for whole items and "changed" otherwise
+    for key, group in groupby(changes, key=attrgetter("key")):
+        group = list(group)
+        first = group[0]
+        yield key, first.op if first.field is None else "changed", group
+
+
+def merge_changes(earlier, later):
+    # folds two change lists of the same item into the net change: the first old and the last new value
+    # of every field. a field that went back to where it started (flapping) disappears
+    merged = {}
+    for change in earlier:
+        merged[(change.key, change.field, change.item)] = change
+    for change in later:
+        ident = (change.key, change.field, change.item)
+        first = merged.get(ident)
+        if first is None:
+            merged[ident] = change
+        elif first.op == "added":
+            merged[ident] = None if change.op == "removed" else first._replace(new=change.new)
+        elif change.op == "removed":
+            merged[ident] = change._replace(old=first.old)
+        else:
+            merged[ident] = first._replace(op="changed", new=change.new)
+    return [change for change in merged.values()
+            if change is not None and (change.op != "changed" or change.old != change.new)]
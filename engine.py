@@ -0,0 +1,142 @@
+import heapq
+import json
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from api_client import MitgiaisimAPI
+from auth import AuthClient
+from config import ENGINE_WORKERS, ENGINE_FETCH_WORKERS, STATE_DB, JOURNAL_DIR
+from journal import Journal
+from http_client import get_shared_client
+from main import MitgiaisimMonitor
+from notifier import Notifier, NotificationCoalescer, get_shared_dispatcher
+from profiling import get_profiler
+from state_store import StateStore
+
+
+def load_accounts(path):
+    # accounts file format:
+    # [{"malshab_id": "...", "biometric_data": "...", "uuid": "...", "ntfy_url": "...", "name": "..."}, ...]
+    # ntfy_url and name are optional
+    with open(path, "r", encoding="utf-8") as file:
+        accounts = json.load(file)
+
+    return [account for account in accounts if account.get("malshab_id")]
+
+
+class MonitoringEngine:
+    # runs many malshab profiles in one process: every account has its own auth and tracked state,
+    # but they share one http pool, one fetch executor and one scheduler thread
+
+    def __init__(self, accounts, check_interval=300, workers=ENGINE_WORKERS, fetch_workers=ENGINE_FETCH_WORKERS):
+        self.check_interval = check_interval
+        self.http = get_shared_client()
+        self.fetch_executor = ThreadPoolExecutor(max_workers=fetch_workers, thread_name_prefix="fetch")
+        self.cycle_executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="account")
+        self.store = StateStore(STATE_DB) if STATE_DB else None
+        self.journal = Journal(JOURNAL_DIR) if JOURNAL_DIR else None
+        self.logger = logging.getLogger(__name__)
+
+        self.monitors = []
+        for account in accounts:
+            monitor = self._create_monitor(account)
+            if monitor:
+                monitor.scheduler.on_trigger = partial(self._wake, len(self.monitors))
+                self.monitors.append(monitor)
+
+        self._queue = []  # heap of (next due time, index)
+        self._initialized = set()
+        self._condition = threading.Condition()
+
+    @classmethod
+    def from_file(cls, path, **kwargs):
+        return cls(load_accounts(path), **kwargs)
+
+    def _create_monitor(self, account):
+        name = account.get("name") or account["malshab_id"]
+        try:
+            auth = AuthClient(http=self.http, credentials=account)
+        except ValueError as e:
+            self.logger.error(str(e))
+            return None
+
+        ntfy_url = account.get("ntfy_url")
+        notifier = NotificationCoalescer(
+            Notifier(ntfy_url=ntfy_url, title_prefix="" if ntfy_url else f"[{name}] ", account=account["malshab_id"]))
+
+        return MitgiaisimMonitor(
+            check_interval=self.check_interval,
+            api=MitgiaisimAPI(http=self.http, auth=auth),
+            notifier=notifier,
+            executor=self.fetch_executor,
+            name=name,
+            store=self.store,
+            journal=self.journal,
+        )
+
+    def run(self):
+        if not self.monitors:
+            self.logger.error("❌ No accounts to monitor")
+            return
+
+        self.logger.info(f"🚀 Monitoring {len(self.monitors)} accounts")
+        get_profiler().install_signal()
+
+        # spread the first checks over one interval so the accounts don't all hit the api together
+        now = time.time()
+        step = self.check_interval / len(self.monitors)
+        self._queue = [(now + index * step, index) for index in range(len(self.monitors))]
+        heapq.heapify(self._queue)
+
+        try:
+            while True:
+                with self._condition:
+                    while not self._queue or self._queue[0][0] > time.time():
+                        timeout = self._queue[0][0] - time.time() if self._queue else None
+                        self._condition.wait(timeout)
+                    _, index = heapq.heappop(self._queue)
+
+                self.cycle_executor.submit(self._run_cycle, index)
+        except KeyboardInterrupt:
+            self.logger.info("🛑 Monitoring stopped by user")
+        finally:
+            self.cycle_executor.shutdown(wait=False, cancel_futures=True)
+            self.fetch_executor.shutdown(wait=False, cancel_futures=True)
+            for monitor in self.monitors:
+                monitor.notifier.send_pending()  # open digest windows
+            get_shared_dispatcher().close()
+            if self.journal:
+                self.journal.close()
+
+    def _wake(self, index):
+        # a refresh request (query_api.py) made endpoints of the account due: its queued check is moved to now.
+        # an account that is being checked isn't queued, it is requeued at its (now passed) next due time when done
+        with self._condition:
+            for position, (due, queued) in enumerate(self._queue):
+                if queued == index:
+                    self._queue[position] = (min(due, time.time()), index)
+                    heapq.heapify(self._queue)
+                    self._condition.notify()
+                    break
+
+    def _run_cycle(self, index):
+        monitor = self.monitors[index]
+        try:
+            if index not in self._initialized:
+                self._initialized.add(index)
+                if not monitor.load_state():
+                    monitor.fetch_initial_data()
+                # a restored account is checked right away, so changes made while we were down show up now
+                monitor.check_for_updates()
+            else:
+                monitor.check_for_updates(monitor.scheduler.due())
+        except Exception as e:
+            monitor.logger.error(f"❌ Error in monitoring cycle: {str(e)}", exc_info=True)
+        finally:
+            # an account is only rescheduled once its cycle is done, so it never runs twice at the same time
+            with self._condition:
+                heapq.heappush(self._queue, (monitor.scheduler.next_wakeup(), index))
+                self._condition.notify()
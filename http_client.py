@@ -0,0 +1,99 @@
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from config import HTTP_POOL_CONNECTIONS, HTTP_POOL_MAXSIZE, HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT, HTTP2, MAX_IN_FLIGHT
+from config import STREAM_CHUNK_SIZE
+
+try:
+    import httpx  # optional, only needed for HTTP/2 (pip install "httpx[http2]")
+except ImportError:
+    httpx = None
+
+
+class HttpClient:
+    # one keep-alive connection pool shared by AuthClient and MitgiaisimAPI,
+    # so we don't pay a new TCP + TLS handshake to the api for every request
+
+    def __init__(self, pool_connections=HTTP_POOL_CONNECTIONS, pool_maxsize=HTTP_POOL_MAXSIZE,
+                 connect_timeout=HTTP_CONNECT_TIMEOUT, read_timeout=HTTP_READ_TIMEOUT, http2=HTTP2,
+                 max_in_flight=MAX_IN_FLIGHT):
+        self.timeout = (connect_timeout, read_timeout)
+        # global cap on concurrent requests, shared by every account using this client (0 = no cap)
+        self._in_flight = threading.BoundedSemaphore(max_in_flight) if max_in_flight > 0 else None
+        self.http2 = bool(http2 and httpx)
+
+        if http2 and not httpx:
+            print("⚠️ HTTP/2 requested but httpx is not installed, falling back to HTTP/1.1")
+
+        if self.http2:
+            try:
+                self._client = httpx.Client(
+                    http2=True,
+                    limits=httpx.Limits(max_connections=pool_maxsize, max_keepalive_connections=pool_maxsize),
+                    timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+                )
+            except ImportError:  # httpx without the h2 package
+                print("⚠️ HTTP/2 requested but the h2 package is not installed (pip install \"httpx[http2]\"), falling back to HTTP/1.1")
+                self.http2 = False
+
+        if not self.http2:
+            self._client = requests.Session()
+            adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize, pool_block=True)
+            self._client.mount("https://", adapter)
+            self._client.mount("http://", adapter)
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def request(self, method, url, **kwargs):
+        if self._in_flight is None:
+            return self._send(method, url, **kwargs)
+        with self._in_flight:
+            return self._send(method, url, **kwargs)
+
+    def _send(self, method, url, **kwargs):
+        # stream=True returns once the headers arrived, the body is read with iter_body (and the response closed)
+        if self.http2:
+            stream = kwargs.pop("stream", False)
+            if isinstance(kwargs.get("data"), (bytes, str)):
+                kwargs["content"] = kwargs.pop("data")  # httpx takes raw bodies as content
+            if stream:
+                return self._client.send(self._client.build_request(method, url, **kwargs), stream=True)
+            return self._client.request(method, url, **kwargs)
+        kwargs.setdefault("timeout", self.timeout)
+        return self._client.request(method, url, **kwargs)
+
+    def iter_body(self, response, chunk_size=STREAM_CHUNK_SIZE):
+        # the body of a stream=True response, chunk by chunk (requests and httpx name it differently).
+        # reading it counts against MAX_IN_FLIGHT from the first chunk until it is read or closed. a response
+        # that waits for its reader holds no slot: the reader may need one first (the next page of a case walk),
+        # and would wait forever for a slot held by a response that only it is going to read
+        if hasattr(response, "iter_content"):
+            chunks = response.iter_content(chunk_size)
+        else:
+            chunks = response.iter_bytes(chunk_size)
+        if self._in_flight is None:
+            yield from chunks
+            return
+        with self._in_flight:
+            yield from chunks
+
+    def close(self):
+        self._client.close()
+
+
+_shared_client = None
+_shared_lock = threading.Lock()
+
+
+def get_shared_client():
+    global _shared_client
+    with _shared_lock:
+        if _shared_client is None:
+            _shared_client = HttpClient()
+        return _shared_client
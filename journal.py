@@ -0,0 +1,266 @@
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+from compact_state import encode
+from config import JOURNAL_DIR, JOURNAL_SEGMENT_SIZE, JOURNAL_FLUSH_INTERVAL
+
+INDEX_FILE = "index.db"
+
+
+class Journal:
+    # append-only history of every detected change.
+    # entries are json lines in numbered segment files (a new segment every `segment_size` bytes),
+    # a sqlite index maps (account, entity, key, time) to the position of each line, so a query
+    # only reads the lines it returns. writes are batched on a background thread
+
+    def __init__(self, path=JOURNAL_DIR, segment_size=JOURNAL_SEGMENT_SIZE, flush_interval=JOURNAL_FLUSH_INTERVAL, recover=True):
+        self.path = path
+        self.segment_size = segment_size
+        self.flush_interval = flush_interval
+        os.makedirs(path, exist_ok=True)
+
+        self._lock = threading.Lock()  # the index connection
+        # waits for the other processes' writes (the supervisor's workers share the index)
+        self._conn = sqlite3.connect(os.path.join(path, INDEX_FILE), timeout=30, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "account TEXT NOT NULL, "
+                "entity TEXT NOT NULL, "
+                "key TEXT, "
+                "ts REAL NOT NULL, "
+                "segment INTEGER NOT NULL, "
+                "position INTEGER NOT NULL, "
+                "length INTEGER NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS entries_lookup ON entries (account, entity, ts)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS entries_key ON entries (account, entity, key, ts)")
+
+        self.segment = max(self._segments(), default=1)
+        if recover:  # only the writing process, a reader would race the writer's index
+            self._recover()
+
+        self.queue = queue.Queue()
+        self._thread = None
+        self._wake = threading.Event()  # set by flush, ends the batching wait early
+
+    def append(self, account, entity, changes):
+        # changes: Change tuples of one entity kind ("case", "summon", "score", ...).
+        # the entries are encoded right away (the tracked dicts keep changing after this), written later
+        now = time.time()
+        for change in changes:
+            entry = {
+                "ts": now,
+                "account": account,
+                "entity": entity,
+                "key": change.key,
+                "op": change.op,
+                "field": change.field,
+                "old": change.old,
+                "new": change.new,
+            }
+            if change.item is not None:
+                entry["item"] = change.item
+            line = json.dumps(entry, ensure_ascii=False, separators=(",", ":"), default=encode) + "\n"
+            self._start()
+            self.queue.put((account, entity, None if change.key is None else str(change.key), now, line.encode("utf-8")))
+
+    def flush(self, timeout=None):
+        # waits until everything appended so far is on disk
+        self._wake.set()
+        deadline = time.time() + timeout if timeout is not None else None
+        with self.queue.all_tasks_done:
+            while self.queue.unfinished_tasks:
+                remaining = deadline - time.time() if deadline is not None else None
+                if remaining is not None and remaining <= 0:
+                    return False
+                self.queue.all_tasks_done.wait(remaining)
+        return True
+
+    def close(self, timeout=10):
+        self.flush(timeout)
+        with self._lock:
+            self._conn.close()
+
+    def query(self, account=None, entity=None, key=None, since=None, until=None, limit=None, newest_first=False):
+        # entries in time order (or the newest first), read straight from their segment offsets
+        conditions, params = [], []
+        for column, value in (("account", account), ("entity", entity), ("key", key)):
+            if value is not None:
+                conditions.append(f"{column} = ?")
+                params.append(str(value))
+        if since is not None:
+            conditions.append("ts >= ?")
+            params.append(since)
+        if until is not None:
+            conditions.append("ts < ?")
+            params.append(until)
+
+        sql = "SELECT segment, position, length FROM entries"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += " ORDER BY ts DESC, rowid DESC" if newest_first else " ORDER BY ts, rowid"
+        if limit:
+            sql += f" LIMIT {int(limit)}"
+
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+
+        files = {}
+        try:
+            for segment, offset, length in rows:
+                if segment not in files:
+                    files[segment] = open(self._segment_path(segment), "rb")
+                file = files[segment]
+                file.seek(offset)
+                yield json.loads(file.read(length))
+        finally:
+            for file in files.values():
+                file.close()
+
+    def _start(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._writer, name="journal", daemon=True)
+                    self._thread.start()
+
+    def _writer(self):
+        while True:
+            batch = [self.queue.get()]
+            self._wake.wait(self.flush_interval)  # let the rest of the cycle's changes arrive, one write for all of them
+            self._wake.clear()
+            while True:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._write(batch)
+            except Exception as e:
+                print(f"⚠️ Failed to write the change journal: {e}")
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
+    def _write(self, batch):
+        rows = []
+        file = open(self._segment_path(self.segment), "ab")
+        try:
+            offset = file.tell()
+            for account, entity, key, ts, line in batch:
+                if offset and offset + len(line) > self.segment_size:
+                    file.flush()
+                    os.fsync(file.fileno())
+                    file.close()
+                    self.segment += 1
+                    file = open(self._segment_path(self.segment), "ab")
+                    offset = 0
+                file.write(line)
+                rows.append((account, entity, key, ts, self.segment, offset, len(line)))
+                offset += len(line)
+            file.flush()
+            os.fsync(file.fileno())
+        finally:
+            file.close()
+
+        # the lines are on disk before they are indexed, a crash in between is repaired by _recover
+        with self._lock, self._conn:
+            self._conn.executemany("INSERT INTO entries VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+
+    def _recover(self):
+        # indexes lines that were written but never made it to the index (the process died in between)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT segment, MAX(position + length) FROM entries WHERE segment = (SELECT MAX(segment) FROM entries)"
+            ).fetchone()
+        segment, end = row if row[0] is not None else (min(self._segments(), default=1), 0)
+
+        rows = []
+        for number in sorted(self._segments()):
+            if number < segment:
+                continue
+            with open(self._segment_path(number), "r+b") as file:
+                file.seek(end if number == segment else 0)
+                offset = file.tell()
+                for line in file:
+                    if not line.endswith(b"\n"):
+                        file.truncate(offset)  # torn write, the rest of the line never made it
+                        break
+                    entry = json.loads(line)
+                    key = entry.get("key")
+                    rows.append((entry["account"], entry["entity"], None if key is None else str(key), entry["ts"],
+                                 number, offset, len(line)))
+                    offset += len(line)
+
+        if rows:
+            print(f"🩹 Indexed {len(rows)} journal entries left over from the last run")
+            with self._lock, self._conn:
+                self._conn.executemany("INSERT INTO entries VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+
+    def _segments(self):
+        return [int(name[len("segment-"):-len(".jsonl")]) for name in os.listdir(self.path)
+                if name.startswith("segment-") and name.endswith(".jsonl")]
+
+    def _segment_path(self, number):
+        return os.path.join(self.path, f"segment-{number:06d}.jsonl")
+
+
+def _timestamp(value):
+    from datetime import datetime
+    return datetime.fromisoformat(value).timestamp() if value else None
+
+
+def _format(entry):
+    from datetime import datetime
+    when = datetime.fromtimestamp(entry["ts"]).strftime("%Y-%m-%d %H:%M:%S")
+    what = entry["key"] if entry.get("item") is None else f"{entry['key']} / {entry['item']}"
+    if entry["op"] == "changed":
+        change = f"{entry['field']}: {entry['old']} → {entry['new']}"
+    else:
+        change = entry["op"] if entry["field"] is None else f"{entry['op']} {entry['field']}"
+    return f"{when}  {entry['account']}  {entry['entity']} {what}  {change}"
+
+
+def main():
+    # python journal.py --account 123456789 --entity case --key 5000001 --since 2025-03-01 --until 2025-04-01
+    import argparse  # cli only imports, the monitor imports this module on every start
+    import heapq
+    import itertools
+
+    parser = argparse.ArgumentParser(description="Query the change journal")
+    parser.add_argument("--path", default=JOURNAL_DIR)
+    parser.add_argument("--account")
+    parser.add_argument("--entity", choices=["case", "summon", "score", "questionnaire", "user_data", "crm"])
+    parser.add_argument("--key", help="case number, summon id, score name...")
+    parser.add_argument("--since", help="ISO date / time")
+    parser.add_argument("--until", help="ISO date / time")
+    parser.add_argument("--limit", type=int)
+    parser.add_argument("--json", action="store_true", help="print the raw entries")
+    args = parser.parse_args()
+
+    # supervisor.py gives every worker process its own journal in a subdirectory, those are queried together
+    paths = [args.path] if args.path and os.path.exists(os.path.join(args.path, INDEX_FILE)) else sorted(
+        os.path.join(args.path, name) for name in (os.listdir(args.path) if args.path and os.path.isdir(args.path) else [])
+        if os.path.exists(os.path.join(args.path, name, INDEX_FILE))
+    )
+    if not paths:
+        print(f"❌ No journal at {args.path!r}")
+        return
+
+    queries = [
+        Journal(path, recover=False).query(args.account, args.entity, args.key, _timestamp(args.since), _timestamp(args.until), args.limit)
+        for path in paths
+    ]
+    entries = itertools.islice(heapq.merge(*queries, key=lambda entry: entry["ts"]), args.limit)
+    for entry in entries:
+        print(json.dumps(entry, ensure_ascii=False) if args.json else _format(entry))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+import codecs
+import hashlib
+import json
+
+_decoder = json.JSONDecoder()
+_WHITESPACE = " \t\n\r"
+_AFTER_VALUE = ",]}" + _WHITESPACE  # what may follow a value inside an object / array
+
+
+class StreamedObject:
+    # a json object read from a stream of byte chunks. the items of the array under `key` are handed out
+    # one by one while the rest of the body is still arriving, so only one chunk and one item are in memory
+    # at a time. the other top level fields end up in `fields` (the ones after the array once items()
+    # was read to the end), size / fingerprint cover the raw bytes like the fingerprint of a whole body
+
+    def __init__(self, chunks, key):
+        self.key = key
+        self.fields = {}
+        self.size = 0
+        self._chunks = iter(chunks)
+        self._hash = hashlib.blake2b(digest_size=16)
+        self._text = codecs.getincrementaldecoder("utf-8")()
+        self._buffer = ""
+        self._position = 0
+        self._done = False
+
+    @property
+    def fingerprint(self):
+        return self._hash.digest()
+
+    def items(self):
+        self._expect("{")
+        if self._peek() == "}":
+            self._position += 1
+        else:
+            while True:
+                name = self._value()
+                self._expect(":")
+                if name == self.key and self._peek() == "[":
+                    yield from self._array()
+                else:
+                    self.fields[name] = self._value()
+
+                separator = self._next()
+                if separator == "}":
+                    break
+                if separator != ",":
+                    raise ValueError(f"Expected ',' or '}}' in the response, got {separator!r}")
+
+        while self._fill():
+            pass  # whatever follows (whitespace) still counts for size / fingerprint
+
+    def _array(self):
+        self._position += 1  # [
+        if self._peek() == "]":
+            self._position += 1
+            return
+        while True:
+            yield self._value()
+            separator = self._next()
+            if separator == "]":
+                return
+            if separator != ",":
+                raise ValueError(f"Expected ',' or ']' in the response, got {separator!r}")
+
+    def _fill(self):
+        # appends the next chunk to the buffer (dropping what was already parsed), False at the end of the stream
+        if self._done:
+            return False
+        for chunk in self._chunks:
+            if chunk:
+                self.size += len(chunk)
+                self._hash.update(chunk)
+                self._buffer = self._buffer[self._position:] + self._text.decode(chunk)
+                self._position = 0
+                return True
+        self._buffer = self._buffer[self._position:] + self._text.decode(b"", final=True)
+        self._position = 0
+        self._done = True
+        return False
+
+    def _peek(self):
+        # the next non whitespace character, None at the end of the stream
+        while True:
+            while self._position < len(self._buffer) and self._buffer[self._position] in _WHITESPACE:
+                self._position += 1
+            if self._position < len(self._buffer):
+                return self._buffer[self._position]
+            if not self._fill():
+                return None
+
+    def _next(self):
+        char = self._peek()
+        self._position += 1
+        return char
+
+    def _expect(self, char):
+        found = self._next()
+        if found != char:
+            raise ValueError(f"Expected {char!r} in the response, got {found!r}")
+
+    def _value(self):
+        # one complete json value, more of the stream is read until it parses
+        self._peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self._buffer, self._position)
+            except json.JSONDecodeError:
+                if not self._fill():
+                    raise
+                continue
+            # a number is only complete once something that can't be part of it follows: "1." + "5" and
+            # "1e" + "5" decode as 1 with the rest still to come, and so does "12" + "3" at the end of the buffer
+            if (isinstance(value, (int, float)) and not isinstance(value, bool)
+                    and (end == len(self._buffer) or self._buffer[end] not in _AFTER_VALUE) and self._fill()):
+                continue
+            self._position = end
+            return value
@@ -1,301 +1,723 @@
 import time
 import logging
-from api_client import MitgiaisimAPI
-from notifier import Notifier
+import threading
+import contextvars
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FuturesTimeoutError
+from api_client import MitgiaisimAPI, UNCHANGED
+from diff_engine import CASES, SUMMONS, SCORES, QUESTIONNAIRES, USER_DATA, Change, group_by_key
+from journal import Journal
+from compact_state import CaseRecord, SummonRecord, ScoreRecord, QuestionnaireRecord, HashedText, compact_collection
+from notifier import Notifier, NotificationCoalescer
+from state_store import StateStore
+from scheduler import AdaptiveScheduler
+from config import FETCH_WORKERS, FETCH_TIMEOUT, STATE_DB, JOURNAL_DIR, CASES_INCREMENTAL, CASES_FULL_SWEEP_EVERY
+from config import PROBE_GATING, PROBE_FULL_REFRESH_EVERY
+from metrics import CYCLE_DURATION, CHECK_DURATION, CHANGES, UNCHANGED_SKIPS
+from profiling import get_profiler, record
+
+ENDPOINTS = ("cases", "summons", "quality", "user_data", "questionnaires", "crm")
+HOT_ENDPOINTS = ("cases", "crm")  # polled faster while a case is still open
+# snapshot kind of the endpoints whose state is only stored once they were checked
+BASELINE_KINDS = {"summons": "all_summons", "questionnaires": "questionaire_data", "crm": "has_crm_update"}
+CASE_STATUS_HANDLED = 1  # status of a case that got an answer
+
+# expensive endpoint -> cheap probes. the endpoint is only fetched when one of its probes changed
+# (or on a full refresh every PROBE_FULL_REFRESH_EVERY checks)
+FETCH_GRAPH = {
+    "cases": ("cases_head", "crm"),
+}
+# probes that are not regular endpoints: name -> fetch function of a monitor
+PROBES = {
+    "cases_head": lambda monitor: monitor.api.get_cases_head,
+}
+
+def _or_na(value):
+    return "N/A" if value is None else value
+
+def _every(count, every):
+    # true on every `every`th count, never when `every` is 0
+    return every > 0 and count % every == 0
+
+def _commit(data):
+    # keeps the fingerprints / validators of a processed response, so it is skipped from now on (api_client.Fetched)
+    commit = getattr(data, "commit", None)
+    if commit is not None:
+        commit()
+
+class AccountLoggerAdapter(logging.LoggerAdapter):
+    def process(self, msg, kwargs):
+        return f"[{self.extra['account']}] {msg}", kwargs
 
 class MitgiaisimMonitor:
-    def __init__(self, check_interval=300): # 5 minutes
-        self.api = MitgiaisimAPI()
-        self.notifier = Notifier()
+    def __init__(self, check_interval=300, api=None, notifier=None, executor=None, name=None, store=None, journal=None): # 5 minutes
+        self.api = api or MitgiaisimAPI()
+        # changes are grouped into digests before they reach ntfy (NOTIFY_DIGEST_WINDOW)
+        self.notifier = notifier or NotificationCoalescer(Notifier())
+        # tracked items are compact records (compact_state.py) with only the fields that are compared or shown
         self.tracked_cases = {}
         self.tracked_summons = {}
         self.tracked_scores = {}
         self.tracked_user_data = {}
         self.tracked_questionnaires = {}
-        self.tracked_crm = {}
+        self.tracked_crm = None
+        # case number -> checks in a row it was missing from the list. kept out of the records,
+        # which the query api shares with its clients
+        self.pending_removals = {}
+        self.baselined = set()  # kinds that have a stored state to compare against
+        self.case_fetches = 0
+        self.probe_checks = 0
+        self.cases_dirty = False
+        self.checked_at = {}  # endpoint -> time of its last successful check
+        self.changed_at = {}  # endpoint -> time it last changed
+        self.attempted_at = {}  # endpoint -> start of the last check that tried it
         self.check_interval = check_interval
-        
+        self.scheduler = AdaptiveScheduler(ENDPOINTS, check_interval)
+        # set by the query api (query_api.py): a read only view of the tracked state is published after every check,
+        # changes and checks are sent to its event feed, and `checked` is notified when a check is done
+        self.feed = None
+        self.view = None
+        self.checked = threading.Condition()
+        self._wakeup = threading.Event()
+        # the multi account engine passes one executor shared by every monitor
+        self.executor = executor or ThreadPoolExecutor(max_workers=FETCH_WORKERS, thread_name_prefix="fetch")
+        self.name = name
+        # snapshots are written after every cycle (if STATE_DB is empty, state is kept in memory only)
+        self.store = store or (StateStore(STATE_DB) if STATE_DB else None)
+        # every detected change is also appended to the journal (python journal.py to query it)
+        self.journal = journal or (Journal(JOURNAL_DIR) if JOURNAL_DIR else None)
+
         logging.basicConfig(
             level=logging.INFO,
             format='%(asctime)s - %(levelname)s - %(message)s',
             datefmt='%Y-%m-%d %H:%M:%S'
         )
         self.logger = logging.getLogger(__name__)
+        if name:
+            self.logger = AccountLoggerAdapter(self.logger, {"account": name})
 
     def fetch_initial_data(self):
         self.logger.info("🔄 Initializing data...")
 
-        cases = self.api.get_cases()
+        fetchers = {
+            "cases": self.api.get_cases,
+            "quality": self.api.get_user_quality_data,
+            "user_data": self.api.get_user_main_data,
+        }
+        results = dict(self._fetch_concurrently(fetchers))
+
+        cases = results.get("cases")
         if cases and "caseList" in cases:
-            self.tracked_cases = {case["caseNumber"]: case for case in cases["caseList"]}
+            self.tracked_cases = {case["caseNumber"]: CaseRecord(case) for case in cases["caseList"]}
 
-        quality_data = self.api.get_user_quality_data()
+        quality_data = results.get("quality")
         if quality_data and "scoreList" in quality_data:
-            self.tracked_scores = {item["name"]: item for item in quality_data["scoreList"]}
+            self.tracked_scores = {item["name"]: ScoreRecord(item) for item in quality_data["scoreList"]}
 
-        user_data = self.api.get_user_main_data()
+        user_data = results.get("user_data")
         if user_data:
             self.tracked_user_data = user_data
 
-        self.logger.info(f"✅ Loaded {len(self.tracked_cases)} cases, {len(self.tracked_scores)} quality scores")
-
-    def check_for_updates(self):
-        self.logger.info("🔍 Checking for updates...")
+        for data in results.values():
+            _commit(data)
 
-        self._check_case_updates()
-        self._check_summon_updates()
-        self._check_quality_updates()
-        self._check_user_data_updates()
-        self._check_questionaire_updates()
-        self._check_crm_updates()
+        now = time.time()
+        self.checked_at.update((name, now) for name, data in results.items() if data)
 
-    def _check_crm_updates(self):
-        has_update = self.api.get_has_crm_update()
+        self.logger.info(f"✅ Loaded {len(self.tracked_cases)} cases, {len(self.tracked_scores)} quality scores")
+        self.save_state()
+        self._publish()
+
+    def load_state(self):
+        if not self.store:
+            return False
+
+        snapshot = self.store.load(self.api.auth.malshab_id)
+        if not snapshot:
+            return False
+
+        # keyed collections are stored as [key, value] pairs so int keys survive the trip through json
+        self.tracked_cases = {key: CaseRecord(value) for key, value in snapshot.get("cases", [])}
+        self.pending_removals = dict(snapshot.get("counters", {}).get("pending_removals", []))
+        for key, value in snapshot.get("cases", []):
+            if "checkedForRemoval" in value:  # snapshots from before the counter was kept apart
+                self.pending_removals[key] = value["checkedForRemoval"]
+        self.tracked_summons = {key: SummonRecord(value) for key, value in snapshot.get("summons", [])}
+        self.tracked_scores = {key: ScoreRecord(value) for key, value in snapshot.get("scores", [])}
+        self.tracked_questionnaires = {key: QuestionnaireRecord(value) for key, value in snapshot.get("questionnaires", [])}
+        self.tracked_user_data = snapshot.get("user_data", {})
+        self.tracked_crm = snapshot.get("crm")
+        self.baselined = set(snapshot)
+
+        counters = snapshot.get("counters", {})
+        self.case_fetches = counters.get("case_fetches", 0)
+        self.probe_checks = counters.get("probe_checks", 0)
+        self.cases_dirty = counters.get("cases_dirty", False)
+        freshness = snapshot.get("freshness", {})
+        self.checked_at = freshness.get("checked_at", {})
+        self.changed_at = freshness.get("changed_at", {})
+
+        # with the fingerprints and validators back, unchanged endpoints are skipped from the first check on
+        self.api.import_cache(snapshot.get("http_cache", {}))
+        for kind, endpoint in BASELINE_KINDS.items():
+            if kind not in self.baselined:
+                self.api.forget(endpoint)  # its first response must be seen to take the baseline
+
+        self.logger.info(f"💾 Restored {len(self.tracked_cases)} cases, {len(self.tracked_summons)} summons, {len(self.tracked_scores)} quality scores from the state store")
+        self._publish()
+        return True
+
+    def save_state(self):
+        if not self.store:
+            return
 
+        snapshot = {
+            "cases": list(self.tracked_cases.items()),
+            "scores": list(self.tracked_scores.items()),
+            "user_data": self.tracked_user_data,
+        }
+        for kind, value in (
+            ("summons", list(self.tracked_summons.items())),
+            ("questionnaires", list(self.tracked_questionnaires.items())),
+            ("crm", self.tracked_crm),
+        ):
+            if kind in self.baselined:
+                snapshot[kind] = value
+        snapshot["http_cache"] = self.api.export_cache()
+        snapshot["counters"] = {
+            "case_fetches": self.case_fetches,
+            "probe_checks": self.probe_checks,
+            "cases_dirty": self.cases_dirty,
+            "pending_removals": list(self.pending_removals.items()),
+        }
+        snapshot["freshness"] = {"checked_at": self.checked_at, "changed_at": self.changed_at}
+
+        start = time.perf_counter()
+        try:
+            self.store.save(self.api.auth.malshab_id, snapshot)
+        except Exception as e:
+            self.logger.error(f"❌ Failed to save state: {e}")
+        record("save_state", time.perf_counter() - start)
+
+    def check_for_updates(self, due=None):
+        # due: the endpoints to check, all of them if not given
+        # returns endpoint -> found a change (None when the fetch failed).
+        # timed per stage, and profiled when asked for (profiling.py)
+        with get_profiler().cycle(self.api.auth.malshab_id):
+            return self._check_for_updates(due)
+
+    def _check_for_updates(self, due):
+        due = list(ENDPOINTS if due is None else due)
+        if not due:
+            return {}
+        self.logger.info(f"🔍 Checking for updates ({', '.join(due)})...")
+        start = time.perf_counter()
+        started_at = time.time()
+        account = self.api.auth.malshab_id
+
+        # cases waiting for their removal to be confirmed need a full pass even if nothing changed
+        pending_removals = bool(self.pending_removals)
+
+        # most fetches only page through cases updated since the newest one we know,
+        # every CASES_FULL_SWEEP_EVERY case fetches all pages are walked so removed cases are noticed
+        # (case_fetches + 1: the count once this fetch is made)
+        full_sweep = (not CASES_INCREMENTAL or pending_removals
+                      or _every(self.case_fetches + 1, CASES_FULL_SWEEP_EVERY))
+        since = None if full_sweep else self._case_watermark()
+
+        # endpoint name -> (fetch function, check function)
+        endpoints = {
+            "cases": (partial(self.api.get_cases, skip_unchanged=not pending_removals, since=since), self._check_case_updates),
+            "summons": (self.api.get_all_summons, self._check_summon_updates),
+            "quality": (self.api.get_user_quality_data, self._check_quality_updates),
+            "user_data": (self.api.get_user_main_data, self._check_user_data_updates),
+            "questionnaires": (self.api.get_questionaire_data, self._check_questionaire_updates),
+            "crm": (self.api.get_has_crm_update, self._check_crm_updates),
+        }
+        results = {}  # endpoint -> found a change (None when the fetch failed or timed out)
+        skipped = 0
+
+        # the cheap probes run first and decide whether the expensive endpoints are fetched at all
+        gated = self._run_probes(due, endpoints, results, pending_removals)
+        due_fetches = [name for name in due if name not in results]
+        for name in gated:
+            due_fetches.remove(name)
+            results[name] = False
+            UNCHANGED_SKIPS.inc(account, name)
+
+        if "cases" in due_fetches:
+            self.case_fetches += 1
+            # until its check is done, so a check that raises is followed by a walk the probes can't skip
+            self.cases_dirty = True
+
+        fetchers = {name: endpoints[name][0] for name in due_fetches}
+
+        # all requests go out together; each result is diffed (on this thread) as soon as it arrives
+        for name, data in self._fetch_concurrently(fetchers):
+            if data is UNCHANGED:
+                skipped += 1
+                results[name] = False
+                UNCHANGED_SKIPS.inc(account, name)
+                continue
+            results[name] = self._run_check(name, endpoints[name][1], data)
+
+        if "cases" in fetchers:
+            # a failed walk is retried on the next check even if the probes say nothing changed
+            self.cases_dirty = results.get("cases") is None
+
+        if skipped:
+            self.logger.info(f"⏭️ {skipped} unchanged endpoints skipped")
+
+        hot = self._has_open_cases()
+        now = time.time()
+        for name in due:
+            self.scheduler.record(name, results.get(name), hot=hot and name in HOT_ENDPOINTS, started=started_at)
+            self.attempted_at[name] = started_at
+            if results.get(name) is not None:
+                self.checked_at[name] = now
+            if results.get(name):
+                self.changed_at[name] = now
+
+        self.save_state()
+        self._publish(results)
+        CYCLE_DURATION.observe(account, value=time.perf_counter() - start)
+        return results
+
+    def request_refresh(self, endpoints=None, min_age=0):
+        # makes the endpoints due now and returns the ones that will be checked. endpoints checked in the
+        # last min_age seconds are left alone, and a request for an endpoint that is already due just
+        # shares its check, so any number of requests cost at most one fetch per endpoint
+        now = time.time()
+        stale = [name for name in endpoints or ENDPOINTS if now - self.checked_at.get(name, 0) >= min_age]
+        if stale:
+            self.scheduler.trigger(stale)
+        return stale
+
+    def _publish(self, results=None):
+        # a new view for the query api. it is never changed once published, so its threads can read it
+        # while the next check updates the tracked dicts
+        if self.feed is None:
+            return
+        version = self.view["version"] + 1 if self.view else 1
+        self.view = {
+            "version": version,
+            "state": {
+                "cases": list(self.tracked_cases.values()),
+                "summons": list(self.tracked_summons.values()),
+                "scores": list(self.tracked_scores.values()),
+                "questionnaires": list(self.tracked_questionnaires.values()),
+                "user_data": self.tracked_user_data,
+                "crm": self.tracked_crm,
+            },
+            "checked_at": dict(self.checked_at),
+            "changed_at": dict(self.changed_at),
+        }
+        self.feed.publish(self.api.auth.malshab_id, "checked", {
+            "account": self.api.auth.malshab_id,
+            "version": version,
+            "checked": sorted(name for name, changed in (results or {}).items() if changed is not None),
+            "changed": sorted(name for name, changed in (results or {}).items() if changed),
+        })
+        with self.checked:
+            self.checked.notify_all()
+
+    def _journal(self, entity, changes):
+        if self.journal and changes:
+            start = time.perf_counter()
+            self.journal.append(self.api.auth.malshab_id, entity, changes)
+            record("journal", time.perf_counter() - start)
+        if self.feed is not None and changes:
+            self.feed.publish_changes(self.api.auth.malshab_id, entity, changes)
+
+    def _run_check(self, name, check, data):
+        # diffs the data of one endpoint, timed for the metrics
+        start = time.perf_counter()
+        changed = check(data)
+        if changed is not None:
+            _commit(data)
+        elapsed = time.perf_counter() - start
+        CHECK_DURATION.observe(self.api.auth.malshab_id, name, value=elapsed)
+        record(f"check:{name}", elapsed)  # notify and journal included (and the download of a streamed list)
+        if changed:
+            CHANGES.inc(self.api.auth.malshab_id, name)
+        return changed
+
+    def _run_probes(self, due, endpoints, results, pending_removals):
+        # returns the endpoints the probes found unchanged. probes that are regular endpoints too (crm)
+        # are checked here and their result is put in `results`
+        gated = [name for name in FETCH_GRAPH if name in due]
+        if not PROBE_GATING or not gated:
+            return []
+
+        self.probe_checks += 1
+        if self.cases_dirty or pending_removals or _every(self.probe_checks, PROBE_FULL_REFRESH_EVERY):
+            return []  # full refresh, every endpoint is fetched no matter what the probes say
+
+        probe_names = {probe for name in gated for probe in FETCH_GRAPH[name]}
+        probes = {name: PROBES[name](self) if name in PROBES else endpoints[name][0] for name in probe_names}
+        changed = set()
+        answered = set()
+        for name, data in self._fetch_concurrently(probes):
+            answered.add(name)
+            if name in endpoints:
+                # the probe is a real endpoint, so its result counts as this cycle's check
+                results[name] = False if data is UNCHANGED else self._run_check(name, endpoints[name][1], data)
+                if results[name] is not False:
+                    changed.add(name)
+            elif data is not UNCHANGED:
+                changed.add(name)  # changed, or failed (None) - either way don't skip anything
+                _commit(data)  # the endpoints it gates stay dirty until their own check is done
+        changed.update(probe_names - answered)  # a probe that never answered (timeout) counts as changed
+
+        unchanged = [name for name in gated if not changed.intersection(FETCH_GRAPH[name])]
+        if unchanged:
+            saved = sum(self._estimated_requests(name) for name in unchanged) - len(set(probes) - set(endpoints))
+            self.logger.info(f"🪶 Probes found no changes for {', '.join(unchanged)} ({saved} requests saved)")
+        return unchanged
+
+    def _estimated_requests(self, name):
+        return self.api.page_counts.get(3, 1) if name == "cases" else 1
+
+    def _has_open_cases(self):
+        return any(case.get("status") != CASE_STATUS_HANDLED for case in self.tracked_cases.values())
+
+    def _fetch_concurrently(self, fetchers):
+        # the fetch threads run in a copy of this context, so their requests count towards this cycle's stages
+        futures = {self.executor.submit(contextvars.copy_context().run, fetch): name for name, fetch in fetchers.items()}
+        waited = time.perf_counter()
+        try:
+            for future in as_completed(futures, timeout=FETCH_TIMEOUT):
+                record("fetch_wait", time.perf_counter() - waited)
+                name = futures[future]
+                try:
+                    data = future.result()
+                except Exception as e:
+                    self.logger.error(f"❌ Failed to fetch {name}: {e}")
+                    data = None
+                yield name, data
+                waited = time.perf_counter()
+        except FuturesTimeoutError:
+            pending = [name for future, name in futures.items() if not future.done()]
+            self.logger.warning(f"⚠️ Timed out waiting for: {', '.join(pending)}")
+
+    def _check_crm_updates(self, has_update):
         if not has_update or "isUpdated" not in has_update:
             self.logger.warning("⚠️ Failed to retrieve CRM update status")
             return
 
-        if not self.tracked_crm:
+        if "crm" not in self.baselined:
             self.tracked_crm = has_update["isUpdated"]
-            return
+            self.baselined.add("crm")
+            return False
 
         if not self.tracked_crm and has_update["isUpdated"]:
             title = "📢 CRM Update"
             message = "A new CRM message is available!" # a crm message in inbox , or any other updates in crm.
-            self.notifier.send_notification(title, message)
+            self.notifier.send_notification(title, message, category="crm", key=("crm",))
 
+        changed = self.tracked_crm != has_update["isUpdated"]
+        if changed:
+            self._journal("crm", [Change("changed", None, "isUpdated", self.tracked_crm, has_update["isUpdated"])])
         self.tracked_crm = has_update["isUpdated"]
+        return changed
 
 
-    def _check_case_updates(self):
-        cases = self.api.get_cases()
-
+    def _check_case_updates(self, cases):
         if not cases or "caseList" not in cases:
             self.logger.warning("⚠️ Failed to retrieve case data")
             return
 
-        current_case_numbers = set()
-
-        for case in cases["caseList"]:
-            case_number = case["caseNumber"]
-            current_case_numbers.add(case_number)
-
-            if case_number in self.tracked_cases:
-                self._detect_case_changes(self.tracked_cases[case_number], case)
-            else:
+        # every case is diffed (and notified) as it arrives, with STREAM_JSON while later pages are still downloading
+        changes = []
+        seen = set()
+        for case_number, case, case_changes in CASES.diff_stream(self.tracked_cases, cases["caseList"]):
+            seen.add(case_number)
+            self.pending_removals.pop(case_number, None)
+            if case_changes:
+                self.tracked_cases[case_number] = CaseRecord(case)  # store case data
+            if not case_changes:
+                continue
+
+            changes.extend(case_changes)
+            if case_changes[0].op == "added":
                 # New case detected
                 title = f"New Case Opened: {case_number}"
                 message = f"📌 Subject: {case['subject']}\n📅 Created: {case['creationDate']}\n📞 Contact: {case['channel']}\n🔍 Status: {case['statusDescription']}"
-                self.notifier.send_notification(title, message)
-
-            self.tracked_cases[case_number] = case # store case data
-
-        previous_case_numbers = set(self.tracked_cases.keys())
-        deleted_cases = previous_case_numbers - current_case_numbers
-
-        for case_number in deleted_cases:
-            if self.tracked_cases[case_number].get("checkedForRemoval", 0) < 2:
-                self.tracked_cases[case_number]["checkedForRemoval"] = self.tracked_cases[case_number].get(
-                    "checkedForRemoval", 0) + 1
+                self.notifier.send_notification(title, message, category="case_added", key=("case_added", case_number))
             else:
-                title = f"Case Deleted: {case_number} | {self.tracked_cases[case_number]['mainSubject']}"
-                message = f"The case with number {case_number} has been removed from the system."
-                self.notifier.send_notification(title, message)
-                del self.tracked_cases[case_number]  # remove from tracked cases
-
-    def _detect_case_changes(self, old_case, new_case):
-        updates = []
-        fields = [ # fields to monitor
-            "creationDate",
-            "channel",
-            "subject",
-            "mainSubject",
-            "statusDescription",
-            "lastUpdateDate",
-            "answer",
-            "status",
-            "slaDate"
-        ]
-
-        for field in fields:
-            if old_case.get(field) != new_case.get(field):
-                updates.append(f"🔄 {field} changed: {old_case.get(field, 'N/A')} → {new_case.get(field, 'N/A')}")
-
-        if new_case.get("status") == 1:
-            old_answer = old_case.get("answer", "No answer")
-            new_answer = new_case.get("answer", "No answer")
-
-            if old_answer != new_answer:
-                updates.append(f"📝 Answer updated: {new_answer}")
-
-        if updates:
-            title = f"Case Updated: {new_case['caseNumber']} | {new_case['mainSubject']}"
-            message = "\n".join(updates)
-            self.notifier.send_notification(title, message)
-
-    def _check_summon_updates(self):
-        summons = self.api.get_all_summons()
+                self._notify_case_changes(case, case_changes)
+
+        self._journal("case", changes)  # removals once confirmed
+        if cases.get("failed"):
+            return None  # the walk broke off, retried in full on the next check
+
+        # a partial (incremental) list says nothing about the cases it doesn't contain
+        if not cases.get("partial"):
+            for case_number in [case_number for case_number in self.tracked_cases if case_number not in seen]:
+                removed = self._handle_removed_case(case_number)
+                if removed is not None:
+                    changes.append(removed)
+
+        return bool(changes)
+
+    def _case_watermark(self):
+        return max((case.get("lastUpdateDate") or "" for case in self.tracked_cases.values()), default="") or None
+
+    def _handle_removed_case(self, case_number):
+        # a case has to be missing for 3 checks in a row before it counts as deleted.
+        # returns the removal once it is confirmed, None while the case may still come back
+        if self.pending_removals.get(case_number, 0) < 2:
+            self.pending_removals[case_number] = self.pending_removals.get(case_number, 0) + 1
+            return None
+        del self.pending_removals[case_number]
+        title = f"Case Deleted: {case_number} | {self.tracked_cases[case_number]['mainSubject']}"
+        message = f"The case with number {case_number} has been removed from the system."
+        self.notifier.send_notification(title, message, category="case_removed")
+        removed = Change("removed", case_number, None, self.tracked_cases.pop(case_number), None)
+        self._journal("case", [removed])
+        return removed
+
+    def _notify_case_changes(self, case, changes):
+        # the old texts are looked up once here, not again every time the coalescer renders a merged message
+        changes = [change._replace(old=self._full_text(change.old, "case", change.key, change.field))
+                   for change in changes]
+        title, message = self._case_update_message(case, changes)
+        self.notifier.send_notification(title, message, category="case_changed", key=("case", case["caseNumber"]),
+                                        changes=changes, render=partial(self._case_update_message, case))
+
+    def _full_text(self, value, entity, key, field):
+        # long texts are tracked as hashes only (COMPACT_TEXT_LIMIT); when a message needs the old text, it is
+        # looked up in the change journal, where it was stored in full when it arrived. the newest entries
+        # of the item are read first, once the entries still waiting for the writer are on disk
+        if not isinstance(value, HashedText) or not self.journal:
+            return value
+        self.journal.flush(timeout=5)
+        for entry in self.journal.query(self.api.auth.malshab_id, entity, key, newest_first=True):
+            for candidate in (entry["new"], entry["old"]):
+                if isinstance(candidate, dict):
+                    candidate = candidate.get(field)
+                if value == candidate:
+                    return candidate
+        return value
+
+    def _case_update_message(self, case, changes):
+        updates = [f"🔄 {change.field} changed: {_or_na(self._full_text(change.old, 'case', change.key, change.field))} → {_or_na(change.new)}"
+                   for change in changes]
+
+        if case.get("status") == 1 and any(change.field == "answer" for change in changes):
+            updates.append(f"📝 Answer updated: {case.get('answer', 'No answer')}")
+
+        title = f"Case Updated: {case['caseNumber']} | {case['mainSubject']}"
+        message = "\n".join(updates)
+        return title, message
+
+    def _check_summon_updates(self, summons):
         if not summons or "allSummons" not in summons:
             self.logger.warning("⚠️ Failed to retrieve summons data")
             return
 
-        new_summons = {s["summonId"]: s for s in summons["allSummons"]}
-
-        if not self.tracked_summons:
-            self.tracked_summons = new_summons
-            return
-
-        for summon_id, summon_details in new_summons.items():
-            if summon_id not in self.tracked_summons:
+        if "summons" not in self.baselined:
+            tracked = {summon["summonId"]: SummonRecord(summon) for summon in summons["allSummons"]}
+            if summons.get("failed"):
+                return None
+            self.tracked_summons = tracked
+            self.baselined.add("summons")
+            return False
+
+        # diffed (and notified) one summon at a time, as they are decoded
+        changes = []
+        tracked = {}
+        for summon_id, summon_details, summon_changes in SUMMONS.diff_stream(self.tracked_summons, summons["allSummons"]):
+            old = self.tracked_summons.get(summon_id)
+            tracked[summon_id] = old if old is not None and not summon_changes else SummonRecord(summon_details)
+            if not summon_changes:
+                continue
+
+            changes.extend(summon_changes)
+            if summon_changes[0].op == "added":
                 title = f"📌 New Summon: {summon_details['summonSubject']}"
                 message = (
                     f"📅 Date: {summon_details['startDate']}\n"
                     f"📍 Location: {summon_details['locationName']}"
                 )
-                self.notifier.send_notification(title, message)
-
-        for summon_id in self.tracked_summons:
-            if summon_id not in new_summons:
-                old_details = self.tracked_summons[summon_id]
-                title = f"🗑️ Summon Removed: {old_details['summonSubject']}"
-                message = (
-                    f"📅 Date: {old_details['startDate']}\n"
-                    f"📍 Location: {old_details['locationName']}"
-                )
-                self.notifier.send_notification(title, message)
-
-        for summon_id, new_details in new_summons.items():
-            if summon_id in self.tracked_summons:
-                old_details = self.tracked_summons[summon_id]
-                summon_updates = []
+                self.notifier.send_notification(title, message, category="summon_added")
+            else:
+                render = partial(self._summon_update_message, summon_details)
+                title, message = render(summon_changes)
+                self.notifier.send_notification(title, message, category="summon_changed", key=("summon", summon_id),
+                                                changes=summon_changes, render=render)
+
+        if summons.get("failed"):
+            self._journal("summon", changes)
+            self.tracked_summons.update(tracked)  # what was read so far, the rest is checked on the next fetch
+            return None
+
+        for summon_id, old_details in self.tracked_summons.items():
+            if summon_id in tracked:
+                continue
+            changes.append(Change("removed", summon_id, None, old_details, None))
+            title = f"🗑️ Summon Removed: {old_details['summonSubject']}"
+            message = (
+                f"📅 Date: {old_details['startDate']}\n"
+                f"📍 Location: {old_details['locationName']}"
+            )
+            self.notifier.send_notification(title, message, category="summon_removed")
+
+        self._journal("summon", changes)
+        self.tracked_summons = tracked
+        return bool(changes)
+
+    def _summon_update_message(self, summon, changes):
+        title = f"🔄 Summon Updated: {summon['summonSubject']}"
+        message = "\n".join(f"{change.field} changed: {change.old} → {change.new}" for change in changes)
+        return title, message
+
+    def _check_quality_updates(self, quality_data):
+        if not quality_data or "scoreList" not in quality_data:
+            self.logger.warning("⚠️ Failed to retrieve quality data")
+            return
 
-                for field in ["startDate", "endDate", "summonSubject", "locationAddress", "locationName", "approved", "read"]:
-                    if old_details.get(field) != new_details.get(field):
-                        summon_updates.append(f"{field} changed: {old_details.get(field)} → {new_details.get(field)}")
+        new_scores = SCORES.index(quality_data["scoreList"])
+        changes = SCORES.diff_collection(self.tracked_scores, new_scores)
+        self._journal("score", changes)
 
-                if summon_updates:
-                    title = f"🔄 Summon Updated: {new_details['summonSubject']}"
-                    message = "\n".join(summon_updates)
-                    self.notifier.send_notification(title, message)
+        # new and removed scores are only tracked, not notified
+        for score_name, op, score_changes in group_by_key(changes):
+            if op == "changed":
+                self._notify_quality_changes(self.tracked_scores[score_name], score_changes)
 
-        self.tracked_summons = new_summons
+        # rebuilt from the response, so a removed score is reported once and then no longer tracked
+        self.tracked_scores = compact_collection(ScoreRecord, self.tracked_scores, new_scores, changes)
+        return bool(changes)
 
-    def _check_quality_updates(self):
-        quality_data = self.api.get_user_quality_data()
-        if not quality_data or "scoreList" not in quality_data:
-            self.logger.warning("⚠️ Failed to retrieve quality data")
-            return
-            
-        for score in quality_data["scoreList"]:
-            score_name = score["name"]
-            if score_name in self.tracked_scores:
-                self._detect_quality_changes(self.tracked_scores[score_name], score)
-            self.tracked_scores[score_name] = score
-
-    def _check_user_data_updates(self):
-        user_data = self.api.get_user_main_data()
+    def _check_user_data_updates(self, user_data):
         if not user_data:
             self.logger.warning("⚠️ Failed to retrieve user data")
             return
-            
-        self._detect_user_data_changes(self.tracked_user_data, user_data)
+
+        changes = USER_DATA.diff_record(self.tracked_user_data, user_data)
+        self._journal("user_data", changes)
+        if changes:
+            self._notify_user_data_changes(changes)
         self.tracked_user_data = user_data
+        return bool(changes)
 
-    def _check_questionaire_updates(self):
-        questionaire = self.api.get_questionaire_data()
+    def _check_questionaire_updates(self, questionaire):
         if not questionaire:
             self.logger.warning("⚠️ Failed to retrieve questionaire data")
             return
 
-        self._detect_questionaire_changes(questionaire)
-
-    def _detect_questionaire_changes(self, new_questionnaire):
-        updates = []
-        new_questionnaires = {q["name"]: q for q in new_questionnaire.get("questionnaire", [])}
-
-        if not self.tracked_questionnaires:
-            self.tracked_questionnaires = new_questionnaires
-            return
-
-        old_questionnaires = self.tracked_questionnaires
-
-        for name, details in new_questionnaires.items():
-            if name not in old_questionnaires:
-                updates.append(f"📌 New Questionnaire Added: {name}")
+        new_questionnaires = QUESTIONNAIRES.index(questionaire.get("questionnaire", []))
 
-        for name in old_questionnaires:
-            if name not in new_questionnaires:
-                updates.append(f"🗑️ Questionnaire Removed: {name}")
+        if "questionnaires" not in self.baselined:
+            self.tracked_questionnaires = compact_collection(QuestionnaireRecord, {}, new_questionnaires, ())
+            self.baselined.add("questionnaires")
+            return False
 
-        for name, new_details in new_questionnaires.items():
-            if name in old_questionnaires:
-                old_details = old_questionnaires[name]
-                for field in ["endDate", "isFinished", "isStarted"]:
-                    if old_details.get(field) != new_details.get(field):
-                        updates.append(f"🔄 {name} {field} changed: {old_details.get(field)} → {new_details.get(field)}")
-
-        if updates:
-            title = "📋 Questionnaire Update"
-            message = "\n".join(updates)
-            self.notifier.send_notification(title, message)
-            self.logger.info(f"📋 Questionnaire update detected: {len(updates)} changes")
+        changes = QUESTIONNAIRES.diff_collection(self.tracked_questionnaires, new_questionnaires)
+        self._journal("questionnaire", changes)
+        if changes:
+            self._notify_questionaire_changes(changes)
 
         # Update stored state
-        self.tracked_questionnaires = new_questionnaires
+        self.tracked_questionnaires = compact_collection(QuestionnaireRecord, self.tracked_questionnaires, new_questionnaires, changes)
+        return bool(changes)
 
-    def _detect_quality_changes(self, old_score, new_score):
-        updates = []
+    def _notify_questionaire_changes(self, changes):
+        title, message = self._questionaire_message(changes)
+        self.notifier.send_notification(title, message, category="questionnaire", key=("questionnaire",),
+                                        changes=changes, render=self._questionaire_message)
+        self.logger.info(f"📋 Questionnaire update detected: {len(changes)} changes")
 
-        if old_score["score"] != new_score["score"]:
-            updates.append(f"{old_score['title']} score changed: {old_score['score']} → {new_score['score']}")
+    def _questionaire_message(self, changes):
+        updates = []
+        for change in changes:
+            if change.op == "added":
+                updates.append(f"📌 New Questionnaire Added: {change.key}")
+            elif change.op == "removed":
+                updates.append(f"🗑️ Questionnaire Removed: {change.key}")
+            else:
+                updates.append(f"🔄 {change.key} {change.field} changed: {change.old} → {change.new}")
 
-        old_internal = {item["indicatorName"]: item["indicatorValue"] 
-                        for item in old_score.get("internalScoreList", [])}
-        new_internal = {item["indicatorName"]: item["indicatorValue"] 
-                        for item in new_score.get("internalScoreList", [])}
+        title = "📋 Questionnaire Update"
+        message = "\n".join(updates)
+        return title, message
 
-        for name, value in new_internal.items():
-            if name not in old_internal:
-                updates.append(f"New internal score added: {name} ({value})")
-            elif old_internal[name] != value:
-                updates.append(f"Internal score changed: {name}: {old_internal[name]} → {value}")
+    def _notify_quality_changes(self, old_score, changes):
+        render = partial(self._quality_message, old_score)
+        title, message = render(changes)
+        self.notifier.send_notification(title, message, category="score", key=("score", old_score["name"]),
+                                        changes=changes, render=render)
+        self.logger.info(f"📈 Quality score updated: {len(changes)} changes")
 
-        for name in old_internal:
-            if name not in new_internal:
-                updates.append(f"Internal score removed: {name} ({old_internal[name]})")
+    def _quality_message(self, old_score, changes):
+        updates = []
+        for change in changes:
+            if change.field == "score":
+                updates.append(f"{old_score['title']} score changed: {change.old} → {change.new}")
+            elif change.op == "added":
+                updates.append(f"New internal score added: {change.item} ({change.new})")
+            elif change.op == "changed":
+                updates.append(f"Internal score changed: {change.item}: {change.old} → {change.new}")
+            else:
+                updates.append(f"Internal score removed: {change.item} ({change.old})")
 
-        if updates:
-            title = "📊 Quality Score Update"
-            message = "\n".join(updates)
-            self.notifier.send_notification(title, message)
-            self.logger.info(f"📈 Quality score updated: {len(updates)} changes")
+        title = "📊 Quality Score Update"
+        message = "\n".join(updates)
+        return title, message
 
-    def _detect_user_data_changes(self, old_data, new_data):
-        updates = []
+    def _notify_user_data_changes(self, changes):
+        title, message = self._user_data_message(changes)
+        self.notifier.send_notification(title, message, category="user_data", key=("user_data",),
+                                        changes=changes, render=self._user_data_message)
+        self.logger.info(f"👤 User data updated: {len(changes)} changes")
 
-        for key in new_data.keys():
-            if key in old_data and old_data[key] != new_data[key]:
-                updates.append(f"{key} changed: {old_data[key]} → {new_data[key]}")
+    def _user_data_message(self, changes):
+        updates = [f"{change.field} changed: {change.old} → {change.new}" for change in changes]
 
-        if updates:
-            title = "👤 User Data Update"
-            message = "\n".join(updates)
-            self.notifier.send_notification(title, message)
-            self.logger.info(f"👤 User data updated: {len(updates)} changes")
+        title = "👤 User Data Update"
+        message = "\n".join(updates)
+        return title, message
 
     def run_monitoring(self):
-        self.fetch_initial_data()
+        get_profiler().install_signal()
+        self.scheduler.on_trigger = self._wakeup.set  # a refresh request (query_api.py) ends the wait
+        if not self.load_state():
+            self.fetch_initial_data()
 
         try:
+            self.check_for_updates()
             while True:
-                self.check_for_updates()
-                time.sleep(self.check_interval)
+                # sleep until the next endpoint is due, then check only the endpoints that are due
+                self._wakeup.wait(max(0, self.scheduler.next_wakeup() - time.time()))
+                self._wakeup.clear()
+                self.check_for_updates(self.scheduler.due())
         except KeyboardInterrupt:
             self.logger.info("🛑 Monitoring stopped by user")
         except Exception as e:
             self.logger.error(f"❌ Error in monitoring loop: {str(e)}", exc_info=True)
+        finally:
+            self.notifier.close()
+            if self.journal:
+                self.journal.close()
 
 if __name__ == "__main__":
-    monitor = MitgiaisimMonitor()
-    monitor.run_monitoring()
+    from config import ACCOUNTS_FILE, METRICS_PORT, METRICS_HOST, QUERY_PORT, QUERY_HOST
+
+    if METRICS_PORT:
+        from metrics import start_metrics_server
+        start_metrics_server(METRICS_PORT, METRICS_HOST)
+
+    if ACCOUNTS_FILE:
+        from engine import MonitoringEngine
+        engine = MonitoringEngine.from_file(ACCOUNTS_FILE)
+        monitors, run = engine.monitors, engine.run
+    else:
+        monitor = MitgiaisimMonitor()
+        monitors, run = [monitor], monitor.run_monitoring
+
+    if QUERY_PORT:
+        from query_api import start_query_server
+        start_query_server(monitors, QUERY_PORT, QUERY_HOST)
+    run()
+
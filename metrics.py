@@ -0,0 +1,151 @@
+import threading
+from bisect import bisect_left
+
+# a small prometheus style registry (text exposition format 0.0.4), no extra dependency.
+# recording is a dict lookup and an add under a lock, cheap enough to be always on;
+# the /metrics endpoint itself is only started when METRICS_PORT is set
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+PAGE_BUCKETS = (1, 2, 3, 5, 10, 20, 50, 100)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self._values = {}  # label values -> value
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def _render_labels(self, values, extra=None):
+        pairs = list(zip(self.label_names, values))
+        if extra:
+            pairs.append(extra)
+        if not pairs:
+            return ""
+        escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+        return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = list(self._values.items())
+        for values, value in items:
+            lines.extend(self._render_value(values, value))
+        return lines
+
+    def _render_value(self, values, value):
+        return [f"{self.name}{self._render_labels(values)} {value}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name, documentation, labels=(), function=None):
+        super().__init__(name, documentation, labels)
+        self.function = function  # read at scrape time, for values that are cheaper to look up than to track
+
+    def set(self, *labels, value):
+        with self._lock:
+            self._values[labels] = value
+
+    def render(self):
+        if self.function is not None:
+            self.set(value=self.function())
+        return super().render()
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, *labels, value):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(labels)
+            if state is None:
+                # per bucket counts (not cumulative, summed on render), sum, count
+                state = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def _render_value(self, values, state):
+        counts, total, count = state
+        lines = []
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets + ("+Inf",), counts):
+            cumulative += bucket_count
+            lines.append(f"{self.name}_bucket{self._render_labels(values, ('le', bound))} {cumulative}")
+        lines.append(f"{self.name}_sum{self._render_labels(values)} {total}")
+        lines.append(f"{self.name}_count{self._render_labels(values)} {count}")
+        return lines
+
+
+_registry = []
+
+
+def render():
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# label "account" is the malshab id of the profile
+REQUEST_DURATION = Histogram("mitgaisim_request_duration_seconds", "Time of one api request, retries included",
+                             ["account", "endpoint"])
+REQUESTS = Counter("mitgaisim_requests_total", "Api responses by status code (error = no response)",
+                   ["account", "endpoint", "status"])
+RESPONSE_BYTES = Counter("mitgaisim_response_bytes_total", "Bytes of api response bodies", ["account", "endpoint"])
+CASE_PAGES = Histogram("mitgaisim_case_pages", "Pages requested by one get_cases call", ["account"], PAGE_BUCKETS)
+TOKEN_REFRESHES = Counter("mitgaisim_token_refreshes_total", "Logins to get a new token", ["account", "result"])
+CYCLE_DURATION = Histogram("mitgaisim_cycle_duration_seconds", "Time of one check for updates", ["account"])
+CHECK_DURATION = Histogram("mitgaisim_check_duration_seconds", "Time to diff one endpoint's data", ["account", "endpoint"])
+CHANGES = Counter("mitgaisim_changes_total", "Checks that found a change", ["account", "endpoint"])
+UNCHANGED_SKIPS = Counter("mitgaisim_unchanged_skips_total", "Fetches skipped or answered as unchanged", ["account", "endpoint"])
+NOTIFICATIONS = Counter("mitgaisim_notifications_total", "Notifications queued", ["account"])
+NOTIFY_COALESCED = Counter("mitgaisim_notifications_coalesced_total",
+                           "Notifications folded into a digest or dropped as duplicates / flapping", ["account"])
+NOTIFY_DURATION = Histogram("mitgaisim_notification_delivery_seconds", "Time to deliver one notification, retries included")
+NOTIFY_RESULTS = Counter("mitgaisim_notification_results_total", "Delivered (sent), spooled or dropped (rejected by ntfy) notifications", ["result"])
+NOTIFY_QUEUE_DEPTH = Gauge("mitgaisim_notification_queue_depth", "Notifications waiting for delivery")
+
+
+def start_metrics_server(port, host="127.0.0.1"):
+    from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler  # only when the endpoint is enabled
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    print(f"📊 Metrics on http://{host}:{server.server_port}/metrics")
+    return server
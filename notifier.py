@@ -1,29 +1,361 @@
-import subprocess
+import heapq
+import itertools
+import json
 import os
-import sys
+import queue
+import random
+import threading
+import time
+from functools import partial
+
+from config import NOTIFY_QUEUE_SIZE, NOTIFY_MAX_RETRIES, NOTIFY_BACKOFF_BASE, NOTIFY_BACKOFF_MAX, NOTIFY_SPOOL
+from config import NOTIFY_DIGEST_WINDOW, NOTIFY_URGENT, NOTIFY_MAX_MESSAGE
+from diff_engine import merge_changes
+from http_client import get_shared_client
+from metrics import NOTIFICATIONS, NOTIFY_COALESCED, NOTIFY_DURATION, NOTIFY_RESULTS, NOTIFY_QUEUE_DEPTH
+from profiling import record
+
+
+class NotificationDispatcher:
+    # delivers notifications from a background thread, so a burst of changes never stalls polling.
+    # failed notifications are queued again after a backoff (the thread goes on with the others meanwhile)
+    # and finally written to a spool file, which is sent again the next time the script starts.
+    # notifications ntfy rejects (a 4xx other than 429) would be rejected again, they are dropped
+
+    def __init__(self, http=None, queue_size=NOTIFY_QUEUE_SIZE, max_retries=NOTIFY_MAX_RETRIES, spool_path=NOTIFY_SPOOL,
+                 backoff_base=NOTIFY_BACKOFF_BASE, backoff_max=NOTIFY_BACKOFF_MAX):
+        self.http = http or get_shared_client()
+        self.queue = queue.Queue(maxsize=queue_size)
+        NOTIFY_QUEUE_DEPTH.function = self.queue.qsize
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.spool_path = spool_path
+        self._spool_lock = threading.Lock()
+        self.undelivered = 0  # notifications of this run that were spooled (or dropped) instead of sent
+        # notifications waiting for their next attempt. they count as unfinished queue tasks until then,
+        # so flush() waits for them too
+        self._delayed = {}
+        self._delayed_ids = itertools.count()
+        self._delayed_lock = threading.Lock()
+
+        self._thread = threading.Thread(target=self._worker, name="notifier", daemon=True)
+        self._thread.start()
+        self._resend_spool()
+
+    def enqueue(self, notification):
+        try:
+            self.queue.put_nowait(notification)
+        except queue.Full:
+            print("⚠️ Notification queue is full, spooling notification")
+            self._spool(notification)
+
+    def flush(self, timeout=None):
+        # waits until everything queued so far was delivered (or spooled)
+        deadline = time.time() + timeout if timeout is not None else None
+        with self.queue.all_tasks_done:
+            while self.queue.unfinished_tasks:
+                remaining = deadline - time.time() if deadline is not None else None
+                if remaining is not None and remaining <= 0:
+                    return False
+                self.queue.all_tasks_done.wait(remaining)
+        return True
+
+    def close(self, timeout=10):
+        if self.flush(timeout):
+            return
+
+        # whatever is still waiting goes to the spool so it is not lost
+        with self._delayed_lock:
+            delayed = list(self._delayed.values())
+            self._delayed.clear()
+        for notification in delayed:
+            self._spool(notification)
+            self.queue.task_done()
+        while True:
+            try:
+                notification = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            self._spool(notification)
+            self.queue.task_done()
+
+    def _worker(self):
+        while True:
+            notification = self.queue.get()
+            start = time.perf_counter()
+            delay = None
+            try:
+                delay = self._deliver(notification)
+            except Exception as e:
+                print(f"⚠️ Error sending notification: {e}")
+            finally:
+                NOTIFY_DURATION.observe(value=time.perf_counter() - start)
+                if delay is None:
+                    self.queue.task_done()
+                else:
+                    self._retry_later(notification, delay)
+
+    def _deliver(self, notification):
+        # one attempt. returns the delay before the next one, or None when the notification is done with
+        attempt = notification.get("attempt", 0)
+        try:
+            response = self.http.post(
+                notification["url"],
+                # headers must be latin-1, so title / priority / tags go in the query string (supported by ntfy)
+                params={
+                    "title": notification["title"],
+                    "priority": notification["priority"],
+                    "tags": notification["tags"],
+                },
+                data=notification["message"].encode("utf-8"),
+            )
+            if response.status_code < 400:
+                NOTIFY_RESULTS.inc("sent")
+                print("✅ Notification sent!")
+                return None
+            error = f"HTTP {response.status_code}"
+            if response.status_code < 500 and response.status_code != 429:
+                # retrying won't help, and neither would resending it on the next start
+                print(f"❌ Notification rejected: {error}")
+                NOTIFY_RESULTS.inc("dropped")
+                with self._spool_lock:
+                    self.undelivered += 1
+                return None
+        except Exception as e:
+            error = str(e)
+
+        if attempt < self.max_retries:
+            notification["attempt"] = attempt + 1
+            return min(self.backoff_max, self.backoff_base * 2 ** attempt) * random.uniform(0.5, 1)
+
+        print(f"❌ Failed to send notification: {error}")
+        NOTIFY_RESULTS.inc("spooled")
+        self._spool(notification)
+        return None
+
+    def _retry_later(self, notification, delay):
+        # the notification goes back in the queue after the delay, the worker doesn't wait for it
+        delayed_id = next(self._delayed_ids)
+        with self._delayed_lock:
+            self._delayed[delayed_id] = notification
+        _get_timer().schedule(time.time() + delay, partial(self._requeue, delayed_id))
+
+    def _requeue(self, delayed_id):
+        with self._delayed_lock:
+            notification = self._delayed.pop(delayed_id, None)
+        if notification is None:
+            return  # spooled by close()
+        self.enqueue(notification)  # before task_done(), so flush() doesn't see an empty queue in between
+        self.queue.task_done()
+
+    def _spool(self, notification):
+        with self._spool_lock:
+            self.undelivered += 1
+        if not self.spool_path:
+            return
+        notification = {key: value for key, value in notification.items() if key != "attempt"}  # all again next start
+        with self._spool_lock:
+            with open(self.spool_path, "a", encoding="utf-8") as file:
+                file.write(json.dumps(notification, ensure_ascii=False) + "\n")
+
+    def _resend_spool(self):
+        if not self.spool_path or not os.path.exists(self.spool_path):
+            return
+
+        with self._spool_lock:
+            with open(self.spool_path, "r", encoding="utf-8") as file:
+                lines = file.readlines()
+            os.remove(self.spool_path)
+
+        pending = [json.loads(line) for line in lines if line.strip()]
+        if pending:
+            print(f"📬 Resending {len(pending)} undelivered notifications")
+        for notification in pending:
+            self.enqueue(notification)
+
+
+_shared_dispatcher = None
+_shared_lock = threading.Lock()
+
+
+def get_shared_dispatcher():
+    global _shared_dispatcher
+    with _shared_lock:
+        if _shared_dispatcher is None:
+            _shared_dispatcher = NotificationDispatcher()
+        return _shared_dispatcher
+
 
 class Notifier:
-    def __init__(self):
-        self.ntfy_url = os.getenv("NTFY_URL")
+    def __init__(self, ntfy_url=None, title_prefix="", dispatcher=None, account=None):
+        self.ntfy_url = ntfy_url or os.getenv("NTFY_URL")
+        self.title_prefix = title_prefix  # tells accounts apart when several share one ntfy topic
+        self.account = account or os.getenv("MALSHAB_ID") or ""  # metrics label
+        self.dispatcher = dispatcher or get_shared_dispatcher()
 
     # you can modify this function to send notifications to other services :)
     # for example, you can use the Telegram API to send notifications to a bot
     # for this script, i used ntfy.sh to send notifications to my phone (push)
 
     def send_notification(self, title, message, priority="default", tags="loudspeaker"):
+        # only queues the notification, delivery happens on the dispatcher thread
+        NOTIFICATIONS.inc(self.account)
+        self.dispatcher.enqueue({
+            "url": self.ntfy_url,
+            "title": f"{self.title_prefix}{title}",
+            "message": message,
+            "priority": priority,
+            "tags": tags,
+        })
+
+    def flush(self, timeout=None):
+        return self.dispatcher.flush(timeout)
+
+    def close(self):
+        self.dispatcher.close()
+
+
+# digest order, most important first. categories that are not listed go last
+CATEGORY_ORDER = ("summon_added", "summon_removed", "summon_changed", "case_added", "case_changed", "case_removed",
+                  "crm", "score", "questionnaire", "user_data")
+PRIORITY_ORDER = ("min", "low", "default", "high", "max")
+
+
+class NotificationCoalescer:
+    # sits between the change detectors of one account and its Notifier: notifications are collected for
+    # `window` seconds and sent as one digest. a second notification about the same item (same key) replaces
+    # the first, with the changes of both merged, so a value that flapped back and forth is not sent at all.
+    # urgent categories skip the window
+
+    def __init__(self, notifier, window=NOTIFY_DIGEST_WINDOW, urgent=NOTIFY_URGENT, max_message=NOTIFY_MAX_MESSAGE):
+        self.notifier = notifier
+        self.dispatcher = notifier.dispatcher
+        self.window = window
+        self.urgent = set(urgent)
+        self.max_message = max_message
+        self._pending = {}  # key -> notification, in arrival order
+        self._scheduled = False
+        self._lock = threading.Lock()
+
+    def send_notification(self, title, message, priority="default", tags="loudspeaker",
+                          category=None, key=None, changes=None, render=None):
+        # key: identifies the item the notification is about, changes: its Change list and
+        # render(changes) -> (title, message), used to rebuild the message after a merge
+        start = time.perf_counter()
         try:
-            curl_command = [
-                "curl",
-                "-H", f"Title: {title}",
-                "-H", f"Priority: {priority}",
-                "-H", f"Tags: {tags}",
-                "-d", message,
-                self.ntfy_url
-            ]
-            result = subprocess.run(curl_command, capture_output=True, text=True, encoding="utf-8")  # Fix encoding
-            if result.returncode == 0:
-                print("✅ Notification sent!")
-            else:
-                print(f"❌ Failed to send notification: {result.stderr.encode(sys.stdout.encoding, errors='replace').decode()}")
-        except Exception as e:
-            print(f"⚠️ Error sending notification: {e}")
\ No newline at end of file
+            self._add(title, message, priority, tags, category, key, changes, render)
+        finally:
+            record("notify", time.perf_counter() - start)
+
+    def _add(self, title, message, priority, tags, category, key, changes, render):
+        if not self.window or category in self.urgent:
+            self.notifier.send_notification(title, message, priority, tags)
+            return
+
+        with self._lock:
+            key = key if key is not None else (category, title, message)  # identical notifications are sent once
+            previous = self._pending.get(key)
+            if previous is not None:
+                NOTIFY_COALESCED.inc(self.notifier.account)
+                if changes is not None and previous["changes"] is not None and render is not None:
+                    changes = merge_changes(previous["changes"], changes)
+                    if not changes:
+                        del self._pending[key]  # everything went back to how it was
+                        return
+                    title, message = render(changes)
+
+            self._pending[key] = {"title": title, "message": message, "priority": priority, "tags": tags,
+                                  "category": category, "changes": changes}
+            if not self._scheduled:
+                self._scheduled = True
+                _get_timer().schedule(time.time() + self.window, self.send_pending)
+
+    def send_pending(self):
+        with self._lock:
+            pending = list(self._pending.values())
+            self._pending.clear()
+            self._scheduled = False
+
+        if not pending:
+            return
+        if len(pending) == 1:
+            item = pending[0]
+            self.notifier.send_notification(item["title"], item["message"], item["priority"], item["tags"])
+            return
+
+        pending.sort(key=_digest_rank)
+        NOTIFY_COALESCED.inc(self.notifier.account, amount=len(pending) - 1)
+        for chunk in self._chunks(pending):
+            priority = max((item["priority"] for item in chunk), key=_priority_rank)
+            message = "\n\n".join(f"{item['title']}\n{item['message']}" for item in chunk)
+            self.notifier.send_notification(f"📬 {len(chunk)} updates", message, priority, "loudspeaker")
+
+    def _chunks(self, items):
+        # splits a digest so every message stays under max_message bytes
+        chunk, size = [], 0
+        for item in items:
+            item_size = len(f"{item['title']}\n{item['message']}\n\n".encode("utf-8"))
+            if chunk and size + item_size > self.max_message:
+                yield chunk
+                chunk, size = [], 0
+            chunk.append(item)
+            size += item_size
+        if chunk:
+            yield chunk
+
+    def flush(self, timeout=None):
+        self.send_pending()
+        return self.notifier.flush(timeout)
+
+    def close(self):
+        self.send_pending()
+        self.notifier.close()
+
+
+def _priority_rank(priority):
+    return PRIORITY_ORDER.index(priority) if priority in PRIORITY_ORDER else PRIORITY_ORDER.index("default")
+
+
+def _digest_rank(item):
+    category = item["category"]
+    return (-_priority_rank(item["priority"]),
+            CATEGORY_ORDER.index(category) if category in CATEGORY_ORDER else len(CATEGORY_ORDER))
+
+
+class _Timer:
+    # one thread runs the delayed work of every account: it closes the digest windows and queues
+    # notifications again for their next delivery attempt
+
+    def __init__(self):
+        self._heap = []  # (when, sequence, callback)
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+        threading.Thread(target=self._run, name="notify-timer", daemon=True).start()
+
+    def schedule(self, when, callback):
+        with self._condition:
+            heapq.heappush(self._heap, (when, next(self._sequence), callback))
+            self._condition.notify()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._heap or self._heap[0][0] > time.time():
+                    self._condition.wait(self._heap[0][0] - time.time() if self._heap else None)
+                _, _, callback = heapq.heappop(self._heap)
+            try:
+                callback()
+            except Exception as e:
+                print(f"⚠️ Error in a scheduled notification task: {e}")
+
+
+_timer = None
+
+
+def _get_timer():
+    global _timer
+    with _shared_lock:
+        if _timer is None:
+            _timer = _Timer()
+        return _timer
@@ -0,0 +1,107 @@
+import argparse
+import logging
+import sys
+import time
+
+# one check of one profile, then exit - for cron / systemd timers / serverless schedulers.
+# the state, the http cache and the token come from the previous run, so a run is usually one login-free
+# round of (mostly 304) requests. never prompts: missing credentials are an error, not a registration
+#
+# exit codes
+EXIT_OK = 0
+EXIT_ERROR = 1  # unexpected error
+EXIT_CONFIG = 2  # missing credentials / state store
+EXIT_AUTH = 3  # login failed, the credentials need to be registered again
+EXIT_PARTIAL = 4  # some endpoints could not be fetched, they are checked again on the next run
+EXIT_UNDELIVERED = 5  # notifications were spooled (resent by the next run) or rejected by ntfy
+
+
+def _credentials(malshab_id=None):
+    # one account of ACCOUNTS_FILE (or of the credential store), or the account main.py registered
+    from config import ACCOUNTS_FILE
+    from credential_store import get_credential_store, env_credentials
+
+    if not malshab_id:
+        return env_credentials()
+    if ACCOUNTS_FILE:
+        from engine import load_accounts
+        account = next((account for account in load_accounts(ACCOUNTS_FILE) if account["malshab_id"] == malshab_id), None)
+        if account:
+            return account
+    store = get_credential_store()
+    return store.get(malshab_id) if store else None
+
+
+def run_once(malshab_id=None):
+    start = time.perf_counter()
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        datefmt='%Y-%m-%d %H:%M:%S'
+    )
+    logger = logging.getLogger(__name__)
+
+    from config import STATE_DB
+    credentials = _credentials(malshab_id)
+    if credentials is not None and not credentials.get("malshab_id"):
+        logger.error("❌ No account to check, set MALSHAB_ID in .env or pass --account")
+        return EXIT_CONFIG
+    if not credentials or not all(credentials.get(field) for field in ("malshab_id", "biometric_data", "uuid")):
+        logger.error("❌ Missing credentials, run main.py once to register (or check ACCOUNTS_FILE)")
+        return EXIT_CONFIG
+    if not STATE_DB:
+        logger.error("❌ STATE_DB is required, every run would take a new baseline without it")
+        return EXIT_CONFIG
+
+    # the heavy imports (requests and the rest of the client) only once the config is known to be usable
+    from api_client import MitgiaisimAPI
+    from auth import AuthClient
+    from main import MitgiaisimMonitor
+    from notifier import Notifier, NotificationCoalescer
+
+    try:
+        auth = AuthClient(credentials=credentials)  # ValueError if the last login rejected these credentials
+        auth.get_token()  # the stored token if it is still valid, a login otherwise
+    except Exception as e:
+        logger.error(f"❌ Login failed: {e}")
+        return EXIT_AUTH
+
+    notifier = Notifier(credentials.get("ntfy_url"), account=credentials["malshab_id"])
+    monitor = MitgiaisimMonitor(
+        api=MitgiaisimAPI(auth=auth),
+        notifier=NotificationCoalescer(notifier),  # closed at the end of the run, so the run is one digest
+        name=credentials.get("name") if malshab_id else None,
+    )
+    try:
+        if not monitor.load_state():
+            monitor.fetch_initial_data()  # first run: only the baseline, changes are reported from the next run on
+        results = monitor.check_for_updates()
+    except Exception as e:
+        logger.error(f"❌ Check failed: {e}", exc_info=True)
+        return EXIT_ERROR
+    finally:
+        monitor.notifier.close()  # sends the digest and waits for the delivery (or the spool)
+        if monitor.journal:
+            monitor.journal.close()
+        if monitor.store:
+            monitor.store.close()
+
+    failed = [name for name, changed in results.items() if changed is None]
+    logger.info(f"🏁 Done in {time.perf_counter() - start:.2f}s")
+    if notifier.dispatcher.undelivered:
+        return EXIT_UNDELIVERED
+    if failed:
+        logger.warning(f"⚠️ Not checked: {', '.join(failed)}")
+        return EXIT_PARTIAL
+    return EXIT_OK
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check one profile for updates once and exit")
+    parser.add_argument("--account", help="malshab id of an ACCOUNTS_FILE account (default: the .env account)")
+    args = parser.parse_args()
+    sys.exit(run_once(args.account))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,312 @@
+import contextvars
+import json
+import logging
+import os
+import signal
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+from config import PROFILE_DIR, PROFILE_CONTROL, PROFILE_CYCLES, PROFILE_MODE, PROFILE_MEMORY, PROFILE_SAMPLE_INTERVAL
+from config import SLOW_CYCLE_SECONDS
+
+# profiling of check cycles without a restart:
+# - kill -USR2 <pid>, or touch the PROFILE_CONTROL file (optionally with "cycles=10 mode=sample memory=1" in it),
+#   profiles the next PROFILE_CYCLES cycles (cProfile of the cycle thread, or stack samples of every thread,
+#   plus tracemalloc if asked for)
+# - a cycle slower than SLOW_CYCLE_SECONDS saves its per stage timings, and stack samples of the part after the
+#   threshold was crossed
+# nothing is hooked while no profile is requested; every cycle only adds up a few perf_counter deltas per stage
+#
+# output: PROFILE_DIR/<time>-<account>-<reason>/stages.json (+ profile.pstats / profile.txt, stacks.folded, memory.txt)
+
+_current_stages = contextvars.ContextVar("stages", default=None)
+
+
+class Stages:
+    # seconds spent per stage of one cycle. network / decode are summed over the fetch threads,
+    # so they can add up to more than the cycle took
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.seconds = {}
+        self.counts = {}
+
+    def add(self, name, seconds):
+        with self._lock:
+            self.seconds[name] = self.seconds.get(name, 0) + seconds
+            self.counts[name] = self.counts.get(name, 0) + 1
+
+    def as_dict(self):
+        with self._lock:
+            return {name: {"seconds": round(seconds, 6), "count": self.counts[name]}
+                    for name, seconds in sorted(self.seconds.items(), key=lambda item: -item[1])}
+
+
+def record(stage, seconds):
+    # adds to the stages of the cycle running in this context (fetch threads get it through copy_context)
+    stages = _current_stages.get()
+    if stages is not None:
+        stages.add(stage, seconds)
+
+
+class StackSampler:
+    # samples the stacks of every thread every `interval` seconds; counts are kept as folded stacks
+    # ("thread;file:function;file:function ..."), the input format of flamegraph.pl / speedscope
+
+    def __init__(self, interval=PROFILE_SAMPLE_INTERVAL):
+        self.interval = interval
+        self.counts = Counter()
+        self._lock = threading.Lock()
+        self._users = 0
+        self._thread = None
+
+    def acquire(self):
+        with self._lock:
+            self._users += 1
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+                self._thread.start()
+            return Counter(self.counts)  # baseline, subtracted from the snapshot when done
+
+    def release(self, baseline):
+        with self._lock:
+            stacks = self.counts - baseline
+            self._users -= 1
+            if not self._users:
+                self._thread = None  # the sampling thread notices and exits
+                self.counts = Counter()
+            return stacks
+
+    def _run(self):
+        me = threading.get_ident()
+        while True:
+            time.sleep(self.interval)
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            stacks = []
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                calls = []
+                while frame is not None:
+                    calls.append(f"{os.path.basename(frame.f_code.co_filename)}:{frame.f_code.co_name}")
+                    frame = frame.f_back
+                stacks.append(";".join([names.get(ident, str(ident))] + calls[::-1]))
+            with self._lock:
+                if self._thread is not threading.current_thread():
+                    return
+                self.counts.update(stacks)
+
+
+class Profiler:
+    def __init__(self, directory=PROFILE_DIR, control_file=PROFILE_CONTROL, slow_seconds=SLOW_CYCLE_SECONDS):
+        self.directory = directory
+        self.control_file = control_file
+        self.slow_seconds = slow_seconds
+        self.sampler = StackSampler()
+        self.logger = logging.getLogger(__name__)
+
+        self._lock = threading.Lock()
+        self._remaining = 0  # cycles still to profile
+        self._mode = PROFILE_MODE
+        self._memory = PROFILE_MEMORY
+        self._profiling = False  # one profiled cycle at a time (cProfile / tracemalloc are process wide)
+        self._started_tracemalloc = False
+        self._control_seen = time.time()  # a control file from before the start doesn't count
+        self._control_checked = 0
+        self._running = {}  # cycle id -> [start, account, sampler baseline or None]
+        self._watchdog = None
+
+    def request(self, cycles=PROFILE_CYCLES, mode=PROFILE_MODE, memory=PROFILE_MEMORY):
+        with self._lock:
+            self._remaining = max(1, cycles)
+            self._mode = mode if mode in ("cprofile", "sample") else "cprofile"
+            self._memory = memory
+        self.logger.info(f"🔬 Profiling the next {cycles} cycles ({self._mode}{', tracemalloc' if memory else ''})")
+
+    def install_signal(self):
+        # signal handlers can only be set from the main thread
+        if hasattr(signal, "SIGUSR2") and threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGUSR2, lambda signum, frame: self.request())
+
+    @contextmanager
+    def cycle(self, account):
+        self._check_control_file()
+        stages = Stages()
+        token = _current_stages.set(stages)
+        session = self._begin()
+        start = time.perf_counter()
+        cycle_id = object()
+        if self.slow_seconds:
+            self._watch(cycle_id, account, start)
+        try:
+            yield stages
+        finally:
+            elapsed = time.perf_counter() - start
+            _current_stages.reset(token)
+            late_stacks = self._unwatch(cycle_id) if self.slow_seconds else None
+            files = self._end(session) if session else {}
+
+            if session:
+                self._save(account, "profile", elapsed, stages, files)
+            elif self.slow_seconds and elapsed > self.slow_seconds:
+                if late_stacks:
+                    files["stacks.folded"] = _folded(late_stacks)
+                path = self._save(account, "slow", elapsed, stages, files)
+                self.logger.warning(f"🐢 [{account}] Slow cycle ({elapsed:.1f}s), timings saved to {path}")
+
+    def _begin(self):
+        with self._lock:
+            if not self._remaining or self._profiling:
+                return None
+            self._remaining -= 1
+            self._profiling = True
+            mode, memory = self._mode, self._memory
+
+        session = {"mode": mode, "memory": memory}
+        try:
+            return self._start_session(session)
+        except Exception as e:
+            self.logger.error(f"❌ Failed to start profiling: {e}")  # e.g. another profiler is active
+            with self._lock:
+                self._profiling = False
+            return None
+
+    def _start_session(self, session):
+        if session["memory"]:
+            import tracemalloc
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(25)
+                self._started_tracemalloc = True
+            session["snapshot"] = _snapshot()
+        if session["mode"] == "sample":
+            session["baseline"] = self.sampler.acquire()
+        else:
+            import cProfile
+            session["profile"] = cProfile.Profile()
+            session["profile"].enable()
+        return session
+
+    def _end(self, session):
+        files = {}
+        try:
+            if "profile" in session:
+                import io
+                import pstats
+                profile = session["profile"]
+                profile.disable()
+                files["profile.pstats"] = profile
+                summary = io.StringIO()
+                pstats.Stats(profile, stream=summary).sort_stats("cumulative").print_stats(40)
+                files["profile.txt"] = summary.getvalue()
+            else:
+                files["stacks.folded"] = _folded(self.sampler.release(session["baseline"]))
+
+            if session["memory"]:
+                import tracemalloc
+                difference = _snapshot().compare_to(session["snapshot"], "lineno")
+                files["memory.txt"] = "\n".join(str(stat) for stat in difference[:30]) + "\n"
+        finally:
+            with self._lock:
+                self._profiling = False
+                done = not self._remaining
+            if done and self._started_tracemalloc:
+                import tracemalloc
+                tracemalloc.stop()
+                self._started_tracemalloc = False
+        return files
+
+    def _save(self, account, reason, elapsed, stages, files):
+        now = time.time()
+        stamp = f"{time.strftime('%Y%m%d-%H%M%S', time.localtime(now))}.{int(now * 1000) % 1000:03d}"
+        path = os.path.join(self.directory, f"{stamp}-{account}-{reason}")
+        try:
+            os.makedirs(path, exist_ok=True)
+            with open(os.path.join(path, "stages.json"), "w", encoding="utf-8") as file:
+                json.dump({"account": account, "reason": reason, "seconds": round(elapsed, 6),
+                           "stages": stages.as_dict()}, file, indent=2)
+            for name, content in files.items():
+                if name.endswith(".pstats"):
+                    content.dump_stats(os.path.join(path, name))
+                else:
+                    with open(os.path.join(path, name), "w", encoding="utf-8") as file:
+                        file.write(content)
+        except OSError as e:
+            self.logger.error(f"❌ Failed to save the profile: {e}")
+        return path
+
+    def _check_control_file(self):
+        # at most one stat() a second, however many accounts are cycling
+        now = time.time()
+        if not self.control_file or now - self._control_checked < 1:
+            return
+        self._control_checked = now
+        try:
+            mtime = os.path.getmtime(self.control_file)
+        except OSError:
+            return
+        if mtime <= self._control_seen:
+            return
+        self._control_seen = mtime  # every process that sees the new mtime profiles (all supervisor workers)
+
+        options = {}
+        try:
+            with open(self.control_file, "r", encoding="utf-8") as file:
+                options = dict(part.split("=", 1) for part in file.read().split() if "=" in part)
+        except OSError:
+            pass
+        self.request(
+            cycles=int(options.get("cycles", PROFILE_CYCLES)),
+            mode=options.get("mode", PROFILE_MODE),
+            memory=options.get("memory", str(PROFILE_MEMORY)).lower() in ("1", "true", "yes"),
+        )
+
+    def _watch(self, cycle_id, account, start):
+        with self._lock:
+            self._running[cycle_id] = [start, account, None]
+            if self._watchdog is None:
+                self._watchdog = threading.Thread(target=self._watch_cycles, name="profile-watchdog", daemon=True)
+                self._watchdog.start()
+
+    def _unwatch(self, cycle_id):
+        with self._lock:
+            _, _, baseline = self._running.pop(cycle_id)
+        return self.sampler.release(baseline) if baseline is not None else None
+
+    def _watch_cycles(self):
+        # starts sampling the stacks of cycles that ran past SLOW_CYCLE_SECONDS, so a slow cycle's
+        # capture shows where the rest of its time went
+        while True:
+            time.sleep(max(0.05, self.slow_seconds / 4))
+            now = time.perf_counter()
+            with self._lock:  # under the lock, so a cycle can't finish between the check and the acquire
+                for entry in self._running.values():
+                    if entry[2] is None and now - entry[0] > self.slow_seconds:
+                        entry[2] = self.sampler.acquire()
+
+
+def _snapshot():
+    import tracemalloc
+    # without the profiler's own allocations (the stack samples)
+    return tracemalloc.take_snapshot().filter_traces([
+        tracemalloc.Filter(False, __file__),
+        tracemalloc.Filter(False, tracemalloc.__file__),
+    ])
+
+
+def _folded(stacks):
+    return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+
+_profiler = None
+_profiler_lock = threading.Lock()
+
+
+def get_profiler():
+    global _profiler
+    with _profiler_lock:
+        if _profiler is None:
+            _profiler = Profiler()
+        return _profiler
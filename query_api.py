@@ -0,0 +1,293 @@
+import hmac
+import json
+import logging
+import queue
+import threading
+import time
+from collections import deque
+from urllib.parse import urlsplit, parse_qs
+
+from compact_state import encode
+from config import QUERY_TOKEN, QUERY_REFRESH_MIN_AGE, QUERY_REFRESH_WAIT, QUERY_EVENT_BACKLOG
+
+# a local http api over the state the monitor already tracks, so dashboards and scripts don't call the
+# mitgaisim api themselves (every extra login there ends the app's session):
+#   GET  /accounts                          the accounts with the time every endpoint was last checked
+#   GET  /accounts/<id>                     all tracked state of an account (<id> is the malshab id or the name)
+#   GET  /accounts/<id>/<kind>              one kind: cases, summons, scores, questionnaires, user_data, crm
+#   POST /accounts/<id>/refresh             check now (?endpoints=cases,crm to pick, ?wait=10 to answer after the check)
+#   GET  /accounts/<id>/events, /events     server-sent events of every change and check
+# responses come from memory and are encoded once per check, however many clients ask (ETag / If-None-Match too)
+
+# kind -> the endpoint its freshness comes from
+KINDS = {
+    "cases": "cases",
+    "summons": "summons",
+    "scores": "quality",
+    "questionnaires": "questionnaires",
+    "user_data": "user_data",
+    "crm": "crm",
+}
+KEEPALIVE = 15  # seconds between comments on an idle event stream, so proxies don't close it
+_BOOT = f"{int(time.time()):x}"  # part of every ETag, versions start over with the process
+
+
+def _dumps(value):
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"), default=encode).encode("utf-8")
+
+
+class ChangeFeed:
+    # fans the events of every monitor out to the event stream subscribers. an event is encoded once
+    # however many clients listen, and the last `backlog` are kept so a client that reconnects with
+    # Last-Event-ID gets what it missed. a client too slow to keep up is dropped (and reconnects)
+
+    def __init__(self, backlog=QUERY_EVENT_BACKLOG, queue_size=1000):
+        self.queue_size = queue_size
+        self._events = deque(maxlen=backlog)  # (id, account, encoded event)
+        self._subscribers = {}  # queue -> account or None (all)
+        self._next_id = 1
+        self._lock = threading.Lock()
+
+    def publish(self, account, event, data):
+        with self._lock:
+            event_id = self._next_id
+            self._next_id += 1
+            message = f"id: {event_id}\nevent: {event}\ndata: ".encode("utf-8") + _dumps(data) + b"\n\n"
+            self._events.append((event_id, account, message))
+            for subscriber, wanted in list(self._subscribers.items()):
+                if wanted is not None and wanted != account:
+                    continue
+                try:
+                    subscriber.put_nowait(message)
+                except queue.Full:
+                    del self._subscribers[subscriber]
+                    with subscriber.mutex:  # replaces what it didn't read with the signal to close the stream
+                        subscriber.queue.clear()
+                        subscriber.queue.append(None)
+                        subscriber.not_empty.notify()
+
+    def publish_changes(self, account, entity, changes):
+        for change in changes:
+            data = {"account": account, "entity": entity, "op": change.op, "key": change.key, "field": change.field,
+                    "old": change.old, "new": change.new}
+            if change.item is not None:
+                data["item"] = change.item
+            self.publish(account, "change", data)
+
+    def subscribe(self, account=None, last_id=None):
+        # returns the queue and the missed events, or None as the missed events when they are no longer kept
+        subscriber = queue.Queue(self.queue_size)
+        with self._lock:
+            missed = []
+            if last_id is not None:
+                # events that are no longer kept, or an id from before a restart (ids start over)
+                if (self._events and self._events[0][0] > last_id + 1) or last_id >= self._next_id:
+                    missed = None
+                else:
+                    missed = [message for event_id, event_account, message in self._events
+                              if event_id > last_id and account in (None, event_account)]
+            self._subscribers[subscriber] = account
+        return subscriber, missed
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.pop(subscriber, None)
+
+
+class QueryAPI:
+    def __init__(self, monitors, feed=None, token=QUERY_TOKEN, refresh_min_age=QUERY_REFRESH_MIN_AGE,
+                 refresh_wait=QUERY_REFRESH_WAIT):
+        self.feed = feed or ChangeFeed()
+        self.token = token
+        self.refresh_min_age = refresh_min_age
+        self.refresh_wait = refresh_wait
+        self.monitors = {}
+        for monitor in monitors:
+            monitor.feed = self.feed  # the monitors publish their view and changes from now on
+            self.monitors[str(monitor.api.auth.malshab_id)] = monitor
+            if monitor.name:
+                self.monitors.setdefault(monitor.name, monitor)
+        self._encoded = {}  # malshab id -> (view, {kind: body})
+        self._lock = threading.Lock()
+        self.logger = logging.getLogger(__name__)
+
+    def authorized(self, header):
+        return not self.token or hmac.compare_digest(header or "", f"Bearer {self.token}")
+
+    def accounts(self):
+        accounts = []
+        for monitor in {id(monitor): monitor for monitor in self.monitors.values()}.values():
+            view = monitor.view
+            accounts.append({
+                "account": monitor.api.auth.malshab_id,
+                "name": monitor.name,
+                "version": view["version"] if view else None,
+                "checked_at": view["checked_at"] if view else {},
+            })
+        return _dumps({"accounts": accounts})
+
+    def state(self, monitor, kind=None):
+        # (etag, body) of the account's last view, None before its state is loaded
+        view = monitor.view
+        if view is None:
+            return None
+        account = monitor.api.auth.malshab_id
+        with self._lock:
+            cached_view, bodies = self._encoded.get(account, (None, None))
+            if cached_view is not view:
+                bodies = {}
+                self._encoded[account] = (view, bodies)
+            body = bodies.get(kind)
+        if body is None:
+            body = self._encode(monitor, view, kind)
+            with self._lock:
+                bodies[kind] = body
+        return f'"{_BOOT}-{view["version"]}"', body
+
+    def _encode(self, monitor, view, kind):
+        common = {"account": monitor.api.auth.malshab_id, "name": monitor.name, "version": view["version"]}
+        if kind is None:
+            return _dumps({**common, "checked_at": view["checked_at"], "changed_at": view["changed_at"],
+                           "state": view["state"]})
+        endpoint = KINDS[kind]
+        return _dumps({**common, "kind": kind, "checked_at": view["checked_at"].get(endpoint),
+                       "changed_at": view["changed_at"].get(endpoint), "data": view["state"][kind]})
+
+    def refresh(self, monitor, endpoints, wait):
+        # moves the check of stale endpoints forward. endpoints checked in the last refresh_min_age seconds,
+        # and requests for endpoints that are already due, share the check that covers them
+        requested = time.time()
+        stale = monitor.request_refresh(endpoints, self.refresh_min_age)
+        pending = stale
+        if stale and wait:
+            def checked():
+                return [name for name in stale if monitor.attempted_at.get(name, 0) < requested]
+            with monitor.checked:
+                monitor.checked.wait_for(lambda: not checked(), min(wait, self.refresh_wait))
+                pending = checked()
+        return {"refreshing": stale, "pending": pending}
+
+
+def start_query_server(monitors, port, host="127.0.0.1", api=None):
+    from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler  # only when the api is enabled
+
+    api = api or QueryAPI(monitors)
+
+    class QueryHandler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def do_GET(self):
+            parts, query = self._route()
+            if parts is None:
+                return
+            if parts == ["accounts"]:
+                self._send(200, api.accounts())
+            elif parts == ["events"]:
+                self._stream(None)
+            elif len(parts) >= 2 and parts[0] == "accounts":
+                monitor = self._monitor(parts[1])
+                if monitor is None:
+                    return
+                if len(parts) == 3 and parts[2] == "events":
+                    self._stream(monitor.api.auth.malshab_id)
+                elif len(parts) == 2 or (len(parts) == 3 and parts[2] in KINDS):
+                    self._state(monitor, parts[2] if len(parts) == 3 else None)
+                else:
+                    self.send_error(404)
+            else:
+                self.send_error(404)
+
+        def do_POST(self):
+            parts, query = self._route()
+            if parts is None:
+                return
+            if len(parts) != 3 or parts[0] != "accounts" or parts[2] != "refresh":
+                self.send_error(404)
+                return
+            monitor = self._monitor(parts[1])
+            if monitor is None:
+                return
+            endpoints = [name for value in query.get("endpoints", []) for name in value.split(",") if name]
+            unknown = [name for name in endpoints if name not in monitor.scheduler.intervals]
+            if unknown:
+                self._send(400, _dumps({"error": f"unknown endpoints: {', '.join(unknown)}"}))
+                return
+            try:
+                wait = float(query.get("wait", ["0"])[0])
+            except ValueError:
+                wait = 0
+            result = api.refresh(monitor, endpoints or None, wait)
+            self._send(202 if result["pending"] else 200, _dumps(result))
+
+        def _route(self):
+            if not api.authorized(self.headers.get("Authorization")):
+                self.send_error(401)
+                return None, None
+            url = urlsplit(self.path)
+            return [part for part in url.path.split("/") if part], parse_qs(url.query)
+
+        def _monitor(self, account):
+            monitor = api.monitors.get(account)
+            if monitor is None:
+                self.send_error(404, "Unknown account")
+            return monitor
+
+        def _state(self, monitor, kind):
+            result = api.state(monitor, kind)
+            if result is None:
+                self._send(503, _dumps({"error": "the state is not loaded yet"}), {"Retry-After": "5"})
+                return
+            etag, body = result
+            if self.headers.get("If-None-Match") == etag:
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.end_headers()
+                return
+            self._send(200, body, {"ETag": etag})
+
+        def _send(self, status, body, headers=None):
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _stream(self, account):
+            try:
+                last_id = int(self.headers.get("Last-Event-ID"))
+            except (TypeError, ValueError):
+                last_id = None
+            subscriber, missed = api.feed.subscribe(account, last_id)
+            try:
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Cache-Control", "no-cache")
+                self.end_headers()
+                if missed is None:
+                    # the missed events are gone, the client has to load the state again
+                    self.wfile.write(b"event: reset\ndata: {}\n\n")
+                else:
+                    self.wfile.writelines(missed)
+                self.wfile.flush()
+                while True:
+                    try:
+                        message = subscriber.get(timeout=KEEPALIVE)
+                    except queue.Empty:
+                        message = b": keepalive\n\n"
+                    if message is None:
+                        break  # fell behind, the client reconnects with its Last-Event-ID
+                    self.wfile.write(message)
+                    self.wfile.flush()
+            except OSError:
+                pass  # the client went away
+            finally:
+                api.feed.unsubscribe(subscriber)
+
+    server = ThreadingHTTPServer((host, port), QueryHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="query-api", daemon=True).start()
+    print(f"🔎 State API on http://{host}:{server.server_port}/accounts")
+    return server
@@ -0,0 +1,159 @@
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+from config import RATE_LIMIT, RATE_BURST, BREAKER_FAILURES, BREAKER_RESET, RETRY_BASE_DELAY, RETRY_MAX_DELAY
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+class TokenBucket:
+    # request rate limit shared by every account, `rate` requests per second with bursts up to `capacity`
+
+    def __init__(self, rate=RATE_LIMIT, capacity=RATE_BURST):
+        self.rate = rate
+        self.capacity = max(1, capacity)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if self.rate <= 0:
+            return
+
+        wait = self._reserve()
+        if wait:
+            time.sleep(wait)
+
+    def _reserve(self):
+        # returns how long to wait for the reserved token
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            # the token is reserved right away (the balance may go negative), so waiters are served in order
+            self.tokens -= 1
+            return -self.tokens / self.rate if self.tokens < 0 else 0
+
+
+class SharedTokenBucket(TokenBucket):
+    # the same bucket kept in shared memory, so every worker process of the supervisor draws from one budget.
+    # created in the parent and handed to the workers when they start
+
+    def __init__(self, rate=RATE_LIMIT, capacity=RATE_BURST, context=None):
+        self.rate = rate
+        self.capacity = max(1, capacity)
+        if context is None:
+            import multiprocessing  # only the supervisor needs it
+            context = multiprocessing.get_context()
+        self._state = context.Array("d", [self.capacity, time.monotonic()])  # tokens, updated (monotonic is system wide)
+
+    def _reserve(self):
+        with self._state.get_lock():
+            now = time.monotonic()
+            tokens = min(self.capacity, self._state[0] + (now - self._state[1]) * self.rate) - 1
+            self._state[0] = tokens
+            self._state[1] = now
+        return -tokens / self.rate if tokens < 0 else 0
+
+
+class CircuitBreaker:
+    # stops calling an upstream endpoint after `failure_threshold` failures in a row.
+    # after `reset_timeout` seconds a single request is let through (half open): success closes the circuit again,
+    # failure opens it for another `reset_timeout`
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, name, failure_threshold=BREAKER_FAILURES, reset_timeout=BREAKER_RESET):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.open_until = 0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.time() >= self.open_until:
+                self.state = self.HALF_OPEN
+                self._probing = False
+            if self.state == self.HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            if self.state != self.CLOSED:
+                print(f"✅ {self.name} is back, closing circuit")
+            self.state = self.CLOSED
+            self.failures = 0
+            self._probing = False
+
+    def record_failure(self, retry_after=None):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold or retry_after:
+                self._open(max(self.reset_timeout, retry_after or 0))
+
+    def _open(self, duration):
+        if self.state != self.OPEN:
+            print(f"🚧 {self.name} is failing, pausing requests for {duration:.0f}s")
+        self.state = self.OPEN
+        self.open_until = time.time() + duration
+        self._probing = False
+
+
+def retry_after_seconds(response):
+    # Retry-After is either a number of seconds or an http date
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt, base=RETRY_BASE_DELAY, cap=RETRY_MAX_DELAY):
+    # exponential backoff with full jitter
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+_rate_limiter = None
+_breakers = {}
+_shared_lock = threading.Lock()
+
+
+def get_rate_limiter():
+    global _rate_limiter
+    with _shared_lock:
+        if _rate_limiter is None:
+            _rate_limiter = TokenBucket()
+        return _rate_limiter
+
+
+def set_rate_limiter(limiter):
+    # anything with an acquire() method, e.g. a limiter shared between processes
+    global _rate_limiter
+    with _shared_lock:
+        _rate_limiter = limiter
+
+
+def get_breaker(name):
+    # one breaker per upstream endpoint, shared by every account
+    with _shared_lock:
+        if name not in _breakers:
+            _breakers[name] = CircuitBreaker(name)
+        return _breakers[name]
@@ -0,0 +1,67 @@
+import random
+import threading
+import time
+
+from config import SCHEDULE_MIN_INTERVAL, SCHEDULE_MAX_INTERVAL, SCHEDULE_HOT_INTERVAL, SCHEDULE_JITTER
+
+
+class AdaptiveScheduler:
+    # keeps a next due time for every endpoint of one account.
+    # an endpoint that changed is polled twice as often, one that didn't slowly backs off,
+    # both within [min_interval, max_interval]. "hot" endpoints (open cases) never wait longer than hot_interval.
+
+    def __init__(self, endpoints, interval, min_interval=SCHEDULE_MIN_INTERVAL, max_interval=SCHEDULE_MAX_INTERVAL,
+                 hot_interval=SCHEDULE_HOT_INTERVAL, jitter=SCHEDULE_JITTER, backoff=1.5):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.hot_interval = hot_interval
+        self.jitter = jitter
+        self.backoff = backoff
+        self.intervals = {name: min(max(interval, min_interval), max_interval) for name in endpoints}
+        self.next_due = {name: time.time() + self._jittered(self.intervals[name]) for name in endpoints}
+        self.triggered = {}  # endpoint -> time of the last trigger() not yet covered by a check
+        self.on_trigger = None  # called after trigger(), wakes whoever waits for the next due time
+        self._lock = threading.Lock()
+
+    def due(self, now=None):
+        now = time.time() if now is None else now
+        with self._lock:
+            return [name for name, due in self.next_due.items() if due <= now]
+
+    def next_wakeup(self):
+        with self._lock:
+            return min(self.next_due.values())
+
+    def record(self, name, changed, hot=False, now=None, started=None):
+        # changed is None when the fetch failed, the interval is kept as is.
+        # started: when the check began. an endpoint triggered after that is still due, the check came too early for it
+        now = time.time() if now is None else now
+        with self._lock:
+            interval = self.intervals[name]
+            if changed:
+                interval = max(self.min_interval, interval / 2)
+            elif changed is not None:
+                interval = min(self.max_interval, interval * self.backoff)
+            self.intervals[name] = interval
+
+            if hot:
+                interval = min(interval, self.hot_interval)
+            self.next_due[name] = now + self._jittered(interval)
+            if started is not None and self.triggered.get(name, 0) > started:
+                self.next_due[name] = now
+            else:
+                self.triggered.pop(name, None)
+
+    def trigger(self, names=None):
+        # makes endpoints due right away
+        now = time.time()
+        with self._lock:
+            for name in names or self.next_due:
+                self.next_due[name] = now
+                self.triggered[name] = now
+        if self.on_trigger:
+            self.on_trigger()
+
+    def _jittered(self, interval):
+        # spread the requests so many accounts don't hit the api at the same moment
+        return interval * random.uniform(1 - self.jitter, 1 + self.jitter)
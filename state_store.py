@@ -0,0 +1,71 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+
+from compact_state import encode
+from config import STATE_DB
+
+
+class StateStore:
+    # keeps the last seen state of every account on disk, so a restart continues from where
+    # it stopped instead of taking a new baseline (and missing whatever changed in between)
+
+    def __init__(self, path=STATE_DB):
+        self._lock = threading.Lock()
+        # the supervisor's worker processes share the file, so wait for their writes
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._written = {}  # (account, kind) -> digest of the data currently on disk
+
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS snapshots ("
+                "account TEXT NOT NULL, "
+                "kind TEXT NOT NULL, "
+                "data TEXT NOT NULL, "
+                "updated_at REAL NOT NULL, "
+                "PRIMARY KEY (account, kind))"
+            )
+
+    def load(self, account):
+        with self._lock:
+            rows = self._conn.execute("SELECT kind, data FROM snapshots WHERE account = ?", (account,)).fetchall()
+
+        snapshot = {}
+        for kind, data in rows:
+            snapshot[kind] = json.loads(data)
+            self._written[(account, kind)] = self._digest(data)
+        return snapshot
+
+    def save(self, account, snapshot):
+        # only the kinds that changed since the last write hit the disk
+        now = time.time()
+        rows = []
+        for kind, value in snapshot.items():
+            data = json.dumps(value, ensure_ascii=False, separators=(",", ":"), default=encode)
+            digest = self._digest(data)
+            if self._written.get((account, kind)) != digest:
+                rows.append((account, kind, data, now, digest))
+
+        if not rows:
+            return 0
+
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT INTO snapshots (account, kind, data, updated_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (account, kind) DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at",
+                [row[:4] for row in rows],
+            )
+        for account, kind, _, _, digest in rows:
+            self._written[(account, kind)] = digest
+        return len(rows)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    @staticmethod
+    def _digest(data):
+        return hashlib.blake2b(data.encode("utf-8"), digest_size=16).digest()
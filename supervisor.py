@@ -0,0 +1,185 @@
+import bisect
+import hashlib
+import logging
+import multiprocessing
+import os
+import signal
+import time
+
+from config import ACCOUNTS_FILE, SHARDS, SUPERVISOR_POLL, JOURNAL_DIR, NOTIFY_SPOOL, METRICS_PORT, METRICS_HOST
+from config import QUERY_PORT, QUERY_HOST
+from engine import MonitoringEngine, load_accounts
+from resilience import SharedTokenBucket, set_rate_limiter
+
+HEALTHY_AFTER = 300  # seconds a restarted worker has to stay up before its crash count is forgotten
+
+
+class HashRing:
+    # consistent hashing of malshab ids to shards: changing the number of shards only moves
+    # the accounts that land on the changed part of the ring, not almost all of them
+
+    def __init__(self, nodes, replicas=100):
+        self._ring = sorted((_hash(f"{node}#{replica}"), node) for node in nodes for replica in range(replicas))
+        self._hashes = [point for point, _ in self._ring]
+
+    def node(self, key):
+        return self._ring[bisect.bisect(self._hashes, _hash(key)) % len(self._ring)][1]
+
+
+def _hash(value):
+    return int.from_bytes(hashlib.blake2b(value.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+class Supervisor:
+    # runs the accounts file over several worker processes (one MonitoringEngine each, with its own
+    # http pool), so json decoding and diffing use every cpu core. crashed workers are restarted,
+    # and a changed accounts file only restarts the workers whose accounts changed.
+    # all workers share one upstream rate budget
+
+    def __init__(self, accounts_file=ACCOUNTS_FILE, shards=SHARDS, check_interval=300):
+        self.accounts_file = accounts_file
+        self.check_interval = check_interval
+        self.shards = [f"shard-{index}" for index in range(shards or os.cpu_count() or 1)]
+        self.ring = HashRing(self.shards)
+        self.context = multiprocessing.get_context("spawn")  # no fork of a process with threads
+        self.rate_limiter = SharedTokenBucket(context=self.context)
+
+        self.assignments = {}  # shard -> accounts
+        self.workers = {}  # shard -> process
+        self.started = {}  # shard -> start time
+        self.crashes = {}  # shard -> (crashes in a row, earliest restart time)
+        self._accounts_mtime = None
+        self.logger = logging.getLogger(__name__)
+
+    def run(self):
+        logging.basicConfig(
+            level=logging.INFO,
+            format='%(asctime)s - %(levelname)s - %(message)s',
+            datefmt='%Y-%m-%d %H:%M:%S'
+        )
+        signal.signal(signal.SIGTERM, _interrupt)
+        self.logger.info(f"🚀 Supervising {len(self.shards)} worker processes")
+
+        try:
+            while True:
+                self._reload_accounts()
+                self._check_workers()
+                time.sleep(SUPERVISOR_POLL)
+        except KeyboardInterrupt:
+            self.logger.info("🛑 Monitoring stopped by user")
+        finally:
+            for shard in list(self.workers):
+                self._stop(shard)
+
+    def _reload_accounts(self):
+        try:
+            mtime = os.path.getmtime(self.accounts_file)
+            if mtime == self._accounts_mtime:
+                return
+            accounts = load_accounts(self.accounts_file)
+        except (OSError, ValueError) as e:
+            self.logger.error(f"❌ Failed to read the accounts file: {e}")
+            return
+        self._accounts_mtime = mtime
+
+        assignments = {shard: [] for shard in self.shards}
+        for account in accounts:
+            assignments[self.ring.node(account["malshab_id"])].append(account)
+
+        moved = [shard for shard in self.shards if assignments[shard] != self.assignments.get(shard)]
+        for shard in moved:
+            self._stop(shard)  # started again with its new accounts by _check_workers
+            self.crashes.pop(shard, None)
+        self.assignments = assignments
+
+        if moved:
+            counts = ", ".join(f"{shard}: {len(assignments[shard])}" for shard in self.shards)
+            self.logger.info(f"⚖️ {len(accounts)} accounts ({counts})")
+
+    def _check_workers(self):
+        now = time.time()
+        for index, shard in enumerate(self.shards):
+            accounts = self.assignments.get(shard)
+            process = self.workers.get(shard)
+
+            if process is not None:
+                if process.is_alive():
+                    if now - self.started[shard] > HEALTHY_AFTER:
+                        self.crashes.pop(shard, None)
+                    continue
+
+                crashes = self.crashes.get(shard, (0, 0))[0] + 1
+                delay = min(60, 2 ** crashes)
+                self.crashes[shard] = (crashes, now + delay)
+                self.logger.warning(f"💥 {shard} exited with code {process.exitcode}, restarting in {delay}s")
+                del self.workers[shard]
+
+            if accounts and now >= self.crashes.get(shard, (0, 0))[1]:
+                self._start(index, shard, accounts)
+
+    def _start(self, index, shard, accounts):
+        # per worker files, two processes must not append to the same journal segment or spool
+        overrides = {
+            "JOURNAL_DIR": os.path.join(JOURNAL_DIR, shard) if JOURNAL_DIR else "",
+            "NOTIFY_SPOOL": f"{NOTIFY_SPOOL}.{shard}" if NOTIFY_SPOOL else "",
+            "METRICS_PORT": str(METRICS_PORT + 1 + index) if METRICS_PORT else "0",
+            "QUERY_PORT": str(QUERY_PORT + 1 + index) if QUERY_PORT else "0",
+        }
+        process = self.context.Process(
+            target=_run_worker, args=(accounts, self.rate_limiter, self.check_interval), name=shard)
+
+        # a spawned worker reads its config from the environment it starts with
+        saved = {name: os.environ.get(name) for name in overrides}
+        os.environ.update(overrides)
+        try:
+            process.start()
+        finally:
+            for name, value in saved.items():
+                if value is None:
+                    os.environ.pop(name, None)
+                else:
+                    os.environ[name] = value
+
+        self.workers[shard] = process
+        self.started[shard] = time.time()
+        self.logger.info(f"▶️ Started {shard} (pid {process.pid}) with {len(accounts)} accounts")
+
+    def _stop(self, shard):
+        process = self.workers.pop(shard, None)
+        if process is None or not process.is_alive():
+            return
+        process.terminate()  # SIGTERM, the worker flushes its notifications and journal
+        process.join(30)
+        if process.is_alive():
+            process.kill()
+            process.join()
+
+
+def _interrupt(signum, frame):
+    raise KeyboardInterrupt
+
+
+def _run_worker(accounts, rate_limiter, check_interval):
+    signal.signal(signal.SIGTERM, _interrupt)
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(processName)s - %(levelname)s - %(message)s',
+        datefmt='%Y-%m-%d %H:%M:%S'
+    )
+    set_rate_limiter(rate_limiter)
+    if METRICS_PORT:
+        from metrics import start_metrics_server
+        start_metrics_server(METRICS_PORT, METRICS_HOST)
+
+    engine = MonitoringEngine(accounts, check_interval=check_interval)
+    if QUERY_PORT:
+        from query_api import start_query_server
+        start_query_server(engine.monitors, QUERY_PORT, QUERY_HOST)
+    engine.run()
+
+
+if __name__ == "__main__":
+    if not ACCOUNTS_FILE:
+        print("❌ Set ACCOUNTS_FILE to run the supervisor")
+    else:
+        Supervisor().run()
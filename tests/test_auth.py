@@ -0,0 +1,73 @@
+import base64
+import json
+import threading
+import time
+
+import pytest
+
+from auth import AuthClient
+
+
+def _token(lifetime):
+    now = int(time.time())
+    payload = base64.urlsafe_b64encode(json.dumps({"iat": now, "exp": now + lifetime}).encode()).decode().rstrip("=")
+    return f"header.{payload}.signature"
+
+
+class FakeAuth(AuthClient):
+    # an AuthClient without the credential store and the network
+    def __init__(self, lifetime, fail=None):
+        self.token = None
+        self.expiration = self.refresh_at = 0
+        self.claims = {}
+        self.logins = 0
+        self.lifetime = lifetime
+        self.fail = fail
+        self._refresh_exit = None
+        self._lock = threading.Lock()
+        self._refreshing = False
+        self._refreshing_lock = threading.Lock()
+
+    def authenticate(self):
+        self.logins += 1
+        if self.fail and self.logins > 1:
+            raise self.fail
+        self._set_token(_token(self.lifetime))
+        return self.token
+
+    def _refresh_in_background(self):
+        self._refreshing = True
+        self._background_refresh()  # in this thread, so the test sees its result
+
+
+@pytest.mark.parametrize("lifetime", [120, 300, 360, 600])
+def test_short_lived_token_is_not_renewed_on_every_request(lifetime):
+    auth = FakeAuth(lifetime)
+    for _ in range(5):
+        auth.get_token()
+    assert auth.logins == 1
+    assert time.time() < auth.refresh_at < auth.expiration
+
+
+def test_long_lived_token_is_renewed_ahead():
+    auth = FakeAuth(3600)
+    auth.get_token()
+    assert auth.expiration - auth.refresh_at == pytest.approx(300)
+
+
+def test_exit_in_the_background_refresh_reaches_the_caller():
+    auth = FakeAuth(3600, fail=SystemExit())
+    auth.get_token()
+    auth.refresh_at = 0  # due for renewal
+    auth.get_token()  # still valid, the refresh fails in the background
+    with pytest.raises(SystemExit):
+        auth.get_token()
+
+
+def test_failed_background_refresh_waits_before_the_next_try():
+    auth = FakeAuth(3600, fail=Exception("down"))
+    auth.get_token()
+    auth.refresh_at = 0
+    for _ in range(5):
+        auth.get_token()
+    assert auth.logins == 2
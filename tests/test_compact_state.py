@@ -0,0 +1,37 @@
+from compact_state import CaseRecord, HashedText, ScoreRecord
+from diff_engine import CASES
+
+
+def _case(**fields):
+    case = {"caseNumber": 1, "creationDate": "2026-01-01", "channel": "web", "subject": "Postponement",
+            "mainSubject": "Service", "statusDescription": "In progress", "lastUpdateDate": "2026-01-02",
+            "answer": "x" * 2000, "status": 1, "slaDate": "2026-02-01", "unwatched": "ignored"}
+    case.update(fields)
+    return case
+
+
+def test_record_equals_the_item_it_was_made_from():
+    record = CaseRecord(_case())
+    assert isinstance(record.answer, HashedText)
+    assert record == _case()
+    assert _case() == record
+    assert record == _case(unwatched="changed")  # only the record's fields count
+
+
+def test_record_differs_from_a_changed_item():
+    record = CaseRecord(_case())
+    assert record != _case(statusDescription="Closed")
+    assert record != _case(answer="y" * 2000)
+    assert record != _case(answer="x" * 1999)
+
+
+def test_nested_lists_compare_too():
+    item = {"name": "a", "title": "A", "score": 5, "internalScoreList": [{"name": "b", "score": 3}]}
+    record = ScoreRecord(item)
+    assert record == dict(item)
+    assert record != {**item, "internalScoreList": [{"name": "b", "score": 4}]}
+
+
+def test_unchanged_record_takes_the_fast_path(monkeypatch):
+    monkeypatch.setattr(CASES, "_diff_fields", None)  # would raise if the fast path were skipped
+    assert CASES.diff_record(CaseRecord(_case()), _case(), key=1) == []
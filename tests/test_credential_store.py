@@ -0,0 +1,29 @@
+import pytest
+
+import credential_store
+from credential_store import CredentialStore, env_credentials
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    store = CredentialStore(str(tmp_path / "credentials.db"))
+    monkeypatch.setattr(credential_store, "_store", store)
+    monkeypatch.setattr(credential_store, "CREDENTIALS_DB", str(tmp_path / "credentials.db"))
+    yield store
+    store.close()
+
+
+def test_env_account_comes_from_the_store(store, monkeypatch):
+    store.register("1000001", "biometric", "uuid")
+    monkeypatch.setenv("MALSHAB_ID", "1000001")
+    monkeypatch.delenv("BIOMETRIC_DATA", raising=False)
+    monkeypatch.delenv("UUID", raising=False)
+    credentials = env_credentials()
+    assert (credentials["malshab_id"], credentials["biometric_data"]) == ("1000001", "biometric")
+
+
+def test_no_malshab_id_is_not_some_other_registered_account(store, monkeypatch):
+    store.register("1000001", "biometric", "uuid")
+    for name in ("MALSHAB_ID", "BIOMETRIC_DATA", "UUID"):
+        monkeypatch.delenv(name, raising=False)
+    assert not env_credentials()["malshab_id"]
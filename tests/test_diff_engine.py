@@ -0,0 +1,54 @@
+from diff_engine import Change, Differ, Schema, SCORES, USER_DATA, group_by_key, merge_changes
+
+ITEMS = Differ(Schema(key="id", fields=["status", "date"]))
+
+
+def test_only_watched_fields_are_compared():
+    old = {"id": 1, "status": "open", "date": "2026-01-01", "other": "a"}
+    new = {"id": 1, "status": "closed", "date": "2026-01-01", "other": "b"}
+    assert ITEMS.diff_record(old, new, key=1) == [Change("changed", 1, "status", "open", "closed")]
+
+
+def test_missing_field_counts_as_none():
+    assert ITEMS.diff_record({"id": 1, "status": "open"}, {"id": 1, "status": "open", "date": None}, key=1) == []
+    assert ITEMS.diff_record({"id": 1}, {"id": 1, "date": "x"}, key=1) == [Change("changed", 1, "date", None, "x")]
+
+
+def test_collection_added_and_removed():
+    old = ITEMS.index([{"id": 1, "status": "a"}, {"id": 2, "status": "a"}])
+    new = ITEMS.index([{"id": 1, "status": "a"}, {"id": 3, "status": "a"}])
+    assert [(change.op, change.key) for change in ITEMS.diff_collection(old, new)] == [("added", 3), ("removed", 2)]
+    assert [(change.op, change.key) for change in ITEMS.diff_collection(old, new, removals=False)] == [("added", 3)]
+
+
+def test_nested_entries_are_diffed_by_key():
+    old = {"name": "s", "score": 1, "internalScoreList": [{"indicatorName": "a", "indicatorValue": 1},
+                                                          {"indicatorName": "b", "indicatorValue": 2}]}
+    new = {"name": "s", "score": 1, "internalScoreList": [{"indicatorName": "a", "indicatorValue": 5},
+                                                          {"indicatorName": "c", "indicatorValue": 3}]}
+    changes = SCORES.diff_record(old, new, key="s")
+    assert sorted((change.op, change.item) for change in changes) == [("added", "c"), ("changed", "a"), ("removed", "b")]
+
+
+def test_all_keys_compares_the_keys_present_in_both():
+    changes = USER_DATA.diff_record({"a": 1, "b": 2}, {"a": 3, "c": 4})
+    assert changes == [Change("changed", None, "a", 1, 3)]
+
+
+def test_stream_yields_every_item():
+    old = ITEMS.index([{"id": 1, "status": "a"}])
+    result = list(ITEMS.diff_stream(old, [{"id": 1, "status": "a"}, {"id": 2, "status": "b"}]))
+    assert [(key, [change.op for change in changes]) for key, _, changes in result] == [(1, []), (2, ["added"])]
+
+
+def test_group_by_key():
+    changes = [Change("changed", 1, "status", "a", "b"), Change("changed", 1, "date", "x", "y"),
+               Change("added", 2, None, None, {"id": 2})]
+    assert [(key, op, len(group)) for key, op, group in group_by_key(changes)] == [(1, "changed", 2), (2, "added", 1)]
+
+
+def test_merge_keeps_the_net_change():
+    first = [Change("changed", 1, "status", "a", "b")]
+    assert merge_changes(first, [Change("changed", 1, "status", "b", "c")]) == [Change("changed", 1, "status", "a", "c")]
+    assert merge_changes(first, [Change("changed", 1, "status", "b", "a")]) == []
+    assert merge_changes([Change("added", 1, None, None, "x")], [Change("removed", 1, None, "x", None)]) == []
@@ -0,0 +1,26 @@
+from types import SimpleNamespace
+
+import requests
+
+import http_client
+from http_client import HttpClient
+
+
+def _without_h2(**kwargs):
+    raise ImportError("Using http2=True, but the 'h2' package is not installed")
+
+
+def test_http2_without_h2_falls_back_to_requests(monkeypatch, capsys):
+    fake_httpx = SimpleNamespace(Client=_without_h2, Limits=lambda **kwargs: None, Timeout=lambda *args, **kwargs: None)
+    monkeypatch.setattr(http_client, "httpx", fake_httpx)
+    client = HttpClient(http2=True)
+    assert not client.http2
+    assert isinstance(client._client, requests.Session)
+    assert "h2" in capsys.readouterr().out
+
+
+def test_http2_without_httpx_falls_back_to_requests(monkeypatch):
+    monkeypatch.setattr(http_client, "httpx", None)
+    client = HttpClient(http2=True)
+    assert not client.http2
+    assert isinstance(client._client, requests.Session)
@@ -0,0 +1,74 @@
+import time
+
+from compact_state import HashedText
+from diff_engine import Change
+from journal import Journal
+
+
+def _journal(path, **kwargs):
+    return Journal(str(path), **{"flush_interval": 0, **kwargs})
+
+
+def test_entries_are_found_by_account_entity_and_key(tmp_path):
+    journal = _journal(tmp_path)
+    journal.append("1", "case", [Change("changed", 5000001, "status", 0, 1), Change("added", 5000002, None, None, {})])
+    journal.append("2", "case", [Change("changed", 5000001, "status", 1, 0)])
+    journal.append("1", "crm", [Change("changed", None, "isUpdated", False, True)])
+    assert journal.flush(5)
+
+    assert [entry["key"] for entry in journal.query("1", "case")] == [5000001, 5000002]
+    assert [(entry["account"], entry["new"]) for entry in journal.query(entity="case", key=5000001)] == [("1", 1), ("2", 0)]
+    assert [entry["field"] for entry in journal.query("1", "crm")] == ["isUpdated"]
+    assert list(journal.query("3")) == []
+    journal.close()
+
+
+def test_time_range_limit_and_order(tmp_path):
+    journal = _journal(tmp_path)
+    for value in range(5):
+        journal.append("1", "case", [Change("changed", 1, "status", value, value + 1)])
+        journal.flush(5)
+        time.sleep(0.01)
+    entries = list(journal.query("1"))
+    assert [entry["new"] for entry in entries] == [1, 2, 3, 4, 5]
+    assert [entry["new"] for entry in journal.query("1", since=entries[2]["ts"])] == [3, 4, 5]
+    assert [entry["new"] for entry in journal.query("1", until=entries[2]["ts"])] == [1, 2]
+    assert [entry["new"] for entry in journal.query("1", limit=2)] == [1, 2]
+    assert [entry["new"] for entry in journal.query("1", newest_first=True, limit=2)] == [5, 4]
+    journal.close()
+
+
+def test_segments_roll_over_and_stay_readable(tmp_path):
+    journal = _journal(tmp_path, segment_size=300)
+    for value in range(20):
+        journal.append("1", "case", [Change("changed", value, "subject", "x" * 50, "y" * 50)])
+    journal.flush(5)
+    assert len(journal._segments()) > 5
+    assert [entry["key"] for entry in journal.query("1")] == list(range(20))
+    assert [entry["key"] for entry in journal.query("1", key=13)] == [13]
+    journal.close()
+
+
+def test_hashed_texts_are_stored_as_hashes(tmp_path):
+    journal = _journal(tmp_path)
+    journal.append("1", "case", [Change("changed", 1, "answer", HashedText.of("a" * 500), "b" * 500)])
+    journal.flush(5)
+    entry = next(journal.query("1"))
+    assert entry["old"]["length"] == 500 and entry["new"] == "b" * 500
+    journal.close()
+
+
+def test_lines_written_but_not_indexed_are_recovered(tmp_path):
+    journal = _journal(tmp_path)
+    journal.append("1", "case", [Change("changed", 1, "status", 0, 1)])
+    journal.flush(5)
+    journal.close()
+    with open(journal._segment_path(journal.segment), "ab") as file:  # the process died before indexing these
+        file.write(b'{"ts":1,"account":"1","entity":"case","key":2,"op":"added","field":null,"old":null,"new":{}}\n')
+        file.write(b'{"ts":2,"account":"1","entity":"ca')  # torn write
+
+    recovered = _journal(tmp_path)
+    assert [entry["key"] for entry in recovered.query("1")] == [2, 1]  # in time order
+    with open(recovered._segment_path(recovered.segment), "rb") as file:
+        assert file.read().endswith(b"}\n")
+    recovered.close()
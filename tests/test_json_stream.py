@@ -0,0 +1,63 @@
+import json
+
+import pytest
+
+from json_stream import StreamedObject
+
+DOCUMENT = json.dumps({
+    "statusCode": 1,
+    "caseList": [
+        {"caseNumber": 5000001, "subject": "פנייה בנושא זימון", "score": 1.5, "weight": -2e10, "ratio": 3E-2,
+         "open": True, "closed": False, "answer": None, "tags": ["a", "ב"], "nested": {"x": [1, 2.25, {"y": 0}]}},
+        12345,
+        1.5,
+        -0.75e-3,
+        "text",
+        True,
+        None,
+        [],
+        {},
+    ],
+    "hasMoreData": True,
+    "page": 10,
+}, ensure_ascii=False).encode("utf-8")
+
+
+def _read(chunks):
+    document = StreamedObject(chunks, "caseList")
+    return list(document.items()), document
+
+
+@pytest.mark.parametrize("offset", range(1, len(DOCUMENT)))
+def test_split_at_every_offset(offset):
+    expected = json.loads(DOCUMENT)
+    items, document = _read([DOCUMENT[:offset], DOCUMENT[offset:]])
+    assert items == expected["caseList"]
+    assert document.fields == {"statusCode": 1, "hasMoreData": True, "page": 10}
+    assert document.size == len(DOCUMENT)
+
+
+def test_one_byte_chunks():
+    items, document = _read([DOCUMENT[i:i + 1] for i in range(len(DOCUMENT))])
+    assert items == json.loads(DOCUMENT)["caseList"]
+    assert document.fields["page"] == 10
+
+
+@pytest.mark.parametrize("chunks", [
+    [b'{"caseList": [1.', b'5]}'],
+    [b'{"caseList": [1e', b'5]}'],
+    [b'{"caseList": [1', b'2', b'3]}'],
+    [b'{"caseList": [-', b'1]}'],
+])
+def test_number_split_in_chunks(chunks):
+    assert _read(chunks)[0] == json.loads(b"".join(chunks))["caseList"]
+
+
+def test_fingerprint_matches_whole_body():
+    whole = _read([DOCUMENT])[1].fingerprint
+    assert _read([DOCUMENT[:7], DOCUMENT[7:99], DOCUMENT[99:]])[1].fingerprint == whole
+
+
+def test_truncated_body_raises():
+    with pytest.raises(ValueError):
+        _read([DOCUMENT[:len(DOCUMENT) // 2]])
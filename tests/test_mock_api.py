@@ -0,0 +1,83 @@
+# the monitor end to end against the mock api of the benchmarks
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import api_client
+import auth
+from api_client import MitgiaisimAPI
+from http_client import HttpClient
+from main import MitgiaisimMonitor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+from mock_server import MockState, serve  # noqa: E402
+
+
+class FakeNotifier:
+    def __init__(self):
+        self.titles = []
+
+    def send_notification(self, title, message, priority="default", tags="loudspeaker", **kwargs):
+        self.titles.append(title)
+
+
+@pytest.fixture
+def mock(monkeypatch):
+    state = MockState(cases=45, page_size=20)
+    server = serve(state)
+    base_url = f"http://127.0.0.1:{server.server_port}"
+    monkeypatch.setattr(api_client, "BASE_URL", base_url)
+    monkeypatch.setattr(auth, "BASE_URL", base_url)
+    monkeypatch.setattr(auth, "get_credential_store", lambda: None)  # nothing kept between tests
+    yield state
+    server.shutdown()
+
+
+def _monitor():
+    credentials = {"malshab_id": "1000001", "biometric_data": "mock", "uuid": "mock"}
+    http = HttpClient()
+    api = MitgiaisimAPI(http=http, auth=auth.AuthClient(http=http, credentials=credentials))
+    return MitgiaisimMonitor(api=api, notifier=FakeNotifier(), executor=ThreadPoolExecutor(6), store=False, journal=False)
+
+
+def test_unchanged_profile_is_answered_with_304s(mock):
+    monitor = _monitor()
+    monitor.fetch_initial_data()
+    assert len(monitor.tracked_cases) == 45
+    monitor._check_for_updates(None)  # takes the baseline of the other endpoints
+    before = dict(mock.stats)
+    results = monitor._check_for_updates(None)
+    assert not any(results.values())
+    assert mock.stats["bytes_sent"] == before["bytes_sent"]  # every answer was a 304
+    assert monitor.notifier.titles == []
+
+
+def test_changes_of_the_mock_are_notified(mock):
+    monitor = _monitor()
+    monitor.fetch_initial_data()
+    monitor._check_for_updates(None)
+    profile = mock.profile("1000001")
+    profile.cases[0]["statusDescription"] = "בטיפול"
+    profile.cases[0]["lastUpdateDate"] = "2099-01-01T00:00:00"
+    profile.crm = True
+    profile.touch()
+    monitor.cases_dirty = True  # walk the cases whatever the probes say
+    results = monitor._check_for_updates(None)
+    assert results["cases"] and results["crm"]
+    assert any(title.startswith(f"Case Updated: {profile.cases[0]['caseNumber']}") for title in monitor.notifier.titles)
+
+
+def test_tick_is_reproducible():
+    first, second = MockState(cases=10, change_rate=1, seed=7), MockState(cases=10, change_rate=1, seed=7)
+    for state in (first, second):
+        state.profile("1")
+        for _ in range(5):
+            state.tick()
+    def summary(state):  # the timestamps follow the clock, the changes follow the seed
+        profile = state.profile("1")
+        return [(case["caseNumber"], case["status"]) for case in profile.cases], profile.crm, len(profile.summons)
+
+    assert summary(first) == summary(second)
+    assert first.stats["changes"] == 5
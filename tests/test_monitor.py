@@ -0,0 +1,176 @@
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+import pytest
+
+import main
+from api_client import Fetched, UNCHANGED
+from journal import Journal
+from compact_state import CaseRecord, ScoreRecord
+from main import MitgiaisimMonitor, _every
+from query_api import ChangeFeed
+from state_store import StateStore
+
+
+class FakeNotifier:
+    def __init__(self):
+        self.sent = []
+
+    def send_notification(self, title, message, priority="default", tags="loudspeaker", **kwargs):
+        self.sent.append(title)
+
+
+def _case(number):
+    return {"caseNumber": number, "subject": "Postponement", "mainSubject": "Service", "creationDate": "2026-01-01",
+            "channel": "web", "statusDescription": "In progress", "lastUpdateDate": "2026-01-02", "status": 0}
+
+
+def _monitor():
+    api = SimpleNamespace(auth=SimpleNamespace(malshab_id="1"))
+    monitor = MitgiaisimMonitor(api=api, notifier=FakeNotifier(), executor=object(), store=False, journal=False)
+    monitor.feed = ChangeFeed()
+    return monitor
+
+
+def test_missing_case_is_removed_after_three_checks():
+    monitor = _monitor()
+    monitor._check_case_updates({"caseList": [_case(1), _case(2)]})
+    for _ in range(2):
+        monitor._check_case_updates({"caseList": [_case(1)]})
+    assert 2 in monitor.tracked_cases and monitor.pending_removals == {2: 2}
+    monitor._check_case_updates({"caseList": [_case(1)]})
+    assert 2 not in monitor.tracked_cases and monitor.pending_removals == {}
+    assert monitor.notifier.sent[-1].startswith("Case Deleted: 2")
+
+
+def test_case_that_comes_back_is_kept():
+    monitor = _monitor()
+    monitor._check_case_updates({"caseList": [_case(1), _case(2)]})
+    monitor._check_case_updates({"caseList": [_case(1)]})
+    monitor._check_case_updates({"caseList": [_case(1), _case(2)]})
+    assert monitor.pending_removals == {}
+    assert not any(title.startswith("Case Deleted") for title in monitor.notifier.sent)
+
+
+def test_removal_counter_stays_out_of_the_published_view():
+    monitor = _monitor()
+    monitor._check_case_updates({"caseList": [_case(1), _case(2)]})
+    monitor._publish()
+    published = monitor.view["state"]["cases"]
+    monitor._check_case_updates({"caseList": [_case(1)]})
+    monitor._publish()
+    assert [dict(case.items()) for case in published] == [dict(case.items()) for case in monitor.view["state"]["cases"]]
+    assert all("checkedForRemoval" not in case for case in monitor.view["state"]["cases"])
+
+
+def test_response_is_only_kept_once_its_check_succeeded():
+    monitor = _monitor()
+    committed = []
+    data = Fetched({"caseList": [_case(1)]}, lambda: committed.append(True))
+
+    def failing_check(data):
+        raise RuntimeError("notifier down")
+
+    with pytest.raises(RuntimeError):
+        monitor._run_check("cases", failing_check, data)
+    assert committed == []  # the next check gets the same response again instead of UNCHANGED
+    monitor._run_check("cases", monitor._check_case_updates, data)
+    assert committed == [True]
+
+
+def test_failed_check_is_not_kept():
+    monitor = _monitor()
+    committed = []
+    monitor._run_check("crm", monitor._check_crm_updates, Fetched({}, lambda: committed.append(True)))
+    assert committed == []
+
+
+@pytest.mark.parametrize("count, every, expected", [(12, 12, True), (13, 12, False), (12, 0, False), (1, 1, True)])
+def test_every(count, every, expected):
+    assert _every(count, every) is expected
+
+
+def _score(name, score):
+    return {"name": name, "title": name.title(), "score": score,
+            "internalScoreList": [{"indicatorName": "a", "indicatorValue": score}]}
+
+
+def test_removed_score_is_reported_once():
+    monitor = _monitor()
+    monitor.tracked_scores = {"x": ScoreRecord(_score("x", 1)), "y": ScoreRecord(_score("y", 2))}
+    assert monitor._check_quality_updates({"scoreList": [_score("x", 1)]}) is True
+    assert "y" not in monitor.tracked_scores
+    assert monitor._check_quality_updates({"scoreList": [_score("x", 1)]}) is False
+
+
+def test_case_in_its_grace_period_is_not_a_change():
+    monitor = _monitor()
+    monitor._check_case_updates({"caseList": [_case(1), _case(2)]})
+    events = []
+    monitor.feed.publish_changes = lambda account, entity, changes: events.extend(change.op for change in changes)
+    assert monitor._check_case_updates({"caseList": [_case(1)]}) is False
+    assert monitor._check_case_updates({"caseList": [_case(1)]}) is False
+    assert events == []
+    assert monitor._check_case_updates({"caseList": [_case(1)]}) is True
+    assert events == ["removed"]
+
+
+class FakeCasesAPI:
+    def __init__(self):
+        self.auth = SimpleNamespace(malshab_id="1")
+        self.page_counts = {}
+        self.calls = []
+
+    def get_cases(self, skip_unchanged=True, since=None):
+        self.calls.append(since)
+        return UNCHANGED
+
+    def __getattr__(self, name):
+        return lambda: UNCHANGED  # the other endpoints
+
+
+def test_case_fetch_gets_the_watermark_and_a_full_sweep_on_schedule(monkeypatch):
+    monkeypatch.setattr(main, "CASES_FULL_SWEEP_EVERY", 3)
+    monitor = MitgiaisimMonitor(api=FakeCasesAPI(), notifier=FakeNotifier(), executor=ThreadPoolExecutor(2),
+                                store=False, journal=False)
+    monitor.tracked_cases = {1: CaseRecord(_case(1))}
+    for _ in range(3):
+        monitor.cases_dirty = True  # no probes, the cases are fetched every time
+        monitor._check_for_updates(["cases"])
+    assert monitor.api.calls == ["2026-01-02", "2026-01-02", None]
+
+
+class FakeMessages:
+    def __init__(self):
+        self.messages = []
+
+    def send_notification(self, title, message, priority="default", tags="loudspeaker", **kwargs):
+        self.messages.append(message)
+
+
+def test_message_shows_the_old_long_text_from_the_journal(tmp_path):
+    journal = Journal(str(tmp_path), flush_interval=60)  # still waiting for the writer when the message is made
+    monitor = _monitor()
+    monitor.journal = journal
+    monitor.notifier = FakeMessages()
+    first, second = "a" * 500, "b" * 500
+    monitor._check_case_updates({"caseList": [_case(1)]})
+    monitor._check_case_updates({"caseList": [{**_case(1), "answer": first}]})
+    monitor._check_case_updates({"caseList": [{**_case(1), "answer": second}]})
+    assert f"answer changed: {first} → {second}" in monitor.notifier.messages[-1]
+    journal.close()
+
+
+def test_monitor_state_survives_a_restart(tmp_path):
+    store = StateStore(str(tmp_path / "state.db"))
+    api = SimpleNamespace(auth=SimpleNamespace(malshab_id="1"), export_cache=lambda: {}, import_cache=lambda cache: None,
+                          forget=lambda endpoint: None)
+    monitor = MitgiaisimMonitor(api=api, notifier=FakeNotifier(), executor=object(), store=store, journal=False)
+    monitor._check_case_updates({"caseList": [_case(1), _case(2)]})
+    monitor._check_case_updates({"caseList": [_case(1)]})  # 2 is waiting for its removal to be confirmed
+    monitor.save_state()
+
+    restarted = MitgiaisimMonitor(api=api, notifier=FakeNotifier(), executor=object(), store=store, journal=False)
+    assert restarted.load_state()
+    assert list(restarted.tracked_cases) == [1, 2]
+    assert restarted.pending_removals == {2: 1}
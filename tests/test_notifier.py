@@ -0,0 +1,120 @@
+import json
+
+from config import NOTIFY_DIGEST_WINDOW, SCHEDULE_MIN_INTERVAL
+from diff_engine import Change
+from notifier import NotificationCoalescer, NotificationDispatcher
+from scheduler import AdaptiveScheduler
+
+
+class FakeNotifier:
+    account = "1"
+    dispatcher = None
+
+    def __init__(self):
+        self.sent = []
+
+    def send_notification(self, title, message, priority="default", tags="loudspeaker"):
+        self.sent.append((title, message))
+
+
+def _render(changes):
+    return "Case Updated: 1", "\n".join(f"{change.field}: {change.old} → {change.new}" for change in changes)
+
+
+def _notify(coalescer, changes):
+    title, message = _render(changes)
+    coalescer.send_notification(title, message, category="case_changed", key=("case", 1), changes=changes,
+                                render=_render)
+
+
+def test_change_and_its_reversal_are_merged_away():
+    notifier = FakeNotifier()
+    coalescer = NotificationCoalescer(notifier, window=3600, urgent=())
+    _notify(coalescer, [Change("changed", 1, "statusDescription", "טופל", "בטיפול")])
+    _notify(coalescer, [Change("changed", 1, "statusDescription", "בטיפול", "טופל")])
+    coalescer.send_pending()
+    assert notifier.sent == []
+
+
+def test_changes_of_one_item_are_sent_as_their_net_change():
+    notifier = FakeNotifier()
+    coalescer = NotificationCoalescer(notifier, window=3600, urgent=())
+    _notify(coalescer, [Change("changed", 1, "statusDescription", "טופל", "בטיפול")])
+    _notify(coalescer, [Change("changed", 1, "statusDescription", "בטיפול", "נסגר"),
+                        Change("changed", 1, "lastUpdateDate", "2025-03-01", "2025-03-02")])
+    coalescer.send_pending()
+    assert notifier.sent == [_render([Change("changed", 1, "statusDescription", "טופל", "נסגר"),
+                                      Change("changed", 1, "lastUpdateDate", "2025-03-01", "2025-03-02")])]
+
+
+def test_default_window_spans_two_checks_of_a_changing_endpoint():
+    # an endpoint that keeps changing is polled at the fastest interval, the next check has to fall in the window
+    scheduler = AdaptiveScheduler(["cases"], 300)
+    for _ in range(10):
+        scheduler.record("cases", True, now=0)
+        assert scheduler.intervals["cases"] >= SCHEDULE_MIN_INTERVAL
+    assert scheduler.intervals["cases"] == SCHEDULE_MIN_INTERVAL
+    for _ in range(100):
+        scheduler.record("cases", True, now=0)
+        assert scheduler.next_due["cases"] < NOTIFY_DIGEST_WINDOW
+
+
+class FakeResponse:
+    def __init__(self, status_code):
+        self.status_code = status_code
+
+
+class FakeHttp:
+    # answers every post of a title with the next status of its script (the last one repeats)
+    def __init__(self, scripts):
+        self.scripts = scripts
+        self.posts = []
+
+    def post(self, url, params, data):
+        self.posts.append(params["title"])
+        script = self.scripts[params["title"]]
+        return FakeResponse(script.pop(0) if len(script) > 1 else script[0])
+
+
+def _dispatcher(tmp_path, scripts, **kwargs):
+    kwargs = {"max_retries": 2, "backoff_base": 0.2, "backoff_max": 0.2, **kwargs}
+    return NotificationDispatcher(http=FakeHttp(scripts), spool_path=str(tmp_path / "spool.jsonl"), **kwargs)
+
+
+def _notification(title):
+    return {"url": "http://ntfy", "title": title, "message": title, "priority": "default", "tags": "loudspeaker"}
+
+
+def test_rejected_notification_is_dropped_not_spooled(tmp_path):
+    dispatcher = _dispatcher(tmp_path, {"bad": [400]})
+    dispatcher.enqueue(_notification("bad"))
+    assert dispatcher.flush(5)
+    assert dispatcher.http.posts == ["bad"]
+    assert dispatcher.undelivered == 1
+    assert not (tmp_path / "spool.jsonl").exists()
+
+
+def test_retry_does_not_hold_up_other_notifications(tmp_path):
+    dispatcher = _dispatcher(tmp_path, {"flaky": [503, 200], "ok": [200]})
+    dispatcher.enqueue(_notification("flaky"))
+    dispatcher.enqueue(_notification("ok"))
+    assert dispatcher.flush(5)
+    assert dispatcher.http.posts == ["flaky", "ok", "flaky"]
+    assert dispatcher.undelivered == 0
+
+
+def test_notification_is_spooled_after_the_last_retry(tmp_path):
+    dispatcher = _dispatcher(tmp_path, {"down": [503]})
+    dispatcher.enqueue(_notification("down"))
+    assert dispatcher.flush(5)
+    assert dispatcher.http.posts == ["down"] * 3
+    spooled = json.loads((tmp_path / "spool.jsonl").read_text(encoding="utf-8"))
+    assert spooled == _notification("down")  # without the attempt count, the next start tries it all over
+
+
+def test_close_spools_notifications_waiting_for_a_retry(tmp_path):
+    dispatcher = _dispatcher(tmp_path, {"down": [503]}, backoff_base=60, backoff_max=60)
+    dispatcher.enqueue(_notification("down"))
+    dispatcher.close(timeout=0.5)
+    assert dispatcher.queue.unfinished_tasks == 0
+    assert (tmp_path / "spool.jsonl").read_text(encoding="utf-8").count("\n") == 1
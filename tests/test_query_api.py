@@ -0,0 +1,141 @@
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+from types import SimpleNamespace
+
+import pytest
+
+from compact_state import CaseRecord
+from main import MitgiaisimMonitor
+from query_api import ChangeFeed, QueryAPI, start_query_server
+
+
+class FakeNotifier:
+    def send_notification(self, *args, **kwargs):
+        pass
+
+
+def _monitor(malshab_id="1000001", name="me"):
+    api = SimpleNamespace(auth=SimpleNamespace(malshab_id=malshab_id))
+    return MitgiaisimMonitor(api=api, notifier=FakeNotifier(), executor=object(), name=name, store=False, journal=False)
+
+
+def _case(number):
+    return {"caseNumber": number, "subject": "Postponement", "mainSubject": "Service", "creationDate": "2026-01-01",
+            "channel": "web", "statusDescription": "In progress", "lastUpdateDate": "2026-01-02", "status": 0}
+
+
+@pytest.fixture
+def server():
+    monitor = _monitor()
+    api = QueryAPI([monitor], token="secret", refresh_min_age=30, refresh_wait=5)
+    server = start_query_server([monitor], 0, api=api)
+    server.monitor, server.api = monitor, api
+    server.url = f"http://127.0.0.1:{server.server_port}"
+    yield server
+    server.shutdown()
+
+
+def _call(server, path, method="GET", token="secret", headers=None):
+    request = urllib.request.Request(server.url + path, method=method, headers=dict(headers or {}))
+    if token:
+        request.add_header("Authorization", f"Bearer {token}")
+    try:
+        with urllib.request.urlopen(request, timeout=10) as response:
+            return response.status, dict(response.headers), response.read()
+    except urllib.error.HTTPError as e:
+        return e.code, dict(e.headers), e.read()
+
+
+def test_requests_need_the_token(server):
+    assert _call(server, "/accounts", token=None)[0] == 401
+    assert _call(server, "/accounts", token="wrong")[0] == 401
+    assert _call(server, "/accounts")[0] == 200
+
+
+def test_state_is_unavailable_until_loaded(server):
+    status, headers, _ = _call(server, "/accounts/1000001")
+    assert status == 503 and headers["Retry-After"] == "5"
+
+
+def test_state_by_id_or_name_with_etags(server):
+    monitor = server.monitor
+    monitor.tracked_cases = {1: CaseRecord(_case(1))}
+    monitor.checked_at["cases"] = 100.0
+    monitor._publish()
+
+    status, headers, body = _call(server, "/accounts/me/cases")
+    data = json.loads(body)
+    assert status == 200 and data["kind"] == "cases" and data["checked_at"] == 100.0
+    assert [case["caseNumber"] for case in data["data"]] == [1]
+    etag = headers["ETag"]
+    assert _call(server, "/accounts/1000001/cases", headers={"If-None-Match": etag})[0] == 304
+
+    monitor.tracked_cases[2] = CaseRecord(_case(2))
+    monitor._publish()  # a new version
+    status, headers, body = _call(server, "/accounts/1000001/cases", headers={"If-None-Match": etag})
+    assert status == 200 and headers["ETag"] != etag and len(json.loads(body)["data"]) == 2
+    assert _call(server, "/accounts/nobody")[0] == 404
+    assert _call(server, "/accounts/me/unknown")[0] == 404
+
+
+def test_body_is_encoded_once_per_version(server):
+    server.monitor._publish()
+    first = server.api.state(server.monitor, "cases")
+    assert server.api.state(server.monitor, "cases")[1] is first[1]
+
+
+def test_refresh_only_refetches_stale_endpoints(server):
+    monitor = server.monitor
+    monitor.checked_at = {name: time.time() for name in ("summons", "quality", "user_data", "questionnaires", "crm")}
+    status, _, body = _call(server, "/accounts/me/refresh?endpoints=cases,crm", method="POST")
+    assert status == 202 and json.loads(body) == {"refreshing": ["cases"], "pending": ["cases"]}
+    assert monitor.scheduler.due() == ["cases"]
+    assert _call(server, "/accounts/me/refresh?endpoints=nope", method="POST")[0] == 400
+
+
+def test_refresh_can_wait_for_the_check(server):
+    monitor = server.monitor
+
+    def check():
+        while "cases" not in monitor.scheduler.triggered:
+            time.sleep(0.01)
+        monitor.attempted_at["cases"] = time.time()
+        monitor.checked_at["cases"] = time.time()
+        with monitor.checked:
+            monitor.checked.notify_all()
+
+    threading.Thread(target=check, daemon=True).start()
+    status, _, body = _call(server, "/accounts/me/refresh?endpoints=cases&wait=5", method="POST")
+    assert status == 200 and json.loads(body) == {"refreshing": ["cases"], "pending": []}
+
+
+def test_feed_replays_missed_events():
+    feed = ChangeFeed(backlog=3)
+    for index in range(5):
+        feed.publish("1", "checked", {"index": index})
+    feed.publish("2", "checked", {"index": 5})
+    _, missed = feed.subscribe("1", last_id=3)
+    assert [b'"index":3' in message for message in missed] == [True, False]  # ids 4 and 5, only account 1
+    assert feed.subscribe(last_id=1)[1] is None  # no longer kept, the client has to reload
+    assert feed.subscribe(last_id=99)[1] is None  # an id from before a restart
+
+
+def test_slow_subscriber_is_dropped():
+    feed = ChangeFeed(queue_size=2)
+    subscriber, _ = feed.subscribe()
+    for index in range(3):
+        feed.publish("1", "checked", {})
+    assert list(subscriber.queue) == [None]  # the signal to close the stream
+    assert subscriber not in feed._subscribers
+
+
+def test_event_stream_sends_changes(server):
+    request = urllib.request.Request(server.url + "/accounts/me/events", headers={"Authorization": "Bearer secret"})
+    with urllib.request.urlopen(request, timeout=10) as response:
+        server.monitor._check_case_updates({"caseList": [_case(1)]})  # the first case is an addition
+        lines = [response.readline() for _ in range(3)]
+    assert lines[1] == b"event: change\n"
+    assert json.loads(lines[2][len(b"data: "):])["op"] == "added"
@@ -0,0 +1,113 @@
+import time
+from email.utils import formatdate
+from types import SimpleNamespace
+
+import pytest
+
+import api_client
+from api_client import MitgiaisimAPI
+from resilience import CircuitBreaker, CircuitOpenError, TokenBucket, backoff_delay, retry_after_seconds
+
+
+def _response(status_code=200, **headers):
+    return SimpleNamespace(status_code=status_code, headers=headers, content=b"{}", close=lambda: None)
+
+
+def test_breaker_opens_after_the_threshold_and_probes_once():
+    breaker = CircuitBreaker("test", failure_threshold=2, reset_timeout=60)
+    breaker.record_failure()
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN and not breaker.allow()
+
+    breaker.open_until = time.time() - 1  # the reset timeout passed
+    assert breaker.allow()  # the one half open request
+    assert not breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED and breaker.allow()
+
+
+def test_failed_probe_opens_the_breaker_again():
+    breaker = CircuitBreaker("test", failure_threshold=5, reset_timeout=60)
+    breaker.state, breaker.open_until = CircuitBreaker.OPEN, 0
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN and breaker.open_until > time.time() + 50
+
+
+def test_retry_after_opens_the_breaker_for_that_long():
+    breaker = CircuitBreaker("test", failure_threshold=5, reset_timeout=60)
+    breaker.record_failure(retry_after=600)
+    assert breaker.state == CircuitBreaker.OPEN and breaker.open_until > time.time() + 590
+
+
+def test_retry_after_seconds_and_http_date():
+    assert retry_after_seconds(_response(**{"Retry-After": "120"})) == 120
+    assert 110 < retry_after_seconds(_response(**{"Retry-After": formatdate(time.time() + 120, usegmt=True)})) <= 120
+    assert retry_after_seconds(_response(**{"Retry-After": "soon"})) is None
+    assert retry_after_seconds(_response()) is None
+
+
+def test_backoff_delay_is_capped():
+    assert all(0 <= backoff_delay(attempt, base=1, cap=5) <= min(5, 2 ** attempt) for attempt in range(10))
+
+
+def test_token_bucket_allows_the_burst_then_waits():
+    bucket = TokenBucket(rate=10, capacity=3)
+    assert [bucket._reserve() for _ in range(3)] == [0, 0, 0]
+    assert bucket._reserve() == pytest.approx(0.1, abs=0.01)
+    assert bucket._reserve() == pytest.approx(0.2, abs=0.01)
+
+
+class FakeHttp:
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.calls = 0
+
+    def get(self, url, headers=None, stream=False):
+        self.calls += 1
+        response = self.responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+
+@pytest.fixture
+def api(monkeypatch):
+    sleeps = []
+    breaker = CircuitBreaker("GetCaseList", failure_threshold=3, reset_timeout=60)
+    monkeypatch.setattr(api_client, "get_breaker", lambda name: breaker)
+    monkeypatch.setattr(api_client, "get_rate_limiter", lambda: TokenBucket(rate=0))
+    monkeypatch.setattr(api_client.time, "sleep", sleeps.append)
+    monkeypatch.setattr(api_client, "RETRY_ATTEMPTS", 2)
+    monkeypatch.setattr(api_client, "RETRY_MAX_DELAY", 30)
+    api = MitgiaisimAPI(http=FakeHttp([]), auth=SimpleNamespace(malshab_id="1"))
+    api.sleeps, api.breaker = sleeps, breaker
+    return api
+
+
+def test_server_errors_are_retried(api):
+    api.http.responses = [_response(503), ConnectionError("reset"), _response(200)]
+    assert api._request("https://api/GetCaseList", {}).status_code == 200
+    assert api.http.calls == 3 and len(api.sleeps) == 2
+    assert api.breaker.state == CircuitBreaker.CLOSED
+
+
+def test_retry_after_is_honoured(api):
+    api.http.responses = [_response(429, **{"Retry-After": "7"}), _response(200)]
+    api._request("https://api/GetCaseList", {})
+    assert api.sleeps == [7]
+
+
+def test_long_retry_after_pauses_the_endpoint(api):
+    api.http.responses = [_response(429, **{"Retry-After": "600"})]
+    assert api._request("https://api/GetCaseList", {}).status_code == 429
+    assert api.sleeps == [] and api.breaker.state == CircuitBreaker.OPEN
+    with pytest.raises(CircuitOpenError):
+        api._request("https://api/GetCaseList", {})
+
+
+def test_client_errors_are_not_retried(api):
+    api.http.responses = [_response(404)]
+    assert api._request("https://api/GetCaseList", {}).status_code == 404
+    assert api.http.calls == 1
@@ -0,0 +1,74 @@
+from scheduler import AdaptiveScheduler
+
+
+def _scheduler(**kwargs):
+    kwargs = {"min_interval": 60, "max_interval": 1800, "hot_interval": 120, "jitter": 0, **kwargs}
+    return AdaptiveScheduler(["cases", "crm"], 300, **kwargs)
+
+
+def test_unchanged_endpoint_backs_off_up_to_the_max():
+    scheduler = _scheduler()
+    for _ in range(20):
+        scheduler.record("cases", False, now=0)
+    assert scheduler.intervals["cases"] == 1800
+    assert scheduler.next_due["cases"] == 1800
+
+
+def test_changed_endpoint_is_polled_faster_down_to_the_min():
+    scheduler = _scheduler()
+    scheduler.record("cases", True, now=0)
+    assert scheduler.intervals["cases"] == 150
+    for _ in range(5):
+        scheduler.record("cases", True, now=0)
+    assert scheduler.intervals["cases"] == 60
+
+
+def test_failed_check_keeps_the_interval():
+    scheduler = _scheduler()
+    scheduler.record("cases", None, now=0)
+    assert scheduler.intervals["cases"] == 300 and scheduler.next_due["cases"] == 300
+
+
+def test_hot_endpoint_waits_at_most_the_hot_interval():
+    scheduler = _scheduler()
+    scheduler.record("cases", False, hot=True, now=0)
+    assert scheduler.intervals["cases"] == 450  # still backs off, only the wait is capped
+    assert scheduler.next_due["cases"] == 120
+
+
+def test_interval_starts_within_bounds():
+    assert _scheduler().intervals["cases"] == 300
+    assert AdaptiveScheduler(["cases"], 10, min_interval=60, max_interval=1800, jitter=0).intervals["cases"] == 60
+
+
+def test_jitter_stays_within_its_range():
+    scheduler = _scheduler(jitter=0.1)
+    for _ in range(100):
+        scheduler.record("crm", None, now=0)
+        assert 270 <= scheduler.next_due["crm"] <= 330
+
+
+def test_due_and_next_wakeup():
+    scheduler = _scheduler()
+    scheduler.record("cases", None, now=0)
+    scheduler.record("crm", True, now=0)
+    assert scheduler.next_wakeup() == 150
+    assert scheduler.due(now=200) == ["crm"]
+
+
+def test_trigger_makes_endpoints_due_and_wakes_the_waiter():
+    scheduler = _scheduler()
+    woken = []
+    scheduler.on_trigger = lambda: woken.append(True)
+    scheduler.trigger(["crm"])
+    assert scheduler.due() == ["crm"] and woken == [True]
+
+
+def test_trigger_during_a_check_keeps_the_endpoint_due():
+    scheduler = _scheduler()
+    scheduler.trigger(["crm"])
+    triggered = scheduler.triggered["crm"]
+    scheduler.record("crm", False, now=triggered + 5, started=triggered - 1)  # started before the trigger
+    assert scheduler.next_due["crm"] == triggered + 5
+    scheduler.record("crm", False, now=triggered + 10, started=triggered + 6)
+    assert "crm" not in scheduler.triggered and scheduler.next_due["crm"] > triggered + 10
@@ -0,0 +1,46 @@
+from compact_state import CaseRecord, HashedText
+from state_store import StateStore
+
+
+def _case(number, answer="x" * 500):
+    return {"caseNumber": number, "subject": "Postponement", "mainSubject": "Service", "statusDescription": "Open",
+            "lastUpdateDate": "2026-01-02", "answer": answer, "status": 0}
+
+
+def test_snapshot_round_trip(tmp_path):
+    store = StateStore(str(tmp_path / "state.db"))
+    cases = {1: CaseRecord(_case(1)), 2: CaseRecord(_case(2, answer="short"))}
+    store.save("1000001", {"cases": list(cases.items()), "user_data": {"name": "a"}, "crm": False})
+    store.close()
+
+    snapshot = StateStore(str(tmp_path / "state.db")).load("1000001")
+    restored = {key: CaseRecord(value) for key, value in snapshot["cases"]}
+    assert list(restored) == [1, 2]  # int keys survive as [key, value] pairs
+    assert isinstance(restored[1].answer, HashedText) and restored[1] == _case(1)
+    assert restored[2].answer == "short"
+    assert snapshot["user_data"] == {"name": "a"} and snapshot["crm"] is False
+
+
+def test_only_changed_kinds_are_written(tmp_path):
+    store = StateStore(str(tmp_path / "state.db"))
+    snapshot = {"cases": [[1, _case(1)]], "user_data": {"name": "a"}}
+    assert store.save("1000001", snapshot) == 2
+    assert store.save("1000001", snapshot) == 0
+    assert store.save("1000001", {**snapshot, "user_data": {"name": "b"}}) == 1
+    store.close()
+
+
+def test_loaded_state_is_not_written_again(tmp_path):
+    path = str(tmp_path / "state.db")
+    StateStore(path).save("1000001", {"user_data": {"name": "a"}})
+    store = StateStore(path)
+    store.load("1000001")
+    assert store.save("1000001", {"user_data": {"name": "a"}}) == 0
+
+
+def test_accounts_are_kept_apart(tmp_path):
+    store = StateStore(str(tmp_path / "state.db"))
+    store.save("1", {"crm": True})
+    store.save("2", {"crm": False})
+    assert store.load("1") == {"crm": True}
+    assert store.load("3") == {}
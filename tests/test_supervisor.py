@@ -0,0 +1,128 @@
+import json
+import multiprocessing
+import os
+
+import pytest
+
+import supervisor
+from resilience import SharedTokenBucket
+from state_store import StateStore
+from supervisor import HashRing, Supervisor
+
+
+def test_ring_spreads_accounts_and_moves_few_when_a_shard_is_added():
+    ids = [str(1000000 + index) for index in range(2000)]
+    before = HashRing([f"shard-{index}" for index in range(4)])
+    after = HashRing([f"shard-{index}" for index in range(5)])
+    counts = {}
+    for malshab_id in ids:
+        counts[before.node(malshab_id)] = counts.get(before.node(malshab_id), 0) + 1
+    assert len(counts) == 4 and min(counts.values()) > 300
+    moved = sum(before.node(malshab_id) != after.node(malshab_id) for malshab_id in ids)
+    assert moved < len(ids) * 0.35  # about a fifth, not almost all of them
+
+
+class FakeProcess:
+    def __init__(self):
+        self.alive = True
+        self.exitcode = None
+        self.pid = 1
+
+    def is_alive(self):
+        return self.alive
+
+
+@pytest.fixture
+def runner(tmp_path, monkeypatch):
+    path = tmp_path / "accounts.json"
+    runner = Supervisor(accounts_file=str(path), shards=3)
+    runner.path = path
+    runner.started_shards, runner.stopped_shards = [], []
+
+    def start(index, shard, accounts):
+        runner.started_shards.append(shard)
+        runner.workers[shard] = FakeProcess()
+        runner.started[shard] = supervisor.time.time()
+
+    def stop(shard):
+        runner.stopped_shards.append(shard)
+        runner.workers.pop(shard, None)
+
+    monkeypatch.setattr(runner, "_start", start)
+    monkeypatch.setattr(runner, "_stop", stop)
+    return runner
+
+
+def _write_accounts(runner, ids, mtime):
+    runner.path.write_text(json.dumps([{"malshab_id": malshab_id} for malshab_id in ids]))
+    os.utime(runner.path, (mtime, mtime))
+
+
+def test_changed_accounts_only_restart_their_shard(runner):
+    ids = [str(1000000 + index) for index in range(30)]
+    _write_accounts(runner, ids, 1)
+    runner._reload_accounts()
+    runner._check_workers()
+    assert sorted(runner.started_shards) == runner.shards
+
+    runner.started_shards.clear()
+    runner.stopped_shards.clear()
+    _write_accounts(runner, ids + ["2000000"], 2)
+    runner._reload_accounts()
+    runner._check_workers()
+    shard = runner.ring.node("2000000")
+    assert runner.stopped_shards == [shard] and runner.started_shards == [shard]
+
+
+def test_crashed_worker_is_restarted_with_a_growing_delay(runner, monkeypatch):
+    _write_accounts(runner, [str(1000000 + index) for index in range(30)], 1)
+    runner._reload_accounts()
+    runner._check_workers()
+    shard = runner.shards[0]
+    runner.started_shards.clear()
+
+    now = supervisor.time.time()
+    runner.workers[shard].alive = False
+    runner._check_workers()
+    assert runner.crashes[shard][0] == 1 and runner.started_shards == []  # waits 2s first
+    monkeypatch.setattr(supervisor.time, "time", lambda: now + 3)
+    runner._check_workers()
+    assert runner.started_shards == [shard]
+
+
+def _draw(bucket, count, results):
+    results.put(sum(bucket._reserve() == 0 for _ in range(count)))
+
+
+def test_workers_share_one_rate_budget():
+    context = multiprocessing.get_context("spawn")
+    bucket = SharedTokenBucket(rate=0.001, capacity=10, context=context)
+    results = context.Queue()
+    processes = [context.Process(target=_draw, args=(bucket, 8, results)) for _ in range(2)]
+    for process in processes:
+        process.start()
+    granted = results.get(timeout=30) + results.get(timeout=30)
+    for process in processes:
+        process.join(30)
+    assert granted == 10  # not 16: both drew from the same bucket
+
+
+def _save_snapshots(path, account, count):
+    store = StateStore(path)
+    for index in range(count):
+        store.save(account, {"cases": [[index, {"caseNumber": index, "subject": "x" * 1000}]]})
+    store.close()
+
+
+def test_workers_write_the_state_db_at_the_same_time(tmp_path):
+    path = str(tmp_path / "state.db")
+    StateStore(path).close()  # the schema, before the workers race to create it
+    context = multiprocessing.get_context("spawn")
+    processes = [context.Process(target=_save_snapshots, args=(path, str(worker), 200)) for worker in range(4)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join(60)
+    assert [process.exitcode for process in processes] == [0] * 4
+    store = StateStore(path)
+    assert all(store.load(str(worker))["cases"][0][0] == 199 for worker in range(4))